@@ -0,0 +1,6 @@
+"""
+Performance benchmarks for the write, read and hydration hot paths of the sunspear backends.
+
+Run ``python -m benchmarks.run --help`` from the root of the repository, and compare two runs with
+``python -m benchmarks.compare``.
+"""
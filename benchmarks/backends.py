@@ -0,0 +1,65 @@
+"""
+Creates the backends the benchmarks run against. Every backend starts out empty.
+"""
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+
+__all__ = ('BACKENDS', 'create_backend', )
+
+
+class _SQLiteBackendFactory(object):
+    """
+    A ``DatabaseBackend`` on a SQLite database in a temporary directory, removed on ``close``.
+    """
+    def __init__(self, **options):
+        self._tmp_dir = None
+
+    def create(self):
+        from sunspear.backends.database.db import DatabaseBackend
+
+        self._tmp_dir = tempfile.mkdtemp(prefix='sunspear-benchmark-')
+        backend = DatabaseBackend(db_connection_string='sqlite:///' + os.path.join(self._tmp_dir, 'sunspear.db'))
+        backend.create_tables()
+        return backend
+
+    def close(self, backend):
+        backend.engine.dispose()
+        shutil.rmtree(self._tmp_dir)
+
+
+class _FakeRiakBackendFactory(object):
+    """
+    A ``RiakBackend`` talking to an in-process ``FakeRiakServer``. ``riak_latency`` is the time every
+    request to the server takes, in seconds. The backend is used as it is created, without changing the
+    properties of its buckets.
+    """
+    def __init__(self, riak_latency=0, **options):
+        self._riak_latency = riak_latency
+
+    def create(self):
+        from sunspear.backends.riak import RiakBackend
+        from sunspear.testing.fakeriak import FakeRiakClient, FakeRiakServer
+
+        return RiakBackend(client=FakeRiakClient(server=FakeRiakServer(latency=self._riak_latency)))
+
+    def close(self, backend):
+        backend._riak_backend.server.clear()
+
+
+BACKENDS = {
+    'sqlite': _SQLiteBackendFactory,
+    'fakeriak': _FakeRiakBackendFactory,
+}
+
+
+def create_backend(name, **options):
+    """
+    :param options: options for the backend, e.g. ``riak_latency``. Backends ignore options they do not use.
+
+    :return: a tuple of a new, empty backend and the factory that has to ``close`` it
+    """
+    factory = BACKENDS[name](**options)
+    return factory.create(), factory
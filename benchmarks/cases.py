@@ -0,0 +1,172 @@
+"""
+The benchmarked operations. Every case seeds what it needs in ``setup``, which is not timed, and
+then performs one operation per call to ``run``.
+"""
+from __future__ import absolute_import
+
+import threading
+
+from sunspear.aggregators.property import PropertyAggregator
+
+__all__ = ('CASES', )
+
+
+class BenchmarkCase(object):
+    name = None
+
+    def __init__(self, page_size=20, writers=8):
+        self.page_size = page_size
+        self.writers = writers
+
+    def setup(self, client, generator, iterations):
+        """
+        Seeds ``client`` for ``iterations`` calls to ``run``.
+        """
+        raise NotImplementedError()
+
+    def run(self, i):
+        """
+        Performs the ``i``-th operation.
+        """
+        raise NotImplementedError()
+
+    # the ids are taken from the generated dicts, as not every backend returns what it created the same way
+    def _create_objs(self, count, object_type='user'):
+        objs = self.generator.objs(count, object_type=object_type)
+        for obj in objs:
+            self.client.create_object(obj)
+        return [obj['id'] for obj in objs]
+
+    def _create_activity(self, audience=None):
+        activity = self.generator.activity(self._create_objs(1)[0], audience=audience)
+        self.client.create_activity(activity)
+        return activity['id']
+
+
+class CreateActivity(BenchmarkCase):
+    """
+    ``create_activity`` with embedded objects, targeted to ``audience_size`` existing objects.
+    """
+    name = 'create_activity'
+
+    def setup(self, client, generator, iterations):
+        self.client, self.generator = client, generator
+        actors = self._create_objs(10)
+        audience = self._create_objs(generator.audience_size)
+        self.activities = [generator.activity(actors[i % len(actors)], audience=audience) for i in range(iterations)]
+
+    def run(self, i):
+        self.client.create_activity(self.activities[i])
+
+
+class CreateReply(BenchmarkCase):
+    """
+    ``create_reply`` on an activity that keeps collecting replies.
+    """
+    name = 'create_reply'
+
+    def setup(self, client, generator, iterations):
+        self.client, self.generator = client, generator
+        self.actors = self._create_objs(10)
+        self.activity_id = self._create_activity()
+
+    def run(self, i):
+        self.client.create_reply(self.activity_id, self.actors[i % len(self.actors)], 'Lorem ipsum dolor sit amet')
+
+
+class CreateLike(BenchmarkCase):
+    """
+    ``create_like`` on an activity, by a different actor every time.
+    """
+    name = 'create_like'
+
+    def setup(self, client, generator, iterations):
+        self.client, self.generator = client, generator
+        self.actors = self._create_objs(iterations)
+        self.activity_id = self._create_activity()
+
+    def run(self, i):
+        self.client.create_like(self.activity_id, self.actors[i])
+
+
+class CreateLikeConcurrently(BenchmarkCase):
+    """
+    ``create_like`` on one activity by ``writers`` threads at once, every one of them liking it as a different
+    actor. Every operation is one round of all of the writers, so the throughput in likes is ``writers``
+    times the ``ops_per_sec``.
+    """
+    name = 'create_like_concurrent'
+
+    def setup(self, client, generator, iterations):
+        self.client, self.generator = client, generator
+        self.actors = self._create_objs(iterations * self.writers)
+        self.activity_id = self._create_activity()
+
+    def run(self, i):
+        threads = [threading.Thread(target=self.client.create_like, args=(self.activity_id, actor,))
+                   for actor in self.actors[i * self.writers:(i + 1) * self.writers]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+class _ReadCase(BenchmarkCase):
+    """
+    Seeds ``page_size`` activities, each with ``replies_per_activity`` replies and ``likes_per_activity``
+    likes. If ``targeted`` is set, the activities are targeted to ``audience_size`` objects, otherwise
+    they are public.
+    """
+    targeted = False
+
+    def setup(self, client, generator, iterations):
+        self.client, self.generator = client, generator
+        self.audience = self._create_objs(generator.audience_size) if self.targeted else []
+        actors = self._create_objs(max(generator.likes_per_activity, 1))
+
+        self.activity_ids = []
+        for _ in range(self.page_size):
+            activity_id = self._create_activity(audience=self.audience)
+            for j in range(generator.replies_per_activity):
+                client.create_reply(activity_id, actors[j % len(actors)], 'Lorem ipsum dolor sit amet')
+            for j in range(generator.likes_per_activity):
+                client.create_like(activity_id, actors[j])
+            self.activity_ids.append(activity_id)
+
+
+class GetActivities(_ReadCase):
+    """
+    ``get_activities`` for a page of activities, hydrating their objects, replies and likes.
+    """
+    name = 'get_activities'
+
+    def run(self, i):
+        self.client.get_activities(self.activity_ids)
+
+
+class GetActivitiesWithAudienceTargeting(_ReadCase):
+    """
+    ``get_activities`` for a page of targeted activities, filtered down to those targeted to one object.
+    """
+    name = 'get_activities_audience_targeting'
+    targeted = True
+
+    def run(self, i):
+        audience_targeting = {'to': [self.audience[0]]} if self.audience else {}
+        self.client.get_activities(self.activity_ids, audience_targeting=audience_targeting, include_public=True)
+
+
+class GetActivitiesWithAggregation(_ReadCase):
+    """
+    ``get_activities`` for a page of activities, grouped by verb and actor.
+    """
+    name = 'get_activities_aggregation'
+
+    def run(self, i):
+        self.client.get_activities(self.activity_ids, aggregation_pipeline=[PropertyAggregator(properties=['verb', 'actor'])])
+
+
+CASES = dict((case.name, case,) for case in (
+    CreateActivity, CreateReply, CreateLike, CreateLikeConcurrently, GetActivities, GetActivitiesWithAudienceTargeting,
+    GetActivitiesWithAggregation,
+))
@@ -0,0 +1,90 @@
+"""
+Compares two result files written by ``benchmarks.run`` and exits with status 1 if anything got slower::
+
+    python -m benchmarks.compare baseline.json current.json --threshold 0.1
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import sys
+
+__all__ = ('REGRESSION', 'IMPROVEMENT', 'UNCHANGED', 'ADDED', 'REMOVED', 'compare', 'main', )
+
+REGRESSION = 'regression'
+IMPROVEMENT = 'improvement'
+UNCHANGED = 'unchanged'
+ADDED = 'added'
+REMOVED = 'removed'
+
+
+def compare(baseline, current, threshold=0.1, metric='median'):
+    """
+    :type baseline: dict
+    :param baseline: the results of ``benchmarks.run`` to compare against
+    :type current: dict
+    :param current: the results of ``benchmarks.run`` to compare
+    :type threshold: float
+    :param threshold: the relative change in ``metric`` above which a benchmark counts as changed
+    :type metric: string
+    :param metric: the statistic compared, e.g. ``median`` or ``p95``
+
+    :return: a list of ``(name, baseline value, current value, relative change, status)`` tuples,
+        sorted by name. Values are ``None`` for benchmarks only in one of the runs.
+    """
+    baseline_results = baseline['results']
+    current_results = current['results']
+
+    rows = []
+    for name in sorted(set(baseline_results) | set(current_results)):
+        if name not in current_results:
+            rows.append((name, baseline_results[name][metric], None, None, REMOVED,))
+            continue
+        if name not in baseline_results:
+            rows.append((name, None, current_results[name][metric], None, ADDED,))
+            continue
+
+        before = baseline_results[name][metric]
+        after = current_results[name][metric]
+        change = (after - before) / before if before else 0.0
+        if change > threshold:
+            status = REGRESSION
+        elif change < -threshold:
+            status = IMPROVEMENT
+        else:
+            status = UNCHANGED
+        rows.append((name, before, after, change, status,))
+    return rows
+
+
+def _format_time(value):
+    return '-' if value is None else '{:.3f}ms'.format(value * 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.compare', description='Compare two benchmark runs.')
+    parser.add_argument('baseline', help='the results to compare against')
+    parser.add_argument('current', help='the results to compare')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='the relative slowdown that counts as a regression. Defaults to 0.1 (10%%).')
+    parser.add_argument('--metric', default='median', choices=['min', 'mean', 'median', 'p95'])
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    with open(args.current) as fp:
+        current = json.load(fp)
+
+    rows = compare(baseline, current, threshold=args.threshold, metric=args.metric)
+    print('{:<50} {:>12} {:>12} {:>9}  {}'.format('benchmark', 'baseline', 'current', 'change', 'status'))
+    for name, before, after, change, status in rows:
+        print('{:<50} {:>12} {:>12} {:>9}  {}'.format(
+            name, _format_time(before), _format_time(after), '-' if change is None else '{:+.1%}'.format(change),
+            status))
+
+    return 1 if any(row[4] == REGRESSION for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Generates activity stream data with a configurable fan-out.
+"""
+from __future__ import absolute_import
+
+import datetime
+import random
+
+__all__ = ('DataGenerator', )
+
+
+class DataGenerator(object):
+    """
+    Builds objects and activities for the benchmarks. The same ``seed`` always produces the same data.
+
+    :type audience_size: int
+    :param audience_size: the number of objects every activity is targeted to, split between ``to`` and ``cc``
+    :type replies_per_activity: int
+    :param replies_per_activity: the number of replies seeded on every activity that is read
+    :type likes_per_activity: int
+    :param likes_per_activity: the number of likes seeded on every activity that is read. Every like is made
+        by a different actor.
+    :type nesting_depth: int
+    :param nesting_depth: how deeply the extra data attached to every object and activity is nested
+    :type seed: int
+    :param seed: the seed of the random number generator
+    """
+    def __init__(self, audience_size=10, replies_per_activity=5, likes_per_activity=5, nesting_depth=2, seed=0):
+        self.audience_size = audience_size
+        self.replies_per_activity = replies_per_activity
+        self.likes_per_activity = likes_per_activity
+        self.nesting_depth = nesting_depth
+
+        self._random = random.Random(seed)
+        self._counter = 0
+        self._published = datetime.datetime(2016, 1, 1)
+
+    def params(self):
+        """
+        :return: a dict of the fan-out parameters, for the benchmark results
+        """
+        return {
+            'audience_size': self.audience_size,
+            'replies_per_activity': self.replies_per_activity,
+            'likes_per_activity': self.likes_per_activity,
+            'nesting_depth': self.nesting_depth,
+        }
+
+    def new_id(self, prefix):
+        self._counter += 1
+        return '{}{:x}{:08x}'.format(prefix, self._counter, self._random.getrandbits(32))
+
+    def published(self):
+        self._published += datetime.timedelta(seconds=1)
+        return self._published.strftime('%Y-%m-%dT%H:%M:%S') + 'Z'
+
+    def nested_data(self, depth=None):
+        """
+        :return: a dict nested ``depth`` levels deep, with a few scalar values on every level
+        """
+        depth = self.nesting_depth if depth is None else depth
+        data = {'score': self._random.randint(0, 1000), 'label': self.new_id('label')}
+        if depth > 0:
+            data['nested'] = self.nested_data(depth - 1)
+        return data
+
+    def obj(self, object_type='user'):
+        return {
+            'id': self.new_id('o'),
+            'objectType': object_type,
+            'displayName': self.new_id('name'),
+            'content': 'Lorem ipsum dolor sit amet ' * 4,
+            'published': self.published(),
+            'extra': self.nested_data(),
+        }
+
+    def objs(self, count, object_type='user'):
+        return [self.obj(object_type=object_type) for _ in range(count)]
+
+    def activity(self, actor, audience=None, verb='post'):
+        """
+        Builds an activity with embedded objects. ``audience`` is a list of object ids the activity is
+        targeted to; the first half goes to ``to`` and the rest to ``cc``.
+        """
+        activity = {
+            'id': self.new_id('a'),
+            'verb': verb,
+            'actor': actor,
+            'object': self.obj(object_type='note'),
+            'target': self.obj(object_type='group'),
+            'content': 'Lorem ipsum dolor sit amet',
+            'published': self.published(),
+            'extra': self.nested_data(),
+        }
+        if audience:
+            middle = (len(audience) + 1) // 2
+            activity['to'] = list(audience[:middle])
+            if audience[middle:]:
+                activity['cc'] = list(audience[middle:])
+        return activity
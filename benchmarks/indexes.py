@@ -0,0 +1,208 @@
+"""
+Measures the effect of the indexes declared in ``sunspear.backends.database.schema`` on the hot lookups
+of ``DatabaseBackend``::
+
+    python -m benchmarks.indexes --activities 10000000 --db-connection-string mysql://root:@localhost/bench
+
+Builds a fixture of ``--activities`` activities without the secondary indexes, times the lookups, adds the
+indexes with ``DatabaseBackend.create_indexes`` and times the lookups again. The database must be a
+dedicated, empty one: its sunspear tables are dropped when the benchmark ends. Without
+``--db-connection-string`` a temporary SQLite database is used.
+
+Every tenth object is a user; each activity is made by a random user, about a random note, and targeted
+to a random user. Every fifth activity has two replies and two likes.
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+from sunspear.backends.database import schema
+from sunspear.backends.database.db import DatabaseBackend
+
+from .run import summarize
+
+__all__ = ('build_fixture', 'time_lookups', 'main', )
+
+_CHUNK_SIZE = 5000
+
+
+def _user_id(i):
+    return 'u{:031d}'.format(i)
+
+
+def _note_id(i):
+    return 'n{:031d}'.format(i)
+
+
+def _activity_id(i):
+    return 'a{:031d}'.format(i)
+
+
+def build_fixture(backend, activities, seed=0, progress=None):
+    """
+    Fills the tables of ``backend`` with ``activities`` activities and everything they reference.
+
+    :type progress: callable
+    :param progress: called with a message after every table
+    """
+    rand = random.Random(seed)
+    users = max(activities // 10, 3)
+    start = datetime.datetime(2016, 1, 1)
+
+    def published(i):
+        return start + datetime.timedelta(seconds=i)
+
+    def insert(table, rows):
+        chunk = []
+        with backend.engine.begin() as connection:
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= _CHUNK_SIZE:
+                    connection.execute(table.insert(), chunk)
+                    chunk = []
+            if chunk:
+                connection.execute(table.insert(), chunk)
+        if progress is not None:
+            progress('filled {}'.format(table.name))
+
+    insert(schema.objects_table, (
+        {'id': _user_id(i), 'object_type': 'user', 'published': published(i), 'updated': published(i)} for i in range(users)))
+    insert(schema.objects_table, (
+        {'id': _note_id(i), 'object_type': 'note', 'published': published(i), 'updated': published(i)} for i in range(activities)))
+    insert(schema.activities_table, (
+        {'id': _activity_id(i), 'verb': 'post', 'actor': _user_id(rand.randrange(users)), 'object': _note_id(i),
+         'published': published(i), 'updated': published(i)} for i in range(activities)))
+    insert(schema.to_table, (
+        {'activity': _activity_id(i), 'object': _user_id(rand.randrange(users))} for i in range(activities)))
+
+    for sub_activity_table in (schema.replies_table, schema.likes_table):
+        insert(sub_activity_table, (
+            {'id': '{}{:030d}{}'.format(sub_activity_table.name[0], i, j), 'in_reply_to': _activity_id(i),
+             'actor': _user_id((i + j) % users), 'published': published(i + j + 1)}
+            for i in range(0, activities, 5) for j in range(2)))
+
+    return users
+
+
+def time_lookups(backend, activities, users, repeat=20, page_size=20, seed=0):
+    """
+    Times the lookups the indexes are meant for, ``repeat`` times each.
+
+    :return: a dict of lookup names to the statistics of their timings, see ``benchmarks.run.summarize``
+    """
+    rand = random.Random(seed)
+    pages = [[_activity_id(rand.randrange(activities)) for _ in range(page_size)] for _ in range(repeat)]
+    audiences = [_user_id(rand.randrange(users)) for _ in range(repeat)]
+    since = datetime.datetime(2016, 1, 1) + datetime.timedelta(seconds=max(activities - page_size, 0))
+
+    lookups = {
+        'get_activity_audience_targeting': lambda i: backend.get_activity(
+            pages[i], audience_targeting={'to': [audiences[i]]}, include_public=True),
+        'hydrate_sub_activity': lambda i: backend._hydrate_sub_activity([{'id': activity_id} for activity_id in pages[i]]),
+        'iter_activities_since': lambda i: next(iter(backend.iter_activities(batch_size=page_size, since=since)), None),
+        # cascades to the activities, replies, likes and audience targeting of the user
+        'delete_user': lambda i: backend.obj_delete(_user_id(users - 1 - i)),
+    }
+
+    results = {}
+    for name, lookup in sorted(lookups.items()):
+        timings = []
+        for i in range(repeat):
+            start = default_timer()
+            lookup(i)
+            timings.append(default_timer() - start)
+        results[name] = summarize(timings)
+    return results
+
+
+def _log(message):
+    print(message, file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.indexes', description='Benchmark DatabaseBackend with and without its indexes.')
+    parser.add_argument('--activities', type=int, default=10000000)
+    parser.add_argument('--repeat', type=int, default=20, help='the number of times every lookup is timed')
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--db-connection-string', help='a dedicated, empty database. Defaults to a temporary SQLite one.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='the file the JSON results are written to. Defaults to stdout.')
+    args = parser.parse_args(argv)
+
+    if args.repeat * 2 > args.activities // 10:
+        parser.error('--activities must be at least 20 times --repeat, as every repeat deletes two users')
+
+    tmp_dir = None
+    db_connection_string = args.db_connection_string
+    if not db_connection_string:
+        tmp_dir = tempfile.mkdtemp(prefix='sunspear-benchmark-')
+        db_connection_string = 'sqlite:///' + os.path.join(tmp_dir, 'sunspear.db')
+
+    backend = DatabaseBackend(db_connection_string=db_connection_string)
+    try:
+        backend.create_tables()
+        for table in schema.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(backend.engine)
+
+        users = build_fixture(backend, args.activities, seed=args.seed, progress=_log)
+
+        results = {}
+        for name, result in time_lookups(backend, args.activities, users, repeat=args.repeat,
+                                         page_size=args.page_size, seed=args.seed).items():
+            results['without_indexes.' + name] = result
+
+        start = default_timer()
+        backend.create_indexes()
+        create_indexes_seconds = default_timer() - start
+        _log('created indexes in {:.1f}s'.format(create_indexes_seconds))
+
+        # different users are deleted than in the first round
+        for name, result in time_lookups(backend, args.activities, users - args.repeat,
+                                         repeat=args.repeat, page_size=args.page_size, seed=args.seed + 1).items():
+            results['with_indexes.' + name] = result
+    finally:
+        backend.drop_tables()
+        backend.engine.dispose()
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+    for name in sorted(name for name in results if name.startswith('without_indexes.')):
+        lookup = name.split('.', 1)[1]
+        before = results[name]['median']
+        after = results['with_indexes.' + lookup]['median']
+        _log('{:<35} {:>12.3f}ms {:>12.3f}ms {:>8.1f}x'.format(
+            lookup, before * 1000, after * 1000, before / after if after else float('inf')))
+
+    output = {
+        'meta': {
+            'created_at': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'dialect': backend.engine.dialect.name,
+            'params': {'activities': args.activities, 'repeat': args.repeat, 'page_size': args.page_size,
+                       'seed': args.seed},
+            'create_indexes_seconds': create_indexes_seconds,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(output, fp, indent=2, sort_keys=True)
+    else:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Runs the benchmarks and writes the results as JSON::
+
+    python -m benchmarks.run --backend sqlite --case get_activities --iterations 100 -o results.json
+
+Every case runs on a new, empty backend. Times are in seconds.
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import datetime
+import json
+import math
+import platform
+import sys
+from timeit import default_timer
+
+from sunspear.clients import SunspearClient
+
+from .backends import BACKENDS, create_backend
+from .cases import CASES
+from .generators import DataGenerator
+
+__all__ = ('run_case', 'run', 'summarize', 'main', )
+
+
+def summarize(timings):
+    """
+    :type timings: list
+    :param timings: the duration of every iteration, in seconds
+
+    :return: a dict of statistics over ``timings``
+    """
+    timings = sorted(timings)
+    count = len(timings)
+    mean = sum(timings) / count
+    middle = count // 2
+    median = timings[middle] if count % 2 else (timings[middle - 1] + timings[middle]) / 2
+    variance = sum((timing - mean) ** 2 for timing in timings) / (count - 1) if count > 1 else 0.0
+    return {
+        'iterations': count,
+        'min': timings[0],
+        'max': timings[-1],
+        'mean': mean,
+        'median': median,
+        'p95': timings[min(count - 1, int(math.ceil(count * 0.95)) - 1)],
+        'stdev': math.sqrt(variance),
+        'ops_per_sec': 1 / median if median > 0 else None,
+    }
+
+
+def run_case(backend_name, case_name, generator, iterations=50, warmup=5, page_size=20, writers=8,
+             backend_options=None):
+    """
+    Runs one case against a new backend.
+
+    :type writers: int
+    :param writers: the number of threads writing at once, for the concurrent cases
+
+    :type backend_options: dict
+    :param backend_options: passed on to ``create_backend``
+
+    :return: the statistics of the timed iterations, see ``summarize``
+    """
+    backend, factory = create_backend(backend_name, **(backend_options or {}))
+    try:
+        case = CASES[case_name](page_size=page_size, writers=writers)
+        case.setup(SunspearClient(backend), generator, warmup + iterations)
+
+        for i in range(warmup):
+            case.run(i)
+
+        timings = []
+        for i in range(warmup, warmup + iterations):
+            start = default_timer()
+            case.run(i)
+            timings.append(default_timer() - start)
+    finally:
+        factory.close(backend)
+
+    return summarize(timings)
+
+
+def run(backends, cases, iterations=50, warmup=5, page_size=20, writers=8, seed=0, callback=None,
+        backend_options=None, **generator_params):
+    """
+    Runs every case against every backend.
+
+    :type callback: callable
+    :param callback: called with the name and statistics of every case once it has run
+    :type backend_options: dict
+    :param backend_options: passed on to ``create_backend``
+
+    :return: a dict with the ``meta`` data of the run and the ``results`` keyed by ``<backend>.<case>``
+    """
+    generator = DataGenerator(seed=seed, **generator_params)
+    params = generator.params()
+    params.update({
+        'iterations': iterations, 'warmup': warmup, 'page_size': page_size, 'writers': writers, 'seed': seed,
+    })
+    params.update(backend_options or {})
+
+    results = {}
+    for backend_name in backends:
+        for case_name in cases:
+            name = '{}.{}'.format(backend_name, case_name)
+            results[name] = run_case(
+                backend_name, case_name, generator, iterations=iterations, warmup=warmup, page_size=page_size,
+                writers=writers, backend_options=backend_options)
+            if callback is not None:
+                callback(name, results[name])
+
+    return {
+        'meta': {
+            'created_at': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': params,
+        },
+        'results': results,
+    }
+
+
+def _print_result(name, result):
+    print('{:<50} median {:>10.3f}ms  p95 {:>10.3f}ms  {:>10.1f} ops/s'.format(
+        name, result['median'] * 1000, result['p95'] * 1000, result['ops_per_sec'] or 0), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run', description='Benchmark the sunspear backends.')
+    parser.add_argument('--backend', action='append', choices=sorted(BACKENDS),
+                        help='a backend to benchmark. Can be given more than once. Defaults to all.')
+    parser.add_argument('--case', action='append', choices=sorted(CASES),
+                        help='a case to run. Can be given more than once. Defaults to all.')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--page-size', type=int, default=20, help='the number of activities read at once')
+    parser.add_argument('--writers', type=int, default=8,
+                        help='the number of threads writing at once, for the concurrent cases')
+    parser.add_argument('--audience-size', type=int, default=10)
+    parser.add_argument('--replies-per-activity', type=int, default=5)
+    parser.add_argument('--likes-per-activity', type=int, default=5)
+    parser.add_argument('--nesting-depth', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--riak-latency', type=float, default=0,
+                        help='the time every request to the fake riak server takes, in seconds')
+    parser.add_argument('-o', '--output', help='the file the JSON results are written to. Defaults to stdout.')
+    args = parser.parse_args(argv)
+
+    if args.iterations < 1:
+        parser.error('--iterations must be at least 1')
+
+    results = run(
+        args.backend or sorted(BACKENDS), args.case or sorted(CASES), iterations=args.iterations,
+        warmup=args.warmup, page_size=args.page_size, writers=args.writers, seed=args.seed, callback=_print_result,
+        backend_options={'riak_latency': args.riak_latency},
+        audience_size=args.audience_size, replies_per_activity=args.replies_per_activity,
+        likes_per_activity=args.likes_per_activity, nesting_depth=args.nesting_depth)
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -17,7 +17,7 @@ setup(
     author="Numan Sachwani",
     author_email="numan856@gmail.com",
     url="https://github.com/numan/sunspear",
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
     test_suite='nose.collector',
     install_requires=[
         'riak==2.5.4',
@@ -31,6 +31,11 @@ setup(
     tests_require=tests_require,
     extras_require={"test": tests_require, "nosetests": tests_require},
     include_package_data=True,
+    entry_points={
+        'console_scripts': [
+            'sunspear-import = sunspear.importer:main',
+        ],
+    },
     classifiers=[
         "Intended Audience :: Developers",
         'Intended Audience :: System Administrators',
@@ -0,0 +1,197 @@
+"""
+A cache of hydrated activities, with their objects, replies and likes.
+
+Reading an activity from the backend is cheap next to hydrating it, which reads its objects, its replies and
+likes, and the activities it embeds. With an ``ActivityCache`` set on a backend, ``get_activity`` still reads the
+activities, so audience targeting, filters and deletes apply as before, but only hydrates the activities that
+are not cached::
+
+    from sunspear.activitycache import ActivityCache
+
+    backend.set_activity_cache(ActivityCache(max_size=10000))
+
+Every cached activity is indexed by the ids of the objects and activities it embeds. The backend invalidates
+an id when it writes it, which drops the activities that embed it: updating an activity, creating or deleting
+one of its replies or likes, or updating an object it embeds. Invalidations are numbered, so an activity
+hydrated while one of its ids was invalidated is not cached. Activities changed by other processes are used
+for at most ``max_age`` seconds.
+"""
+from __future__ import absolute_import, division
+
+import threading
+import time
+from collections import OrderedDict
+
+__all__ = ('ActivityCache', )
+
+
+class ActivityCache(object):
+    """
+    :type max_size: int
+    :param max_size: the number of activities kept; the least recently used are dropped first
+    :type max_age: float
+    :param max_age: the number of seconds an activity is used for, or ``None`` to use it until it is dropped
+    :type max_invalidations: int
+    :param max_invalidations: the number of invalidated ids remembered to check the activities being hydrated
+        against. Activities whose hydration started before the oldest of them are not cached.
+    """
+    def __init__(self, max_size=10000, max_age=60, max_invalidations=10000, clock=time.time):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_invalidations = max_invalidations
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._clock = clock
+        self._lock = threading.Lock()
+        # activity id -> (activity, references, time cached)
+        self._activities = OrderedDict()
+        # object or activity id -> ids of the cached activities embedding it
+        self._referenced_by = {}
+        # id -> the number of the last invalidation of the id
+        self._invalidations = OrderedDict()
+        self._generation = 0
+        self._forgotten_generation = 0
+
+    @property
+    def generation(self):
+        """
+        The number of the last invalidation. Read it before reading the activities to cache, and pass it to ``put``.
+        """
+        return self._generation
+
+    def get(self, activity_id):
+        """
+        :return: a copy of the activity ``activity_id``, or ``None`` if it is not cached
+        """
+        with self._lock:
+            cached = self._activities.get(activity_id)
+            if cached is not None and self.max_age is not None and self._clock() - cached[2] >= self.max_age:
+                self._drop(activity_id)
+                cached = None
+
+            if cached is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            del self._activities[activity_id]
+            self._activities[activity_id] = cached
+        return _copy(cached[0])
+
+    def put(self, activity, generation, references=()):
+        """
+        Caches a copy of the hydrated ``activity``, unless it or one of the ids it embeds was invalidated
+        after ``generation``.
+
+        :type generation: int
+        :param generation: the ``generation`` read before ``activity`` was read from the backend
+        :type references: iterable
+        :param references: ids ``activity`` depends on besides the ones it embeds, e.g. the ids of
+            objects that did not exist when it was hydrated
+
+        :return: ``True`` if ``activity`` was cached
+        """
+        activity_id = activity['id']
+        references = set(references)
+        _collect_ids(activity, references)
+        references.discard(activity_id)
+        activity = _copy(activity)
+
+        with self._lock:
+            if generation < self._forgotten_generation:
+                return False
+            for reference in references | set([activity_id]):
+                if self._invalidations.get(reference, 0) > generation:
+                    return False
+
+            self._drop(activity_id)
+            self._activities[activity_id] = (activity, references, self._clock(),)
+            for reference in references:
+                self._referenced_by.setdefault(reference, set()).add(activity_id)
+
+            while len(self._activities) > self.max_size:
+                self._drop(next(iter(self._activities)))
+                self.evictions += 1
+        return True
+
+    def invalidate(self, ids):
+        """
+        Drops the activities ``ids`` and the activities embedding an object or activity of ``ids``.
+
+        :type ids: iterable
+        :param ids: object or activity ids
+        """
+        with self._lock:
+            self._generation += 1
+            for invalidated_id in ids:
+                self._invalidations.pop(invalidated_id, None)
+                self._invalidations[invalidated_id] = self._generation
+
+                self._drop(invalidated_id)
+                for activity_id in list(self._referenced_by.get(invalidated_id, ())):
+                    self._drop(activity_id)
+
+            while len(self._invalidations) > self.max_invalidations:
+                self._forgotten_generation = self._invalidations.popitem(last=False)[1]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._forgotten_generation = self._generation
+            self._activities.clear()
+            self._referenced_by.clear()
+            self._invalidations.clear()
+
+    def stats(self):
+        """
+        :return: a dict of the number of activities cached, the ``hits``, ``misses`` and ``evictions`` so far,
+            and the ``hit_rate``
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._activities),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def _drop(self, activity_id):
+        cached = self._activities.pop(activity_id, None)
+        if cached is None:
+            return
+        for reference in cached[1]:
+            referenced_by = self._referenced_by.get(reference)
+            if referenced_by is not None:
+                referenced_by.discard(activity_id)
+                if not referenced_by:
+                    del self._referenced_by[reference]
+
+
+def _collect_ids(value, ids):
+    """
+    Adds the ids of the objects and activities embedded in ``value`` to ``ids``.
+    """
+    if isinstance(value, dict):
+        if 'id' in value and not isinstance(value['id'], (dict, list)):
+            ids.add(value['id'])
+        for item in value.values():
+            if isinstance(item, (dict, list)):
+                _collect_ids(item, ids)
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, (dict, list)):
+                _collect_ids(item, ids)
+
+
+def _copy(value):
+    """
+    Copies the dicts and lists of ``value``; the other values of hydrated activities, like strings and
+    datetimes, are immutable. Several times faster than ``copy.deepcopy``.
+    """
+    if isinstance(value, dict):
+        return dict((key, _copy(item) if isinstance(item, (dict, list)) else item) for key, item in value.items())
+    return [_copy(item) if isinstance(item, (dict, list)) else item for item in value]
@@ -14,3 +14,35 @@ class BaseAggregator(object):
         :return: A list of of activities
         """
         return current_activities
+
+    def process_stream(self, activities, aggregators, *args, **kwargs):
+        """
+        Lazily processes an iterable of activities, performing any mutations necessary.
+
+        The default implementation materializes the stream and hands it to ``process``, passing the
+        activities at this stage of the pipeline as ``original_activities``. Aggregators that can work
+        over a bounded window should override this to keep memory constant.
+        :type activities: iterable
+        :param activities: An iterable of activities, as they stand at the current stage of the aggregation pipeline
+        :type aggregators: list
+        :param aggregators: A list of aggregators in the current pipeline. The aggregators will be executed (or have been executed) in the order they appear in the list
+        :return: An iterator of activities
+        """
+        activities = list(activities)
+        return iter(self.process(activities, activities, aggregators, *args, **kwargs))
+
+
+def process_stream(activities, aggregators):
+    """
+    Chains ``aggregators`` lazily over an iterable of activities.
+
+    :type activities: iterable
+    :param activities: the activities to run through the pipeline
+    :type aggregators: list
+    :param aggregators: a list of ``BaseAggregator``
+    :return: An iterator of activities
+    """
+    activities = iter(activities)
+    for aggregator in aggregators:
+        activities = aggregator.process_stream(activities, aggregators)
+    return activities
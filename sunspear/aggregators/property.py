@@ -1,17 +1,18 @@
 from sunspear.aggregators.base import BaseAggregator
-from sunspear.lib.dotdict import dotdictify
+from sunspear.lib.dotpath import compile_path, get_path
 
-from itertools import groupby
+from itertools import groupby, islice
 
 import copy
 import re
 
 
 class PropertyAggregator(BaseAggregator):
-    def __init__(self, properties=[], activity_key=None, activity_value=None, *args, **kwargs):
+    def __init__(self, properties=[], activity_key=None, activity_value=None, window_size=None, *args, **kwargs):
         self._properties = properties
         self._activity_key = activity_key if activity_key is not None else ""
         self._activity_value = activity_value if activity_value is not None else ""
+        self._window_size = window_size
 
     def process(self, current_activities, original_activities, aggregators, *args, **kwargs):
         """
@@ -31,26 +32,46 @@ class PropertyAggregator(BaseAggregator):
             activities = self._aggregate_activities(group_by_attributes=self._properties,  grouped_activities=_raw_group_actvities)
         return activities
 
-    def _listify_attributes(self, group_by_attributes=[], activity={}):
-        if not isinstance(activity, dotdictify):
-            activity = dotdictify(activity)
+    def process_stream(self, activities, aggregators, *args, **kwargs):
+        """
+        Lazily processes an iterable of activities. Only consecutive activities are grouped, so at most
+        one group is held in memory at a time. If ``window_size`` was given, a group is rolled up and
+        emitted every ``window_size`` activities, bounding memory for arbitrarily long runs.
+        :type activities: iterable
+        :param activities: An iterable of activities, as they stand at the current stage of the aggregation pipeline
+        :type aggregators: list
+        :param aggregators: A list of aggregators in the current pipeline. The aggregators will be executed (or have been executed) in the order they appear in the list
+        :return: An iterator of activities
+        """
+        if not self._properties:
+            return iter(activities)
 
+        _raw_group_actvities = groupby(activities, self._group_by_aggregator(group_by_attributes=self._properties))
+        return self._iter_aggregated_activities(group_by_attributes=self._properties, grouped_activities=_raw_group_actvities)
+
+    def _listify_attributes(self, group_by_attributes=[], activity={}):
         listified_dict = copy.copy(activity)
 
         nested_root_attributes = []
+        copied_nested_dicts = set()
         #special handeling if we are grouping by a nested attribute
         #In this case, we listify all the other keys
         for attr in group_by_attributes:
             if '.' in attr:
-                nested_val = activity.get(attr)
+                nested_val = get_path(activity, attr)
                 if nested_val is not None:
                     nested_dict, deepest_attr = attr.rsplit('.', 1)
                     nested_root, rest = attr.split('.', 1)
                     #store a list of nested roots. We'll have to be careful not to listify these
                     nested_root_attributes.append(nested_root)
-                    for nested_dict_key, nested_dict_value in activity.get(nested_dict).items():
+                    if nested_dict not in copied_nested_dicts:
+                        #copy the dicts along the path so we never mutate the original activity
+                        self._copy_nested_dicts(listified_dict, nested_dict)
+                        copied_nested_dicts.add(nested_dict)
+                    for nested_dict_key, nested_dict_value in get_path(activity, nested_dict).items():
                         if nested_dict_key != deepest_attr:
-                            listified_dict['.'.join([nested_dict, nested_dict_key])] = [nested_dict_value]
+                            setter = compile_path('.'.join([nested_dict, nested_dict_key]))[1]
+                            setter(listified_dict, [nested_dict_value])
 
         #now we listify all other non nested attributes
         for key, val in activity.items():
@@ -59,18 +80,23 @@ class PropertyAggregator(BaseAggregator):
 
         return nested_root_attributes, listified_dict
 
+    def _copy_nested_dicts(self, activity, path):
+        target = activity
+        for key in path.split('.'):
+            target[key] = copy.copy(target[key])
+            target = target[key]
+
     def _group_by_aggregator(self, group_by_attributes=[]):
         def _callback(activity):
-            activity_dict = dotdictify(activity)
             matching_attributes = []
 
             if self._activity_key and self._activity_value:
-                if re.match(str(self._activity_value), str(activity_dict.get(self._activity_key))) is None:
+                if re.match(str(self._activity_value), str(get_path(activity, self._activity_key))) is None:
                     return [activity]
 
             for attribute in group_by_attributes:
-                value = activity_dict.get(attribute)
-                if activity_dict.get(attribute) is not None:
+                value = get_path(activity, attribute)
+                if value is not None:
                     matching_attributes.append(value)
             return matching_attributes
         return _callback
@@ -79,40 +105,46 @@ class PropertyAggregator(BaseAggregator):
         """
         Rolls up activities by group_by_attributes, collapsing all grouped activities into one activity object
         """
-        grouped_activities_list = []
+        return list(self._iter_aggregated_activities(group_by_attributes=group_by_attributes, grouped_activities=grouped_activities))
+
+    def _iter_aggregated_activities(self, group_by_attributes=[], grouped_activities=[]):
         for keys, group in grouped_activities:
-            group_list = list(group)
-            #special case. If we just grouped one activity, we don't need to aggregate
-            if len(group_list) == 1:
-                grouped_activities_list.append(group_list[0])
+            if self._window_size:
+                group_list = list(islice(group, self._window_size))
+                while group_list:
+                    yield self._aggregate_group(keys, group_list, group_by_attributes=group_by_attributes)
+                    group_list = list(islice(group, self._window_size))
             else:
-                #we have sevral activities that can be grouped together
-                aggregated_activity = dotdictify({})
-                aggregated_activity.update(group_list[0])
-
-                nested_root_attributes, aggregated_activity = self._listify_attributes(group_by_attributes=group_by_attributes,\
-                    activity=aggregated_activity)
-
-                #aggregate the rest of the activities into lists
-                for activity in group_list[1:]:
-                    activity = dotdictify(activity)
-                    for key in aggregated_activity.keys():
-                        if key not in group_by_attributes and key not in nested_root_attributes:
-                            aggregated_activity[key].append(activity.get(key))
-
-                    #for nested attributes append all other attributes in a list
-                    for attr in group_by_attributes:
-                        if '.' in attr:
-                            nested_val = activity.get(attr)
-                            if nested_val is not None:
-                                nested_dict, deepest_attr = attr.rsplit('.', 1)
-
-                                for nested_dict_key, nested_dict_value in activity.get(nested_dict).items():
-                                    if nested_dict_key != deepest_attr:
-                                        aggregated_activity['.'.join([nested_dict, nested_dict_key])].append(nested_dict_value)
-
-                #this might not be useful but meh, we'll see
-                aggregated_activity.update({'grouped_by_values': keys})
-                aggregated_activity.update({'grouped_by_attributes': list(group_by_attributes)})
-                grouped_activities_list.append(aggregated_activity)
-        return grouped_activities_list
+                yield self._aggregate_group(keys, list(group), group_by_attributes=group_by_attributes)
+
+    def _aggregate_group(self, keys, group_list, group_by_attributes=[]):
+        #special case. If we just grouped one activity, we don't need to aggregate
+        if len(group_list) == 1:
+            return group_list[0]
+
+        #we have sevral activities that can be grouped together
+        nested_root_attributes, aggregated_activity = self._listify_attributes(group_by_attributes=group_by_attributes,\
+            activity=group_list[0])
+
+        #aggregate the rest of the activities into lists
+        for activity in group_list[1:]:
+            for key in aggregated_activity.keys():
+                if key not in group_by_attributes and key not in nested_root_attributes:
+                    aggregated_activity[key].append(activity.get(key))
+
+            #for nested attributes append all other attributes in a list
+            for attr in group_by_attributes:
+                if '.' in attr:
+                    nested_val = get_path(activity, attr)
+                    if nested_val is not None:
+                        nested_dict, deepest_attr = attr.rsplit('.', 1)
+
+                        for nested_dict_key, nested_dict_value in get_path(activity, nested_dict).items():
+                            if nested_dict_key != deepest_attr:
+                                getter = compile_path('.'.join([nested_dict, nested_dict_key]))[0]
+                                getter(aggregated_activity).append(nested_dict_value)
+
+        #this might not be useful but meh, we'll see
+        aggregated_activity.update({'grouped_by_values': list(keys)})
+        aggregated_activity.update({'grouped_by_attributes': list(group_by_attributes)})
+        return aggregated_activity
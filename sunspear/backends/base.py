@@ -1,22 +1,139 @@
 import copy
 import uuid
+from collections import OrderedDict
+from itertools import islice
 
+import six
+from sunspear import jsoncodec
 from sunspear.activitystreams.models import (Activity, LikeActivity, Model,
                                              ReplyActivity)
+from sunspear.aggregators.base import process_stream
 from sunspear.exceptions import (SunspearDuplicateEntryException,
                                  SunspearInvalidActivityException,
+                                 SunspearInvalidConfigurationError,
                                  SunspearInvalidObjectException,
                                  SunspearOperationNotSupportedException)
+from sunspear.instrumentation import NullInstrumentation
+from sunspear.singleflight import make_key
 
-__all__ = ('BaseBackend', 'SUB_ACTIVITY_MAP')
+__all__ = ('BaseBackend', 'SUB_ACTIVITY_MAP', 'CONFLICT_SKIP', 'CONFLICT_OVERWRITE')
 
 SUB_ACTIVITY_MAP = {
     'reply': (ReplyActivity, 'replies',),
     'like': (LikeActivity, 'likes',),
 }
 
+# Strategies for bulk writes of records that already exist in the backend
+CONFLICT_SKIP = 'skip'
+CONFLICT_OVERWRITE = 'overwrite'
+CONFLICT_STRATEGIES = (CONFLICT_SKIP, CONFLICT_OVERWRITE,)
+
 
 class BaseBackend(object):
+    # reports the phases of backend operations, see ``sunspear.instrumentation``
+    instrumentation = NullInstrumentation()
+
+    def set_instrumentation(self, instrumentation):
+        """
+        Sets where this backend reports timing spans and counters to.
+
+        :type instrumentation: ``sunspear.instrumentation.Instrumentation``
+        :param instrumentation: the instrumentation to use. ``None`` turns instrumentation off.
+        """
+        self.instrumentation = instrumentation if instrumentation is not None else NullInstrumentation()
+
+    # encodes activities for ``get_activity_json``, see ``sunspear.fragments``. Off by default.
+    fragment_encoder = None
+
+    def set_fragment_encoder(self, fragment_encoder):
+        """
+        Sets the ``sunspear.fragments.FragmentEncoder`` ``get_activity_json`` encodes activities with. Worth it
+        when activities embed large objects; other activities are encoded faster without one.
+
+        :type fragment_encoder: sunspear.fragments.FragmentEncoder
+        :param fragment_encoder: the encoder to use. ``None`` turns it off.
+        """
+        self.fragment_encoder = fragment_encoder
+
+    # caches hydrated activities for ``get_activity``, see ``sunspear.activitycache``. Off by default.
+    activity_cache = None
+
+    def set_activity_cache(self, activity_cache):
+        """
+        :type activity_cache: ``sunspear.activitycache.ActivityCache``
+        :param activity_cache: the cache ``get_activity`` serves hydrated activities from. ``None`` turns
+            caching off.
+        """
+        self.activity_cache = activity_cache
+
+    # shares the reads of ``get_obj`` and ``get_activity`` between threads, see ``sunspear.singleflight``.
+    # Off by default.
+    single_flight = None
+
+    def set_single_flight(self, single_flight):
+        """
+        :type single_flight: ``sunspear.singleflight.SingleFlight``
+        :param single_flight: what concurrent reads of the same ids are shared through. ``None`` turns sharing off.
+        """
+        self.single_flight = single_flight
+
+    # remembers the ids ``get_obj`` did not find, see ``sunspear.negativecache``. Off by default.
+    negative_cache = None
+
+    def set_negative_cache(self, negative_cache):
+        """
+        :type negative_cache: ``sunspear.negativecache.NegativeCache``
+        :param negative_cache: the cache of missing object ids ``get_obj`` uses. ``None`` turns it off.
+        """
+        self.negative_cache = negative_cache
+
+    def _get_read_context(self):
+        """
+        :return: ``True`` if the reads of the current thread see what is committed, ``False`` if they may see
+            less, e.g. on a lagging replica, or ``None`` if they must not be shared with other threads nor cached,
+            e.g. in a transaction
+        """
+        return True
+
+    def _get_flight_key(self, name, kwargs):
+        """
+        :return: the key reads ``name`` with ``kwargs`` are shared under, or ``None`` if they are not shared
+        """
+        if self.single_flight is None:
+            return None
+        context = self._get_read_context()
+        if context is None:
+            return None
+        return make_key(name, context, kwargs)
+
+    def _invalidate_cached(self, ids):
+        """
+        Drops what is cached about the objects or activities ``ids``, which were written.
+        """
+        ids = list(ids)
+        if self.fragment_encoder is not None:
+            for obj_id in ids:
+                self.fragment_encoder.invalidate(obj_id)
+        if self.activity_cache is not None and ids:
+            self.activity_cache.invalidate(ids)
+        if self.negative_cache is not None and ids:
+            self.negative_cache.invalidate(ids)
+        if self.single_flight is not None:
+            self.single_flight.invalidate()
+
+    def _clear_cached(self):
+        """
+        Drops everything cached, once the backend was cleared.
+        """
+        if self.fragment_encoder is not None:
+            self.fragment_encoder.clear()
+        if self.activity_cache is not None:
+            self.activity_cache.clear()
+        if self.negative_cache is not None:
+            self.negative_cache.clear()
+        if self.single_flight is not None:
+            self.single_flight.invalidate()
+
     def clear_all_objects(self):
         """
         Clears all objects from the backend.
@@ -29,6 +146,43 @@ class BaseBackend(object):
         """
         raise NotImplementedError()
 
+    def iter_objects(self, batch_size=1000, since=None, after=None, **kwargs):
+        """
+        Iterates over every object in the backend, fetching ``batch_size`` objects at a time so
+        memory use stays bounded regardless of how many objects are stored. Objects are returned in the
+        same order every time, so an interrupted iteration can be resumed with ``after``.
+
+        :type batch_size: int
+        :param batch_size: the number of objects fetched from the backend in one round trip
+        :type since: datetime
+        :param since: if provided, only objects published on or after this time are returned. Naive datetimes
+            are in UTC.
+        :type after: string
+        :param after: if provided, the iteration starts after the object with this id
+
+        :return: an iterator of object dicts, as they are stored in the backend
+        """
+        raise NotImplementedError()
+
+    def iter_activities(self, batch_size=1000, since=None, after=None, **kwargs):
+        """
+        Iterates over every activity in the backend, fetching ``batch_size`` activities at a time so
+        memory use stays bounded regardless of how many activities are stored. Activities are returned
+        dehydrated, i.e. with references to their objects rather than the objects themselves, and in the
+        same order every time, so an interrupted iteration can be resumed with ``after``.
+
+        :type batch_size: int
+        :param batch_size: the number of activities fetched from the backend in one round trip
+        :type since: datetime
+        :param since: if provided, only activities published on or after this time are returned. Naive
+            datetimes are in UTC.
+        :type after: string
+        :param after: if provided, the iteration starts after the activity with this id
+
+        :return: an iterator of activity dicts, as they are stored in the backend
+        """
+        raise NotImplementedError()
+
     def obj_exists(self, obj, **kwargs):
         """
         Determins if an ``object`` already exists in the backend.
@@ -82,59 +236,172 @@ class BaseBackend(object):
 
         activity_copy = copy.copy(activity)
 
+        # the previous values of the objects are only read to be able to undo their writes, and with one
+        # ``get_obj`` for all of them
+        objs = self._get_activity_objs(activity_copy)
+        previous_values = dict(((self._extract_id(obj), obj,) for obj in self.get_obj(
+            list(OrderedDict.fromkeys([self._extract_id(obj) for _, _, obj in objs])))))
+
         objs_created = []
         objs_modified = []
-        for key, value in activity_copy.items():
-            if key in Activity._object_fields and isinstance(value, dict):
-                if self.obj_exists(value):
-                    previous_value = self.get_obj([self._extract_id(value)])[0]
+        objs_written = set()
+        for key, index, value in objs:
+            obj_id = self._extract_id(value)
+            try:
+                if obj_id in objs_written:
+                    # the same object is used more than once, only its first write is undone
+                    self.update_obj(value, **kwargs)
+                elif obj_id in previous_values:
+                    objs_modified.append(previous_values[obj_id])
+                    self.update_obj(value, **kwargs)
                 else:
-                    previous_value = None
-
-                try:
-                    if previous_value:
-                        objs_modified.append(previous_value)
-                        self.update_obj(value)
-                    else:
-                        new_obj = self.create_obj(value)
-                        objs_created.append(new_obj)
-                except Exception:
-                    # there was an error, undo everything we just did
-                    self._rollback(objs_created, objs_modified)
-                    raise
+                    objs_created.append(self.create_obj(value))
+            except Exception:
+                # there was an error, undo everything we just did
+                self._rollback(objs_created, objs_modified)
+                raise
+            objs_written.add(obj_id)
 
+            if index is None:
                 activity[key] = value["id"]
-
-            if key in Activity._direct_audience_targeting_fields + Activity._indirect_audience_targeting_fields\
-                    and value:
-                for i, target_obj in enumerate(value):
-                    if isinstance(target_obj, dict):
-                        previous_value = self.get_obj(target_obj)
-                        if self.obj_exists(target_obj):
-                            previous_value = self.get_obj(target_obj)
-                        else:
-                            previous_value = None
-
-                        try:
-                            if previous_value:
-                                objs_modified.append(previous_value)
-                                self.update_obj(target_obj, **kwargs)
-                            else:
-                                new_obj = self.create_obj(target_obj)
-                                objs_created.append(new_obj)
-                        except Exception:
-                            self._rollback(objs_created, objs_modified)
-                            raise
-                        activity[key][i] = target_obj["id"]
+            else:
+                activity[key][index] = value["id"]
 
         try:
             return_val = self.activity_create(activity, **kwargs)
         except Exception:
             self._rollback(objs_created, objs_modified)
             raise
+        finally:
+            self._invalidate_cached([activity_id])
 
         return return_val
 
+    def _get_activity_objs(self, activity):
+        """
+        :return: a list of tuples of the field, the index in the field for audience targeting, or ``None``,
+            and the object, for every object of ``activity`` given as a dictionary
+        """
+        objs = []
+        for key, value in activity.items():
+            if key in Activity._object_fields and isinstance(value, dict):
+                objs.append((key, None, value,))
+
+            if key in Activity._direct_audience_targeting_fields + Activity._indirect_audience_targeting_fields\
+                    and value:
+                objs.extend(((key, i, target_obj,) for i, target_obj in enumerate(value)
+                             if isinstance(target_obj, dict)))
+        return objs
+
+    def bulk_create_objects(self, objs, on_conflict=CONFLICT_SKIP, **kwargs):
+        """
+        Stores a batch of objects as they were exported from a backend, without the per-object
+        bookkeeping of ``create_obj``. Backends should override this to write the batch with as few
+        round trips as possible; the default implementation stores one object at a time.
+
+        :type objs: list
+        :param objs: a list of object dicts. Every object must have an id.
+        :type on_conflict: string
+        :param on_conflict: what to do with objects that already exist. ``skip`` leaves them untouched,
+            ``overwrite`` replaces them.
+
+        :raises: ``SunspearInvalidConfigurationError`` if ``on_conflict`` is not a known strategy.
+        :return: the number of objects written
+        """
+        self._validate_conflict_strategy(on_conflict)
+
+        count = 0
+        for obj in objs:
+            if self.obj_exists(obj):
+                if on_conflict == CONFLICT_SKIP:
+                    continue
+                self.obj_update(obj, **kwargs)
+            else:
+                self.obj_create(obj, **kwargs)
+            count += 1
+        return count
+
+    def bulk_create_activities(self, activities, on_conflict=CONFLICT_SKIP, **kwargs):
+        """
+        Stores a batch of dehydrated activities (i.e. activities that reference their objects by id)
+        as they were exported from a backend, without the per-activity bookkeeping of ``create_activity``.
+        The objects the activities reference should already have been stored. Backends should override
+        this to write the batch with as few round trips as possible; the default implementation stores
+        one activity at a time.
+
+        :type activities: list
+        :param activities: a list of activity dicts. Every activity must have an id.
+        :type on_conflict: string
+        :param on_conflict: what to do with activities that already exist. ``skip`` leaves them untouched,
+            ``overwrite`` replaces them.
+
+        :raises: ``SunspearInvalidConfigurationError`` if ``on_conflict`` is not a known strategy.
+        :return: the number of activities written
+        """
+        self._validate_conflict_strategy(on_conflict)
+
+        parents = self._get_sub_activity_parents(activities)
+        count = 0
+        for activity in activities:
+            create_kwargs = dict(kwargs)
+            if activity['id'] in parents:
+                create_kwargs['activity_id'] = parents[activity['id']][0]
+
+            if self.activity_exists(activity):
+                if on_conflict == CONFLICT_SKIP:
+                    continue
+                self.activity_update(activity, **create_kwargs)
+            else:
+                self.activity_create(activity, **create_kwargs)
+            count += 1
+        return count
+
+    def bulk_create_sub_activities(self, sub_activities, on_conflict=CONFLICT_SKIP, **kwargs):
+        """
+        Links a batch of already stored ``reply`` and ``like`` activities to the activities they were made on.
+        Backends that keep sub-activities embedded in the parent activity have nothing to do here, which
+        is what the default implementation assumes.
+
+        :type sub_activities: list
+        :param sub_activities: a list of dehydrated sub-activity dicts
+        :type on_conflict: string
+        :param on_conflict: what to do with links that already exist. ``skip`` leaves them untouched,
+            ``overwrite`` replaces them.
+
+        :raises: ``SunspearInvalidConfigurationError`` if ``on_conflict`` is not a known strategy.
+        :return: the number of sub-activities linked
+        """
+        self._validate_conflict_strategy(on_conflict)
+        return 0
+
+    def _validate_conflict_strategy(self, on_conflict):
+        if on_conflict not in CONFLICT_STRATEGIES:
+            raise SunspearInvalidConfigurationError(
+                "Unknown conflict strategy {!r}. Expected one of {}.".format(on_conflict, ', '.join(CONFLICT_STRATEGIES)))
+
+    def _get_sub_activity_parents(self, activities):
+        """
+        Finds the parent of every ``reply`` or ``like`` in ``activities`` through the ``inReplyTo`` of
+        its object. Objects are fetched with a single call to ``get_obj``.
+
+        :return: a dict mapping the sub-activity id to a tuple of the parent activity id and the
+            sub-activity's object
+        """
+        sub_activities = [activity for activity in activities
+                          if activity.get('verb') in SUB_ACTIVITY_MAP and activity.get('object')]
+
+        object_ids = [activity['object'] for activity in sub_activities if not isinstance(activity['object'], dict)]
+        objects_dict = dict(((obj['id'], obj,) for obj in self.get_obj(object_ids)))
+
+        parents = {}
+        for activity in sub_activities:
+            obj = activity['object']
+            if not isinstance(obj, dict):
+                obj = objects_dict.get(obj)
+            if obj and obj.get('inReplyTo'):
+                parents[activity['id']] = (self._extract_id(obj['inReplyTo'][0]), obj,)
+        return parents
+
     def _rollback(self, new_objects, modified_objects, **kwargs):
         [self.delete_obj(obj, **kwargs) for obj in new_objects]
         [self.update_obj(obj, **kwargs) for obj in modified_objects]
@@ -165,7 +432,10 @@ class BaseBackend(object):
         if not activity_id:
             raise SunspearInvalidActivityException()
 
-        return self.activity_update(activity, **kwargs)
+        try:
+            return self.activity_update(activity, **kwargs)
+        finally:
+            self._invalidate_cached([activity_id])
 
     def activity_update(self, activity, **kwargs):
         """
@@ -186,12 +456,17 @@ class BaseBackend(object):
         :param activity: a dict representing the activity
 
         :raises: ``SunspearInvalidActivityException`` if the activity doesn't have a valid id.
+        :return: the number of activities deleted: ``0`` if the activity did not exist. ``RiakBackend``
+            returns ``None`` unless it is called with ``count_deleted=True``, as counting costs it a read.
         """
         activity_id = self._extract_id(activity)
         if not activity_id:
             raise SunspearInvalidActivityException()
 
-        return self.activity_delete(activity, **kwargs)
+        try:
+            return self.activity_delete(activity, **kwargs)
+        finally:
+            self._invalidate_cached([activity_id])
 
     def activity_delete(self, activity, **kwargs):
         """
@@ -199,9 +474,27 @@ class BaseBackend(object):
 
         :type activity: dict
         :param activity: a dict representing the activity
+
+        :return: the number of activities deleted, not counting their replies and likes
         """
         raise NotImplementedError()
 
+    def delete_activities(self, activities, **kwargs):
+        """
+        Deletes a batch of activities, with their replies and likes. Backends should override this to delete
+        the batch with as few round trips as possible; the default implementation deletes one activity at a
+        time.
+
+        :type activities: list
+        :param activities: a list of activity dicts or ids
+
+        :raises: ``SunspearInvalidActivityException`` if an activity doesn't have a valid id.
+        :return: the number of activities deleted
+        """
+        for activity in activities:
+            self.delete_activity(activity, **kwargs)
+        return len(activities)
+
     def get_activity(self, activity_ids=[], **kwargs):
         """
         Gets an activity or a list of activities from the backend.
@@ -213,11 +506,100 @@ class BaseBackend(object):
         :return: a list of activities. If an activity is not found, a partial list should
             be returned.
         """
-        return self.activity_get(self._listify(activity_ids), **kwargs)
+        activity_ids = self._listify(activity_ids)
+        with self.instrumentation.span('get_activity'):
+            # aggregated activities are not the activities of the ids read
+            key = None if kwargs.get('aggregation_pipeline') else self._get_flight_key('get_activity', kwargs)
+            if key is None:
+                return self.activity_get(activity_ids, **kwargs)
+            return self.single_flight.fetch(key, [self._extract_id(activity_id) for activity_id in activity_ids],
+                                            lambda ids: self.activity_get(ids, **kwargs))
 
     def activity_get(self, activity, **kwargs):
         raise NotImplementedError()
 
+    def _hydrate_cached(self, activities, generation, hydrate):
+        """
+        Hydrates the ``activities`` that are not in ``activity_cache`` with ``hydrate``, caches them, and takes
+        the others from the cache.
+
+        :type generation: int
+        :param generation: the ``generation`` of ``activity_cache``, read before ``activities`` were read
+        :type hydrate: callable
+        :param hydrate: hydrates a list of activities read from the backend
+
+        :return: the hydrated activities, in the order of ``activities``
+        """
+        context = self._get_read_context()
+        if self.activity_cache is None or context is None:
+            # reads in a transaction see its writes, which may still be rolled back
+            return hydrate(activities)
+
+        hydrated = {}
+        misses = []
+        for activity in activities:
+            cached = self.activity_cache.get(activity['id'])
+            if cached is None:
+                misses.append(activity)
+            else:
+                hydrated[activity['id']] = cached
+        self.instrumentation.incr('activity_cache.hits', len(hydrated))
+        self.instrumentation.incr('activity_cache.misses', len(misses))
+
+        if misses:
+            # objects that do not exist are left out of the hydrated activities, but are depended on
+            references = dict(((activity['id'], self._extract_object_keys(activity),) for activity in misses))
+            for activity in hydrate(misses):
+                # a replica may return less than what was invalidated
+                if context is True:
+                    self.activity_cache.put(activity, generation, references.get(activity['id'], ()))
+                hydrated[activity['id']] = activity
+
+        return [hydrated[activity['id']] for activity in activities if activity['id'] in hydrated]
+
+    def get_activity_json(self, activity_ids=[], **kwargs):
+        """
+        Gets activities like ``get_activity``, encoded to JSON. With a ``fragment_encoder`` set, the large
+        objects the activities embed are encoded once and their encoding is reused by the following calls.
+
+        :return: the JSON array of the activities, as UTF-8 encoded bytes
+        """
+        activities = self.get_activity(activity_ids, **kwargs)
+        if self.fragment_encoder is not None:
+            return self.fragment_encoder.encode_activities(activities)
+        data = jsoncodec.dumps(activities)
+        return data.encode('utf-8') if isinstance(data, six.text_type) else data
+
+    def stream_activities(self, activity_ids, batch_size=100, aggregation_pipeline=[], **kwargs):
+        """
+        Lazily gets activities from the backend, fetching ``batch_size`` activities at a time and
+        running them through the ``process_stream`` method of each aggregator in
+        ``aggregation_pipeline``. Memory use does not grow with the number of ids.
+
+        :type activity_ids: iterable
+        :param activity_ids: an iterable (for example, a generator) of ids of activities that will be retrieved from
+            the backend.
+        :type batch_size: int
+        :param batch_size: the number of activities fetched from the backend in one call
+        :type aggregation_pipeline: array of ``sunspear.aggregators.base.BaseAggregator``
+        :param aggregation_pipeline: modify the stream of activities. Exact results depends on the implementation of the aggregation pipeline
+
+        :return: an iterator of activities. Any other keyword arguments are passed to ``activity_get``.
+        """
+        if isinstance(activity_ids, (basestring, dict)):
+            activity_ids = [activity_ids]
+
+        activities = self._iter_activity_batches(iter(activity_ids), batch_size, **kwargs)
+        return process_stream(activities, aggregation_pipeline)
+
+    def _iter_activity_batches(self, activity_ids, batch_size, **kwargs):
+        while True:
+            batch = list(islice(activity_ids, batch_size))
+            if not batch:
+                break
+            for activity in self.activity_get(batch, **kwargs):
+                yield activity
+
     def create_obj(self, obj, **kwargs):
         """
         Stores a new ``obj`` in the backend. If an object with the same id already exists in
@@ -234,7 +616,10 @@ class BaseBackend(object):
         if not obj_id:
             obj['id'] = self.get_new_id()
 
-        return self.obj_create(obj, **kwargs)
+        try:
+            return self.obj_create(obj, **kwargs)
+        finally:
+            self._invalidate_cached([obj['id']])
 
     def obj_create(self, obj, **kwargs):
         """
@@ -266,7 +651,10 @@ class BaseBackend(object):
         if not obj_id:
             raise SunspearInvalidObjectException()
 
-        return self.obj_update(obj, **kwargs)
+        try:
+            return self.obj_update(obj, **kwargs)
+        finally:
+            self._invalidate_cached([obj_id])
 
     def obj_update(self, obj, **kwargs):
         raise NotImplementedError()
@@ -288,7 +676,10 @@ class BaseBackend(object):
         if not obj_id:
             raise SunspearInvalidObjectException()
 
-        return self.obj_delete(obj, **kwargs)
+        try:
+            return self.obj_delete(obj, **kwargs)
+        finally:
+            self._invalidate_cached([obj_id])
 
     def obj_delete(self, obj, **kwargs):
         raise NotImplementedError()
@@ -304,7 +695,44 @@ class BaseBackend(object):
         :return: a list of activities. If an obj is not found, a partial list should
             be returned.
         """
-        return self.obj_get(self._listify(obj_ids), **kwargs) if obj_ids else []
+        if not obj_ids:
+            return []
+        obj_ids = self._listify(obj_ids)
+        with self.instrumentation.span('get_obj'):
+            context = self._get_read_context()
+            # reads in a transaction may see objects that were not committed yet
+            if self.negative_cache is None or context is None:
+                return self._read_obj(obj_ids, **kwargs)
+            return self._read_existing_obj(obj_ids, remember_missing=context is True, **kwargs)
+
+    def _read_obj(self, obj_ids, **kwargs):
+        key = self._get_flight_key('get_obj', kwargs)
+        if key is None:
+            return self.obj_get(obj_ids, **kwargs)
+        return self.single_flight.fetch(key, [self._extract_id(obj_id) for obj_id in obj_ids],
+                                        lambda ids: self.obj_get(ids, **kwargs))
+
+    def _read_existing_obj(self, obj_ids, remember_missing=True, **kwargs):
+        """
+        Reads the objects ``obj_ids``, but the ones ``negative_cache`` knows are missing, and remembers the ones
+        that are missing.
+
+        :type remember_missing: boolean
+        :param remember_missing: ``False`` for reads that may not see every committed object, like the reads of
+            a lagging replica
+        """
+        generation = self.negative_cache.generation
+        obj_ids = [self._extract_id(obj_id) for obj_id in obj_ids]
+        existing_ids = self.negative_cache.filter(obj_ids)
+        self.instrumentation.incr('negative_cache.hits', len(obj_ids) - len(existing_ids))
+        if not existing_ids:
+            return []
+
+        objs = self._read_obj(existing_ids, **kwargs)
+        if remember_missing:
+            found_ids = set(obj['id'] for obj in objs)
+            self.negative_cache.add([obj_id for obj_id in existing_ids if obj_id not in found_ids], generation)
+        return objs
 
     def obj_get(self, obj, **kwargs):
         raise NotImplementedError()
@@ -347,7 +775,10 @@ class BaseBackend(object):
         if not self.is_sub_activity_verb_valid(sub_activity_verb):
             raise SunspearOperationNotSupportedException('Verb not supported')
 
-        return self.sub_activity_create(activity, actor, content, extra=extra, sub_activity_verb=sub_activity_verb, **kwargs)
+        try:
+            return self.sub_activity_create(activity, actor, content, extra=extra, sub_activity_verb=sub_activity_verb, **kwargs)
+        finally:
+            self._invalidate_cached([activity_id])
 
     def sub_activity_create(self, activity, actor, content, extra={}, sub_activity_verb="", sub_activity_attribute="", **kwargs):
         """
@@ -384,7 +815,11 @@ class BaseBackend(object):
         if not activity_id:
             raise SunspearInvalidActivityException()
 
-        return self.sub_activity_delete(sub_activity, sub_activity_verb, **kwargs)
+        try:
+            return self.sub_activity_delete(sub_activity, sub_activity_verb, **kwargs)
+        finally:
+            # the activity it was made on embeds it
+            self._invalidate_cached([activity_id])
 
     def sub_activity_delete(self, sub_activity, sub_activity_verb, **kwargs):
         raise NotImplementedError()
@@ -491,13 +926,15 @@ class BaseBackend(object):
         """
         Takes a raw list of activities returned from riak and replace keys with contain ids for riak objects with actual riak object
         """
-        activities = self._extract_sub_activities(activities)
+        with self.instrumentation.span('hydrate_sub_activity'):
+            activities = self._extract_sub_activities(activities)
 
         # collect a list of unique object ids. We only iterate through the fields that we know
         # for sure are objects. User is responsible for hydrating all other fields.
         object_ids = set()
-        for activity in activities:
-            object_ids.update(self._extract_object_keys(activity))
+        with self.instrumentation.span('extract_object_keys'):
+            for activity in activities:
+                object_ids.update(self._extract_object_keys(activity))
 
         # Get the objects for the ids we have collected
         objects = self.get_obj(object_ids)
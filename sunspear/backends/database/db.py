@@ -20,23 +20,31 @@ from __future__ import absolute_import, unicode_literals
 import calendar
 import copy
 import datetime
-import json
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 
-import six
 from dateutil import tz
 from dateutil.parser import parse
-from sqlalchemy import and_, create_engine, desc, not_, or_, sql
+from sqlalchemy import and_, create_engine, desc, event, inspect, not_, or_, sql
 from sqlalchemy.engine.result import RowProxy
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import QueuePool, StaticPool
 from sunspear.activitystreams.models import (SUB_ACTIVITY_VERBS_MAP, Activity,
                                              Model, Object)
-from sunspear.backends.base import SUB_ACTIVITY_MAP, BaseBackend
+from sunspear.backends.base import (CONFLICT_OVERWRITE, CONFLICT_SKIP,
+                                    SUB_ACTIVITY_MAP, BaseBackend)
 from sunspear.exceptions import (SunspearDuplicateEntryException,
+                                 SunspearInvalidActivityException,
                                  SunspearOperationNotSupportedException,
                                  SunspearValidationException)
 
-from . import schema
+from . import migrations, schema
+from .diagnostics import QueryCapture
+from .replicas import ReadSession, ReplicaSet, get_pool_status
+from .upsert import Upsert, supports_upsert
 
 DB_OBJ_FIELD_MAPPING = {
     'id': 'id',
@@ -62,23 +70,238 @@ DB_ACTIVITY_FIELD_MAPPING = {
     'icon': 'icon',
 }
 
-DICT_FIELDS = Activity._media_fields + Object._media_fields + Activity._object_fields + ['other_data',]
-
 
 class DatabaseBackend(BaseBackend):
 
     def __init__(self, db_connection_string=None, verbose=False, poolsize=10,
-                 max_overflow=5, **kwargs):
-        self._engine = create_engine(db_connection_string, echo=verbose, poolclass=QueuePool,
-                                     pool_size=poolsize, max_overflow=max_overflow, convert_unicode=True)
+                 max_overflow=5, instrumentation=None, partitioning=None, read_replicas=None,
+                 replica_health_check_interval=10, replica_max_lag=None, sticky_seconds=5, **kwargs):
+        """
+        :type partitioning: ``sunspear.backends.database.partitioning.MonthlyPartitioning``
+        :param partitioning: if given, activities are stored in a partition per month of their ``published``
+            time. See ``sunspear.backends.database.partitioning``.
+        :type read_replicas: list
+        :param read_replicas: connection strings of read replicas of the database. Each gets a pool of
+            ``poolsize`` connections. See ``sunspear.backends.database.replicas``.
+        :type replica_health_check_interval: float
+        :param replica_health_check_interval: the number of seconds between health checks of the replicas
+        :type replica_max_lag: float
+        :param replica_max_lag: if given, replicas more than this many seconds behind the primary are not used
+        :type sticky_seconds: float
+        :param sticky_seconds: the number of seconds the reads of a session go to the primary after it writes
+        """
+        self._engine = self._create_engine(db_connection_string, verbose=verbose, poolsize=poolsize, max_overflow=max_overflow)
+
+        if instrumentation is not None:
+            self.set_instrumentation(instrumentation)
+
+        self._replicas = None
+        self._sticky_seconds = sticky_seconds
+        if read_replicas:
+            self._replicas = ReplicaSet(
+                [('replica{}'.format(i), self._create_engine(replica_connection_string, verbose=verbose, poolsize=poolsize,
+                                                              max_overflow=max_overflow),)
+                 for i, replica_connection_string in enumerate(read_replicas)],
+                health_check_interval=replica_health_check_interval, max_lag=replica_max_lag)
+
+            @event.listens_for(self._engine, 'before_cursor_execute')
+            def remember_write(conn, cursor, statement, parameters, context, executemany):
+                if not statement.lstrip().upper().startswith('SELECT'):
+                    self._get_session().last_write = time.time()
+
+        for pool_name, engine in [('primary', self._engine)] + (self._replicas.engines if self._replicas else []):
+            self._listen_to_pool(pool_name, engine)
+
+        self._partitioning = partitioning
+        self._partition_names = None
+        self._partitions_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _create_engine(self, db_connection_string, verbose=False, poolsize=10, max_overflow=5):
+        if db_connection_string.startswith('sqlite'):
+            return self._create_sqlite_engine(db_connection_string, verbose=verbose)
+        return create_engine(db_connection_string, echo=verbose, poolclass=QueuePool,
+                             pool_size=poolsize, max_overflow=max_overflow, convert_unicode=True)
+
+    def _listen_to_pool(self, pool_name, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            self.instrumentation.incr('db.statements', pool=pool_name)
+
+        @event.listens_for(engine, 'checkout')
+        def report_checkout(dbapi_connection, connection_record, connection_proxy):
+            status = get_pool_status(engine)
+            if status is None:
+                return
+            self.instrumentation.gauge('db.pool.checked_out', status['checked_out'], pool=pool_name)
+            if status['checked_out'] >= status['capacity']:
+                self.instrumentation.incr('db.pool.saturated', pool=pool_name)
+
+    def _create_sqlite_engine(self, db_connection_string, verbose=False):
+        """
+        SQLite is supported for tests and benchmarks. Connections are shared between threads, and
+        an in-memory database uses a single connection so every thread sees the same database.
+        """
+        engine_kwargs = {'connect_args': {'check_same_thread': False}}
+        if db_connection_string in ('sqlite://', 'sqlite:///:memory:'):
+            engine_kwargs['poolclass'] = StaticPool
+        engine = create_engine(db_connection_string, echo=verbose, convert_unicode=True, **engine_kwargs)
+
+        @event.listens_for(engine, 'connect')
+        def enable_foreign_keys(dbapi_connection, connection_record):
+            # SQLite ignores foreign keys, and so the cascading deletes, unless they are turned on
+            dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+        return engine
 
     @property
     def engine(self):
         return self._engine
 
+    def get_pool_status(self):
+        """
+        :return: a dict of pool names, ``primary`` and ``replica0``, ``replica1``, ..., to the status of
+            their connection pool, see ``sunspear.backends.database.replicas.get_pool_status``. Replicas
+            also have a ``healthy`` flag.
+        """
+        pools = {'primary': get_pool_status(self.engine)}
+        for name, engine in self._replicas.engines if self._replicas else []:
+            status = get_pool_status(engine) or {}
+            status['healthy'] = self._replicas.is_healthy(name)
+            pools[name] = status
+        return pools
+
+    @contextmanager
+    def session(self, session=None):
+        """
+        Makes ``session`` the session of the current thread while the context is active. The reads of a
+        session go to the primary for ``sticky_seconds`` after it writes, so it reads its own writes.
+
+        :type session: ``sunspear.backends.database.replicas.ReadSession``
+        :param session: the session to resume. If ``None``, a new session is started.
+
+        :return: the session
+        """
+        previous = getattr(self._local, 'session', None)
+        self._local.session = session if session is not None else ReadSession()
+        try:
+            yield self._local.session
+        finally:
+            self._local.session = previous
+
+    def _get_session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = ReadSession()
+        return session
+
+    @contextmanager
+    def _use_primary(self):
+        """
+        Sends the reads of the current thread to the primary while the context is active. Used around
+        writes, which must not act on what a lagging replica returns.
+        """
+        self._local.primary = getattr(self._local, 'primary', 0) + 1
+        try:
+            yield
+        finally:
+            self._local.primary -= 1
+
+    def _get_read_engine(self):
+        """
+        :return: the engine reads should use: a healthy replica, unless there is none, the current thread
+            is writing, or its session wrote in the last ``sticky_seconds``
+        """
+        if self._replicas is None or getattr(self._local, 'primary', 0):
+            return self.engine
+        if self._get_session().is_sticky(time.time(), self._sticky_seconds):
+            return self.engine
+        return self._replicas.get_engine() or self.engine
+
+    def _get_read_context(self):
+        # reads in a transaction or in a partition see what the current thread sees only
+        if getattr(self._local, 'connection', None) is not None or self._local.__dict__.get('partitions'):
+            return None
+        return self._get_read_engine() is self.engine
+
+    def _execute_read(self, statement):
+        """
+        Executes a read-only ``statement`` on the engine returned by ``_get_read_engine``. If a replica
+        fails, it is marked unhealthy and the statement is retried on the primary.
+
+        :return: all the rows of the result
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            return connection.execute(statement).fetchall()
+
+        engine = self._get_read_engine()
+        if engine is self.engine:
+            return self.engine.execute(statement).fetchall()
+
+        try:
+            return engine.execute(statement).fetchall()
+        except DBAPIError:
+            self._replicas.mark_unhealthy(engine)
+            self.instrumentation.incr('db.replica.errors')
+            return self.engine.execute(statement).fetchall()
+
+    @contextmanager
+    def transaction(self):
+        """
+        A unit of work: every statement the backend issues in the current thread while the context is active
+        runs on one connection, in one transaction, which is committed when the context exits and rolled back
+        if it raises. Nested ``transaction`` contexts join the outer one. Operations that issue more than one
+        statement, like ``create_activity``, run in a transaction of their own, so several client calls can
+        be made atomic with::
+
+            with backend.transaction():
+                client.create_activity(activity)
+                client.create_reply(activity['id'], actor, 'a reply')
+
+        With partitioning, a partition is created on a connection of its own the first time an activity is
+        written to it.
+
+        :return: the ``sqlalchemy.engine.Connection`` of the transaction
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            yield connection
+            return
+
+        with self.engine.connect() as connection:
+            with connection.begin():
+                self._local.connection = connection
+                try:
+                    yield connection
+                finally:
+                    self._local.connection = None
+
+    def _execute(self, statement, *multiparams):
+        """
+        Executes ``statement`` on the connection of the current ``transaction``, or on its own connection if
+        there is none.
+        """
+        connection = getattr(self._local, 'connection', None)
+        return (connection if connection is not None else self.engine).execute(statement, *multiparams)
+
+    def capture_queries(self, explain=False):
+        """
+        Captures every SQL statement issued by this backend, on the primary and on the read replicas, with its
+        row count and timing, while the returned context manager is active. See ``sunspear.backends.database.diagnostics``.
+
+        :type explain: boolean
+        :param explain: if ``True``, the query plan of every ``SELECT`` is read and checked for full
+            scans and missing indexes
+
+        :return: a ``QueryCapture``
+        """
+        engines = [self.engine] + [engine for name, engine in (self._replicas.engines if self._replicas else [])]
+        return QueryCapture(engines, explain=explain)
+
     @property
     def activities_table(self):
-        return schema.tables['activities']
+        return self._get_table('activities')
 
     @property
     def objects_table(self):
@@ -86,27 +309,220 @@ class DatabaseBackend(BaseBackend):
 
     @property
     def likes_table(self):
-        return schema.tables['likes']
+        return self._get_table('likes')
 
     @property
     def replies_table(self):
-        return schema.tables['replies']
+        return self._get_table('replies')
 
     @property
     def to_table(self):
-        return schema.tables['to']
+        return self._get_table('to')
 
     @property
     def bto_table(self):
-        return schema.tables['bto']
+        return self._get_table('bto')
 
     @property
     def cc_table(self):
-        return schema.tables['cc']
+        return self._get_table('cc')
 
     @property
     def bcc_table(self):
-        return schema.tables['bcc']
+        return self._get_table('bcc')
+
+    def _get_table(self, table_name):
+        """
+        :return: the table ``table_name`` of the partition selected with ``_use_partition``, or of the
+            unpartitioned schema
+        """
+        partitions = getattr(self._local, 'partitions', None)
+        if partitions and partitions[-1] is not None:
+            return self._partitioning.get_tables(partitions[-1])[table_name]
+        return schema.tables[table_name]
+
+    @contextmanager
+    def _use_partition(self, partition):
+        """
+        Makes the activity tables, like ``activities_table``, the tables of ``partition`` for the current
+        thread while the context is active. ``None`` selects the tables of the unpartitioned schema.
+        """
+        partitions = self._local.__dict__.setdefault('partitions', [])
+        partitions.append(partition)
+        try:
+            yield
+        finally:
+            partitions.pop()
+
+    def get_partitions(self, since=None, until=None):
+        """
+        :type since: datetime
+        :param since: if given, only the partitions that can hold activities published at or after ``since``
+        :type until: datetime
+        :param until: if given, only the partitions that can hold activities published before ``until``
+
+        :return: the names of the partitions, oldest first. Empty if partitioning is off.
+        """
+        if self._partitioning is None:
+            return []
+
+        with self._partitions_lock:
+            if self._partition_names is None:
+                self._partition_names = self._load_partition_names()
+            names = sorted(self._partition_names)
+
+        if since is not None:
+            since = self._get_datetime_obj(since)
+        if until is not None:
+            until = self._get_datetime_obj(until)
+        return self._partitioning.prune(names, since=since, until=until)
+
+    def refresh_partitions(self):
+        """
+        Re-reads the list of partitions from the database, to see the partitions created or dropped by other
+        processes. Reads that miss activities do this on their own.
+        """
+        with self._partitions_lock:
+            self._partition_names = self._load_partition_names()
+
+    def _load_partition_names(self):
+        table_names = inspect(self.engine).get_table_names()
+        return set(filter(None, map(self._partitioning.get_partition_name_from_table_name, table_names)))
+
+    def create_partition(self, published):
+        """
+        Creates the partition activities published at ``published`` are stored in, if it does not exist yet.
+        Writes create the partitions they need on their own, except in a ``transaction``: call this before
+        it to store activities of a month that has no partition yet.
+
+        :type published: datetime
+
+        :raises: ``SunspearOperationNotSupportedException`` if partitioning is off
+        :return: the name of the partition
+        """
+        if self._partitioning is None:
+            raise SunspearOperationNotSupportedException('Partitioning is not enabled')
+        return self._get_partition_for_write({'published': published})
+
+    def _get_partition_for_write(self, activity):
+        """
+        Returns the partition ``activity`` is stored in, creating it if it does not exist yet. An activity
+        without ``published`` is in the partition of the current time; give it a ``published`` first for it
+        to be stored there.
+
+        :raises: ``SunspearOperationNotSupportedException`` if the partition does not exist and the current
+            thread is in a ``transaction``: its tables would be created on another connection, outside of the
+            transaction, and on SQLite wait for the transaction to release its lock
+        :return: the name of the partition, or ``None`` if partitioning is off
+        """
+        if self._partitioning is None:
+            return None
+
+        partition = self._partitioning.get_name(
+            self._get_datetime_obj(activity.get('published') or datetime.datetime.utcnow()))
+
+        with self._partitions_lock:
+            if self._partition_names is None:
+                self._partition_names = self._load_partition_names()
+            if partition not in self._partition_names:
+                if getattr(self._local, 'connection', None) is not None:
+                    raise SunspearOperationNotSupportedException(
+                        'Partition {} cannot be created in a transaction, create it with create_partition '
+                        'first'.format(partition))
+                tables = self._partitioning.get_tables(partition).values()
+                self._partitioning.metadata.create_all(self.engine, tables=tables)
+                self._partition_names.add(partition)
+        return partition
+
+    def _group_by_partition(self, activity_ids, since=None, until=None, refresh=True):
+        """
+        Finds the partitions ``activity_ids`` are stored in with one query over the partitions that can hold
+        activities published in ``[since, until)``.
+
+        :type refresh: boolean
+        :param refresh: if ``True`` and some activities are not found, the list of partitions is re-read to
+            look for them in partitions created by other processes
+
+        :return: a list of tuples of a partition and the ids of the activities stored in it. Ids that are not
+            found are left out. If partitioning is off, a single tuple of ``None`` and all the ids.
+        """
+        if self._partitioning is None:
+            return [(None, activity_ids,)]
+
+        activity_ids = [self._extract_id(activity_id) for activity_id in activity_ids]
+        if not activity_ids:
+            return []
+
+        partitions = self.get_partitions(since=since, until=until)
+        found = self._find_partitions(activity_ids, partitions)
+
+        missing_ids = [activity_id for activity_id in activity_ids if activity_id not in found]
+        if missing_ids and refresh:
+            self.refresh_partitions()
+            new_partitions = [partition for partition in self.get_partitions(since=since, until=until)
+                              if partition not in partitions]
+            found.update(self._find_partitions(missing_ids, new_partitions))
+
+        groups = OrderedDict()
+        for activity_id in activity_ids:
+            if activity_id in found:
+                groups.setdefault(found[activity_id], []).append(activity_id)
+        return list(groups.items())
+
+    def _find_partitions(self, activity_ids, partitions):
+        """
+        :return: a dict of the ids in ``activity_ids`` found in ``partitions`` to the partition they are in
+        """
+        found = {}
+        if not activity_ids or not partitions:
+            return found
+
+        # SQLite limits a compound select to 500 selects
+        for i in range(0, len(partitions), 100):
+            queries = []
+            for partition in partitions[i:i + 100]:
+                table = self._partitioning.get_tables(partition)['activities']
+                queries.append(sql.select([table.c.id, sql.literal(partition)]).where(table.c.id.in_(activity_ids)))
+            for activity_id, partition in self._execute_read(sql.union_all(*queries)):
+                found[activity_id] = partition
+        return found
+
+    def _get_activity_partition(self, activity_id):
+        """
+        :return: the partition of the activity ``activity_id``, or ``None`` if partitioning is off or the
+            activity is not found
+        """
+        for partition, activity_ids in self._group_by_partition([activity_id]):
+            return partition
+        return None
+
+    def drop_partitions(self, before=None):
+        """
+        Drops the partitions that only hold activities published before ``before``, with the replies, likes
+        and audience targeting of their activities. Dropping a partition takes about the same time whatever
+        its size, and frees its space, unlike deleting its rows.
+
+        :type before: datetime
+        :param before: if ``None``, every partition is dropped
+
+        :raises: ``SunspearOperationNotSupportedException`` if partitioning is off
+        :return: the names of the partitions that were dropped
+        """
+        if self._partitioning is None:
+            raise SunspearOperationNotSupportedException('Partitioning is not enabled')
+
+        self.refresh_partitions()
+        dropped = []
+        for partition in self.get_partitions():
+            if before is not None and not self._partitioning.ends_before(partition, self._get_datetime_obj(before)):
+                continue
+
+            tables = self._partitioning.get_tables(partition).values()
+            self._partitioning.metadata.drop_all(self.engine, tables=tables)
+            with self._partitions_lock:
+                self._partition_names.discard(partition)
+            dropped.append(partition)
+        return dropped
 
     def _get_connection(self):
         return self.engine.connect()
@@ -114,8 +530,20 @@ class DatabaseBackend(BaseBackend):
     def create_tables(self):
         schema.metadata.create_all(self.engine)
 
+    def create_indexes(self, online=True):
+        """
+        Adds the indexes declared in ``schema`` to tables created before they were declared. Indexes that
+        already exist are left alone. See ``sunspear.backends.database.migrations.create_indexes``.
+
+        :return: the names of the indexes that were created
+        """
+        return migrations.create_indexes(self.engine, online=online)
+
     def drop_tables(self):
+        if self._partitioning is not None:
+            self.drop_partitions()
         schema.metadata.drop_all(self.engine)
+        self._clear_cached()
 
     def clear_all(self):
         self.drop_tables()
@@ -125,13 +553,275 @@ class DatabaseBackend(BaseBackend):
         raise SunspearOperationNotSupportedException()
 
     def clear_all_activities(self):
-        self.engine.execute(self.activities_table.delete())
+        if self._partitioning is not None:
+            self.drop_partitions()
+        self._execute(self.activities_table.delete())
+        self._clear_cached()
+
+    def iter_objects(self, batch_size=1000, since=None, after=None, **kwargs):
+        """
+        Iterates over all objects, ordered by id. Objects are read ``batch_size`` rows at a time
+        using keyset pagination on the primary key, so no query ever scans past the rows it returns.
+        """
+        for row in self._iter_table_rows(self.objects_table, batch_size=batch_size, since=since, after=after):
+            yield self._db_schema_to_obj_dict(row)
+
+    def iter_activities(self, batch_size=1000, since=None, after=None, **kwargs):
+        """
+        Iterates over all activities (including replies and likes, which are also stored as activities),
+        ordered by id. Activities are read ``batch_size`` rows at a time using keyset pagination on the
+        primary key. With partitioning, the partitions are read oldest first, skipping those that only
+        hold activities published before ``since``, and activities are ordered by id within a partition.
+        An iteration resumed ``after`` an activity that was deleted meanwhile starts from the first partition.
+        """
+        if self._partitioning is None:
+            tables = [self.activities_table]
+        else:
+            self.refresh_partitions()
+            partitions = self.get_partitions(since=since)
+            if after is not None:
+                after_partition = self._get_activity_partition(after)
+                if after_partition in partitions:
+                    partitions = partitions[partitions.index(after_partition):]
+                else:
+                    after = None
+            tables = [self._partitioning.get_tables(partition)['activities'] for partition in partitions]
+
+        for table in tables:
+            for row in self._iter_table_rows(table, batch_size=batch_size, since=since, after=after):
+                yield self._convert_to_activity_stream_schema(row, DB_ACTIVITY_FIELD_MAPPING, table)
+            # the partitions after the one of ``after`` are read from their start
+            after = None
+
+    def _iter_table_rows(self, table, batch_size=1000, since=None, after=None):
+        last_id = after
+        while True:
+            query = sql.select([table]).order_by(table.c.id).limit(batch_size)
+            if since is not None:
+                query = query.where(table.c.published >= self._get_db_compatiable_date_string(since))
+            if last_id is not None:
+                query = query.where(table.c.id > last_id)
+
+            rows = self._execute(query).fetchall()
+            for row in rows:
+                yield row
+
+            if len(rows) < batch_size:
+                break
+            last_id = rows[-1][table.c.id]
+
+    def bulk_create_objects(self, objs, on_conflict=CONFLICT_SKIP, **kwargs):
+        """
+        Stores a batch of objects using a single multi-row ``INSERT``. Existing objects are found with
+        one ``SELECT`` for the whole batch and are either skipped or overwritten with one ``UPDATE``
+        executed for many rows.
+        """
+        self._validate_conflict_strategy(on_conflict)
+
+        rows = [self._obj_dict_to_db_schema(self._get_parsed_and_validated_obj_dict(obj)) for obj in objs]
+        with self.transaction() as connection:
+            written_ids = self._bulk_write(connection, self.objects_table, rows, on_conflict)
+        self._invalidate_cached(written_ids)
+        return len(written_ids)
+
+    def bulk_create_activities(self, activities, on_conflict=CONFLICT_SKIP, **kwargs):
+        """
+        Stores a batch of dehydrated activities and their audience targeting rows in one transaction,
+        using multi-row ``INSERT`` statements. Replies and likes are stored as activities here; use
+        ``bulk_create_sub_activities`` once their parents are stored to link them. With partitioning, the
+        statements are issued once for every partition the batch spans.
+        """
+        self._validate_conflict_strategy(on_conflict)
+
+        audience_targeting_fields = Activity._direct_audience_targeting_fields + Activity._indirect_audience_targeting_fields
+
+        activity_rows = OrderedDict()
+        audience_targeting_rows = {}
+        for activity in activities:
+            activity_dict = self._get_parsed_and_validated_activity_dict(activity)
+            partition = self._get_partition_for_write(activity_dict)
+            activity_rows.setdefault(partition, []).append(self._activity_dict_to_db_schema(activity_dict))
+            for audience_targeting_field in audience_targeting_fields:
+                for obj in activity_dict.get(audience_targeting_field) or []:
+                    audience_targeting_rows.setdefault(audience_targeting_field, []).append(
+                        {'object': self._extract_id(obj), 'activity': activity_dict['id']})
+
+        all_written_ids = []
+        with self.transaction() as connection:
+            for partition, rows in activity_rows.items():
+                with self._use_partition(partition):
+                    written_ids = self._bulk_write(connection, self.activities_table, rows, on_conflict)
+                    all_written_ids.extend(written_ids)
+
+                    if written_ids:
+                        self._bulk_write_audience_targeting(connection, written_ids, audience_targeting_rows, on_conflict)
+
+        self._invalidate_cached(all_written_ids)
+        return len(all_written_ids)
+
+    def _bulk_write_audience_targeting(self, connection, written_ids, audience_targeting_rows, on_conflict):
+        written_ids_set = set(written_ids)
+        for audience_targeting_field in Activity._direct_audience_targeting_fields + Activity._indirect_audience_targeting_fields:
+            audience_table = self._get_audience_targeting_table(audience_targeting_field)
+            if on_conflict == CONFLICT_OVERWRITE:
+                connection.execute(audience_table.delete().where(audience_table.c.activity.in_(written_ids)))
+
+            rows = [row for row in audience_targeting_rows.get(audience_targeting_field, [])
+                    if row['activity'] in written_ids_set]
+            if rows:
+                connection.execute(audience_table.insert(), rows)
+
+    def bulk_create_sub_activities(self, sub_activities, on_conflict=CONFLICT_SKIP, **kwargs):
+        """
+        Inserts the ``replies`` and ``likes`` rows for a batch of stored sub-activities. The parent
+        of each sub-activity is read from the ``inReplyTo`` of its object, so both the objects and the
+        parent activities must already be stored. Sub-activities whose object has no ``inReplyTo``, or
+        whose parent activity or actor is not stored, are ignored.
+        """
+        self._validate_conflict_strategy(on_conflict)
+
+        with self._use_primary():
+            parents = self._get_sub_activity_parents(sub_activities)
+            parent_partitions = {}
+            for partition, parent_ids in self._group_by_partition(list(set(parent_id for parent_id, obj in parents.values()))):
+                parent_partitions.update(((parent_id, partition,) for parent_id in parent_ids))
+
+        rows_by_attribute = OrderedDict()
+        for sub_activity in sub_activities:
+            if sub_activity['id'] not in parents:
+                continue
+            parent_id, obj = parents[sub_activity['id']]
+            if parent_id not in parent_partitions:
+                continue
+
+            sub_activity = dict(((key, value,) for key, value in sub_activity.items() if key not in Activity._response_fields))
+            sub_activity['actor'] = {'id': self._extract_id(sub_activity['actor'])}
+            sub_activity['object'] = obj
+
+            sub_activity_attribute = self.get_sub_activity_attribute(sub_activity['verb'])
+            rows_by_attribute.setdefault((parent_partitions[parent_id], sub_activity_attribute,), []).append(
+                self._convert_sub_activity_to_db_schema(sub_activity, {'id': parent_id}))
+
+        count = 0
+        parent_ids = set()
+        with self.transaction() as connection:
+            for (partition, sub_activity_attribute,), rows in rows_by_attribute.items():
+                with self._use_partition(partition):
+                    sub_activity_table = self._get_sub_activity_table(sub_activity_attribute)
+                    rows = self._drop_dangling_sub_activity_rows(connection, sub_activity_table, rows)
+                    count += len(self._bulk_write(connection, sub_activity_table, rows, on_conflict))
+                    parent_ids.update(row['in_reply_to'] for row in rows)
+        self._invalidate_cached(parent_ids)
+        return count
+
+    def _drop_dangling_sub_activity_rows(self, connection, table, rows):
+        """
+        Drops sub-activity rows that would fail the constraints of ``table`` and with them the whole
+        batch: rows whose parent activity or actor is not stored, and for ``likes``, a second like by
+        the same actor on the same activity.
+        """
+        activities_table = self.activities_table
+        objects_table = self.objects_table
+
+        parent_ids = set(row['in_reply_to'] for row in rows)
+        actor_ids = set(row['actor'] for row in rows)
+        stored_parent_ids = set(result[0] for result in connection.execute(
+            sql.select([activities_table.c.id]).where(activities_table.c.id.in_(list(parent_ids)))))
+        stored_actor_ids = set(result[0] for result in connection.execute(
+            sql.select([objects_table.c.id]).where(objects_table.c.id.in_(list(actor_ids)))))
+        rows = [row for row in rows if row['in_reply_to'] in stored_parent_ids and row['actor'] in stored_actor_ids]
+
+        if table is self.likes_table and rows:
+            liked_by = dict((((result[1], result[2],), result[0],) for result in connection.execute(
+                sql.select([table.c.id, table.c.actor, table.c.in_reply_to]).where(
+                    table.c.in_reply_to.in_(list(stored_parent_ids))))))
+            unique_rows = []
+            for row in rows:
+                like_id = liked_by.setdefault((row['actor'], row['in_reply_to'],), row['id'])
+                if like_id == row['id']:
+                    unique_rows.append(row)
+            rows = unique_rows
+
+        return rows
+
+    def _bulk_write(self, connection, table, rows, on_conflict):
+        """
+        Writes ``rows`` to ``table`` and returns the ids of the rows that were written. Rows whose id
+        already exists are skipped or updated depending on ``on_conflict``. If the same id appears more
+        than once, the last row wins.
+        """
+        rows = OrderedDict(((row['id'], row,) for row in self._normalize_rows(table, rows)))
+        if not rows:
+            return []
+
+        if on_conflict == CONFLICT_OVERWRITE and supports_upsert(self.engine.dialect):
+            connection.execute(Upsert(table, list(rows.values())))
+            return list(rows.keys())
+
+        existing_ids = set(result[0] for result in connection.execute(
+            sql.select([table.c.id]).where(table.c.id.in_(list(rows.keys())))))
+
+        new_rows = [row for row_id, row in rows.items() if row_id not in existing_ids]
+        if new_rows:
+            connection.execute(table.insert(), new_rows)
+        written_ids = [row['id'] for row in new_rows]
+
+        if on_conflict == CONFLICT_OVERWRITE:
+            existing_rows = [dict(row, _id=row_id) for row_id, row in rows.items() if row_id in existing_ids]
+            if existing_rows:
+                connection.execute(table.update().where(table.c.id == sql.bindparam('_id')), existing_rows)
+                written_ids.extend([row['id'] for row in existing_rows])
+
+        return written_ids
+
+    def _upsert(self, table, rows):
+        """
+        Inserts ``rows`` into ``table``, updating the rows whose id already exists with the columns given.
+        Rows are written with one multi-row ``Upsert`` for every set of columns they have. Databases without
+        a native upsert read the existing ids first, and update their rows one at a time.
+        """
+        if not rows:
+            return
+
+        rows_by_columns = OrderedDict()
+        for row in rows:
+            rows_by_columns.setdefault(tuple(sorted(row.keys())), []).append(row)
+
+        if supports_upsert(self.engine.dialect):
+            for column_rows in rows_by_columns.values():
+                self._execute(Upsert(table, column_rows))
+            return
+
+        existing_ids = set(result[0] for result in self._execute(
+            sql.select([table.c.id]).where(table.c.id.in_([row['id'] for row in rows]))))
+        for column_rows in rows_by_columns.values():
+            new_rows = [row for row in column_rows if row['id'] not in existing_ids]
+            if new_rows:
+                self._execute(table.insert(), new_rows)
+        for row in rows:
+            if row['id'] in existing_ids:
+                self._execute(table.update().where(table.c.id == row['id']).values(**row))
+
+    def _normalize_rows(self, table, rows):
+        """
+        Gives every row the same set of columns so a batch can be written with one multi-row statement.
+        Columns missing from a row are written as ``NULL``.
+        """
+        if not rows:
+            return rows
+
+        row_keys = set()
+        for row in rows:
+            row_keys.update(row.keys())
+        column_names = [column.name for column in table.c if column.name in row_keys]
+
+        return [dict(((column_name, row.get(column_name),) for column_name in column_names)) for row in rows]
 
     def obj_create(self, obj, **kwargs):
         obj_dict = self._get_parsed_and_validated_obj_dict(obj)
         obj_db_schema_dict = self._obj_dict_to_db_schema(obj_dict)
 
-        self.engine.execute(self.objects_table.insert(), [obj_db_schema_dict])
+        self._execute(self.objects_table.insert(), [obj_db_schema_dict])
 
         return obj_dict
 
@@ -139,18 +829,19 @@ class DatabaseBackend(BaseBackend):
         obj_id = self._extract_id(obj)
         objs_db_table = self.objects_table
 
-        return self.engine.execute(sql.select([sql.exists().where(objs_db_table.c.id == obj_id)])).scalar()
+        return self._execute(sql.select([sql.exists().where(objs_db_table.c.id == obj_id)])).scalar()
 
     def audience_targeting_exists(self, targeting_type, activity_id, object_id):
-        audience_table = self._get_audience_targeting_table(targeting_type)
-        return self.engine.execute(sql.select([sql.exists().where((audience_table.c.activity == activity_id) & (audience_table.c.object == object_id))])).scalar()
+        with self._use_partition(self._get_activity_partition(activity_id)):
+            audience_table = self._get_audience_targeting_table(targeting_type)
+            return self._execute(sql.select([sql.exists().where((audience_table.c.activity == activity_id) & (audience_table.c.object == object_id))])).scalar()
 
     def obj_update(self, obj, **kwargs):
         obj_dict = self._get_parsed_and_validated_obj_dict(obj)
         obj_id = self._extract_id(obj_dict)
         obj_db_schema_dict = self._obj_dict_to_db_schema(obj_dict)
 
-        self.engine.execute(
+        self._execute(
             self.objects_table.update().where(self.objects_table.c.id == obj_id).values(**obj_db_schema_dict))
 
     def obj_get(self, obj, **kwargs):
@@ -163,7 +854,7 @@ class DatabaseBackend(BaseBackend):
         obj_ids = [self._extract_id(o) for o in obj]
         s = self._get_select_multiple_objects_query(obj_ids)
 
-        results = self.engine.execute(s).fetchall()
+        results = self._execute_read(s)
         results = map(self._db_schema_to_obj_dict, results)
 
         return results
@@ -172,13 +863,16 @@ class DatabaseBackend(BaseBackend):
         obj_id = self._extract_id(obj)
 
         stmt = self.objects_table.delete().where(self.objects_table.c.id == obj_id)
-        self.engine.execute(stmt)
+        self._execute(stmt)
 
     def activity_exists(self, activity, **kwargs):
         activity_id = self._extract_id(activity)
+        if self._partitioning is not None:
+            return bool(self._group_by_partition([activity_id], refresh=False))
+
         activities_db_table = self.activities_table
 
-        return self.engine.execute(sql.select([sql.exists().where(activities_db_table.c.id == activity_id)])).scalar()
+        return self._execute(sql.select([sql.exists().where(activities_db_table.c.id == activity_id)])).scalar()
 
     def activity_create(self, activity, **kwargs):
         """
@@ -192,7 +886,7 @@ class DatabaseBackend(BaseBackend):
 
         activity_db_schema_dict = self._activity_dict_to_db_schema(activity_dict)
 
-        self.engine.execute(self.activities_table.insert(), [activity_db_schema_dict])
+        self._execute(self.activities_table.insert(), [activity_db_schema_dict])
 
         return self.get_activity(activity_dict, include_public=True)
 
@@ -208,7 +902,28 @@ class DatabaseBackend(BaseBackend):
         return activity_obj, activity_obj_id
 
     def create_activity(self, activity, **kwargs):
-        activity_id = self._resolve_activity_id(activity, **kwargs)
+        """
+        Stores the objects of ``activity``, the activity and its audience targeting in one ``transaction``.
+        """
+        if self._partitioning is not None and not activity.get('published'):
+            # stored with the time of the partition it is stored in
+            activity = dict(activity, published=datetime.datetime.utcnow())
+        partition = self._get_partition_for_write(activity)
+        obj_ids = [self._extract_id(obj) for _, _, obj in self._get_activity_objs(activity)]
+        try:
+            with self._use_primary(), self._use_partition(partition), self.transaction():
+                return self._create_activity(activity, **kwargs)
+        finally:
+            # once committed, so what is cached meanwhile is dropped too
+            self._invalidate_cached(obj_ids + [self._extract_id(activity)])
+
+    def _create_activity(self, activity, update=False, **kwargs):
+        """
+        :type update: boolean
+        :param update: if ``True``, the stored activity is replaced with an ``UPDATE`` of its row, and its
+            audience targeting with the one of ``activity``
+        """
+        activity_id = self._extract_id(activity) if update else self._resolve_activity_id(activity, **kwargs)
         activity['id'] = activity_id
 
         activity_copy = copy.copy(activity)
@@ -243,58 +958,143 @@ class DatabaseBackend(BaseBackend):
                 activity[key] = activity_audience_targeting_objs
                 audience_targeting_map[key] = activity_audience_targeting_objs
 
-        # For all of the objects in the activity, find out which ones actually already have existing
-        # objects in the database
-        obj_ids = self._flatten([ids_of_objs_with_no_dict, activity_objs.keys()])
+        # Upsert all objects for the activity
+        self._upsert(self.objects_table, [
+            self._obj_dict_to_db_schema(self._get_parsed_and_validated_obj_dict(obj)) for obj in activity_objs.values()])
+
+        if update:
+            # the audience targeting is replaced, including the targeting the new activity no longer has
+            for audience_targeting_field in audience_targeting_fields:
+                audience_table = self._get_audience_targeting_table(audience_targeting_field)
+                self._execute(audience_table.delete().where(audience_table.c.activity == activity_id))
+            return_val = self._update_activity_row(activity)
+        else:
+            return_val = self.activity_create(activity, **kwargs)
 
-        s = self._get_select_multiple_objects_query(obj_ids)
-        results = self.engine.execute(s).fetchall()
-        results = self._flatten(results)
+        # Insert objects for audience targeting
+        for audience_targeting_field, values in audience_targeting_map.items():
+            audience_table = self._get_audience_targeting_table(audience_targeting_field)
 
-        objs_need_to_be_inserted = []
-        objs_need_to_be_updated = []
+            self._execute(audience_table.delete().where(audience_table.c.activity == activity_id))
+            self._execute(audience_table.insert(), [{'object': obj, 'activity': activity_id} for obj in values])
 
-        for obj_id, obj in activity_objs.items():
-            parsed_validated_schema_dict = self._get_parsed_and_validated_obj_dict(obj)
-            parsed_validated_schema_dict = self._obj_dict_to_db_schema(parsed_validated_schema_dict)
-            if obj_id not in results:
-                objs_need_to_be_inserted.append(parsed_validated_schema_dict)
-            else:
-                objs_need_to_be_updated.append(parsed_validated_schema_dict)
+        return return_val
 
-        # Upsert all objects for the activity
-        with self.engine.begin() as connection:
-            if objs_need_to_be_inserted:
-                connection.execute(self.objects_table.insert(), objs_need_to_be_inserted)
-            for obj in objs_need_to_be_updated:
-                connection.execute(
-                    self.objects_table.update().where(self.objects_table.c.id == self._extract_id(obj)).values(**obj))
+    def activity_update(self, activity, **kwargs):
+        """
+        Replaces a stored activity, its objects and its audience targeting in one ``transaction``. The row of
+        the activity is updated in place, so its replies and likes are kept; the activity is created if it
+        does not exist. With partitioning, the activity stays in the partition it is stored in.
+        """
+        activity_id = self._extract_id(activity)
+        with self._use_primary():
+            if not self.activity_exists(activity_id):
+                return self.create_activity(activity, **kwargs)
+
+            obj_ids = [self._extract_id(obj) for _, _, obj in self._get_activity_objs(activity)]
+            try:
+                with self._use_partition(self._get_activity_partition(activity_id)), self.transaction():
+                    return self._create_activity(activity, update=True, **kwargs)
+            finally:
+                self._invalidate_cached(obj_ids)
+
+    def _update_activity_row(self, activity):
+        activity_dict = self._get_parsed_and_validated_activity_dict(activity)
+        activity_db_schema_dict = self._activity_dict_to_db_schema(activity_dict)
+        # columns the new activity does not have are cleared, like a replaced riak object
+        activity_db_schema_dict = dict(((column.name, activity_db_schema_dict.get(column.name),)
+                                        for column in self.activities_table.columns if column.name != 'id'))
 
-        return_val = self.activity_create(activity, **kwargs)
+        self._execute(self.activities_table.update().where(
+            self.activities_table.c.id == activity_dict['id']).values(**activity_db_schema_dict))
 
-        # Insert objects for audience targeting
-        if audience_targeting_map:
-            for audience_targeting_field, values in audience_targeting_map.items():
-                with self.engine.begin() as connection:
-                    audience_table = self._get_audience_targeting_table(audience_targeting_field)
+        return self.get_activity(activity_dict, include_public=True)
 
-                    stmt = audience_table.delete().where(audience_table.c.activity == return_val[0]['id'])
-                    self.engine.execute(stmt)
-                    connection.execute(audience_table.insert(), [{'object': obj, 'activity': return_val[0]['id']} for obj in values])
+    def delete_activities(self, activities, batch_size=1000, **kwargs):
+        """
+        Deletes a batch of activities, with their replies and likes, in one ``transaction`` of set-based
+        statements: nothing is read into Python. The replies and likes are deleted with a subquery on the
+        ``replies`` and ``likes`` tables, then the activities; the rows of the ``replies``, ``likes`` and
+        audience targeting tables go with them through the ``ON DELETE CASCADE`` of their foreign keys.
+        With partitioning, the statements are issued for every partition the batch spans.
 
-        return return_val
+        :type batch_size: int
+        :param batch_size: the number of activities deleted by one statement
+
+        :raises: ``SunspearInvalidActivityException`` if an activity doesn't have a valid id.
+        :return: the number of activities deleted, not counting their replies and likes
+        """
+        activity_ids = [self._extract_id(activity) for activity in activities]
+        if not all(activity_ids):
+            raise SunspearInvalidActivityException()
+        if not activity_ids:
+            return 0
+
+        count = 0
+        with self._use_primary(), self.transaction():
+            for partition, partition_activity_ids in self._group_by_partition(activity_ids):
+                for i in range(0, len(partition_activity_ids), batch_size):
+                    count += self._delete_activities(partition, partition_activity_ids[i:i + batch_size])
+        self._invalidate_cached(activity_ids)
+        return count
+
+    def _delete_activities(self, partition, activity_ids):
+        with self._use_partition(partition):
+            replies_table, likes_table, activities_table = self.replies_table, self.likes_table, self.activities_table
+
+        sub_activity_tables = [activities_table]
+        if partition is not None:
+            # replies and likes are published after their parent, so they are in its partition or a later one
+            sub_activity_tables = [self._partitioning.get_tables(sub_activity_partition)['activities']
+                                   for sub_activity_partition in self.get_partitions(
+                                       since=self._partitioning.get_bounds(partition)[0])]
+
+        for table in sub_activity_tables:
+            self._execute(table.delete().where(or_(
+                table.c.id.in_(sql.select([replies_table.c.id]).where(replies_table.c.in_reply_to.in_(activity_ids))),
+                table.c.id.in_(sql.select([likes_table.c.id]).where(likes_table.c.in_reply_to.in_(activity_ids))))))
+
+        return self._execute(activities_table.delete().where(activities_table.c.id.in_(activity_ids))).rowcount
+
+    def activity_delete(self, activity, **kwargs):
+        """
+        Deletes an activity with its replies and likes, see ``delete_activities``.
+
+        :return: the number of activities deleted
+        """
+        return self.delete_activities([activity], **kwargs)
 
-    def activity_get(self, activity_ids, aggregation_pipeline=[], audience_targeting={}, include_public=False, **kwargs):
+    def activity_get(self, activity_ids, aggregation_pipeline=[], audience_targeting={}, include_public=False,
+                     since=None, until=None, **kwargs):
+        """
+        :type since: datetime
+        :param since: if given, only activities published at or after ``since`` are returned. With
+            partitioning, the partitions that only hold older activities are not read.
+        :type until: datetime
+        :param until: if given, only activities published before ``until`` are returned
+        """
         activity_ids = self._listify(activity_ids)
-        activities_query = self.get_raw_activities_query(activity_ids, **kwargs)
-        activities_query = self.filter_by_audience_targeting(activities_query, audience_targeting, include_public=include_public)
-        activities = self.get_raw_activities(activities_query)
-        activities = self.hydrate_activities(activities)
+        generation = self.activity_cache.generation if self.activity_cache is not None else None
+        with self.instrumentation.span('fetch'):
+            activities = []
+            partitions = {}
+            for partition, partition_activity_ids in self._group_by_partition(activity_ids, since=since, until=until):
+                if partition is not None:
+                    partitions.update(((activity_id, partition,) for activity_id in partition_activity_ids))
+                with self._use_partition(partition):
+                    activities_query = self.get_raw_activities_query(partition_activity_ids, since=since, until=until, **kwargs)
+                    activities_query = self.filter_by_audience_targeting(activities_query, audience_targeting, include_public=include_public)
+                    activities.extend(self.get_raw_activities(activities_query))
+
+        with self.instrumentation.span('hydrate'):
+            activities = self._hydrate_cached(
+                activities, generation, lambda misses: self.hydrate_activities(misses, partitions=partitions))
 
         if aggregation_pipeline:
-            original_activities = copy.deepcopy(activities)
-            for aggregator in aggregation_pipeline:
-                activities = aggregator.process(activities, original_activities, aggregation_pipeline)
+            with self.instrumentation.span('aggregation'):
+                original_activities = copy.deepcopy(activities)
+                for aggregator in aggregation_pipeline:
+                    activities = aggregator.process(activities, original_activities, aggregation_pipeline)
 
         return activities
 
@@ -324,11 +1124,16 @@ class DatabaseBackend(BaseBackend):
         sub_activity_attribute = self.get_sub_activity_attribute(sub_activity_verb)
 
         activity_id = self._extract_id(activity)
-        activities_query = self.get_raw_activities_query([activity_id], **kwargs)
-        raw_activity = self.get_raw_activities(activities_query)[0]
+        # partitions are created outside of transactions, so the one of the sub-activity is created first
+        self._get_partition_for_write({'published': published or datetime.datetime.utcnow()})
 
-        sub_activity, original_activity = self._create_sub_activity(
-            sub_activity_attribute, raw_activity, actor, content, extra=extra, sub_activity_verb=sub_activity_verb, published=published, **kwargs)
+        # the sub-activity is linked to its parent in the partition of the parent
+        with self._use_primary(), self.transaction(), self._use_partition(self._get_activity_partition(activity_id)):
+            activities_query = self.get_raw_activities_query([activity_id], **kwargs)
+            raw_activity = self.get_raw_activities(activities_query)[0]
+
+            sub_activity, original_activity = self._create_sub_activity(
+                sub_activity_attribute, raw_activity, actor, content, extra=extra, sub_activity_verb=sub_activity_verb, published=published, **kwargs)
 
         # get all the sub activity items for the original activity incase it hasn't been refreshed
         original_activity = self._hydrate_sub_activity([original_activity])[0]
@@ -350,15 +1155,67 @@ class DatabaseBackend(BaseBackend):
 
         sub_activity = self.create_activity(sub_activity)[0]
         sub_activity_db_schema = self._convert_sub_activity_to_db_schema(sub_activity, original_activity)
-        self.engine.execute(sub_activity_table.insert(), [sub_activity_db_schema])
+        self._execute(sub_activity_table.insert(), [sub_activity_db_schema])
 
         return sub_activity, original_activity
 
-    def hydrate_activities(self, activities):
+    def sub_activity_delete(self, sub_activity, sub_activity_verb, **kwargs):
+        """
+        Deletes a reply or like, and the row linking it to the activity it was made on, in one
+        ``transaction``.
+
+        :raises: ``SunspearValidationException`` if ``sub_activity`` is not a ``sub_activity_verb``
+        :return: a dict representing the updated parent activity
+        """
+        sub_activity_model = self.get_sub_activity_model(sub_activity_verb)
+        sub_activity_attribute = self.get_sub_activity_attribute(sub_activity_verb)
+        sub_activity_id = self._extract_id(sub_activity)
+
+        with self._use_primary(), self.transaction():
+            partition, activity_id = self._get_sub_activity_parent(sub_activity_attribute, sub_activity_id)
+            if activity_id is None:
+                raise SunspearValidationException(
+                    "Trying to delete something that is not a {}.".format(sub_activity_model.sub_item_verb))
+
+            with self._use_partition(partition):
+                sub_activity_table = self._get_sub_activity_table(sub_activity_attribute)
+                self._execute(sub_activity_table.delete().where(sub_activity_table.c.id == sub_activity_id))
+                self.delete_activities([sub_activity_id])
+
+                raw_activity = self.get_raw_activities(self.get_raw_activities_query([activity_id]))[0]
+
+        return self._hydrate_sub_activity([raw_activity])[0]
+
+    def _get_sub_activity_parent(self, sub_activity_attribute, sub_activity_id):
+        """
+        :return: a tuple of the partition and the id of the activity ``sub_activity_id`` was made on, with
+            ``None`` for the id if it is not linked in the ``sub_activity_attribute`` table
+        """
+        partitions = [None]
+        if self._partitioning is not None:
+            sub_activity_partition = self._get_activity_partition(sub_activity_id)
+            if sub_activity_partition is None:
+                return None, None
+            # the parent was published before the sub-activity, most likely shortly before
+            partitions = reversed(self.get_partitions(until=self._partitioning.get_bounds(sub_activity_partition)[1]))
+
+        for partition in partitions:
+            with self._use_partition(partition):
+                sub_activity_table = self._get_sub_activity_table(sub_activity_attribute)
+                activity_id = self._execute(sql.select([sub_activity_table.c.in_reply_to]).where(
+                    sub_activity_table.c.id == sub_activity_id)).scalar()
+            if activity_id is not None:
+                return partition, activity_id
+        return None, None
+
+    def hydrate_activities(self, activities, partitions=None):
         """
         Takes a raw list of activities returned from riak and replace keys with contain ids for riak objects with actual riak object
         TODO: This can probably be refactored out of the riak backend once everything like
         sub activities and shared with fields are implemented
+
+        :type partitions: dict
+        :param partitions: the partition of every activity, if known. See ``_hydrate_sub_activity``.
         """
         if not activities:
             return []
@@ -366,14 +1223,16 @@ class DatabaseBackend(BaseBackend):
         # collect a list of unique object ids. We only iterate through the fields that we know
         # for sure are objects. User is responsible for hydrating all other fields.
         object_ids = set()
-        for activity in activities:
-            object_ids.update(self._extract_object_keys(activity))
+        with self.instrumentation.span('extract_object_keys'):
+            for activity in activities:
+                object_ids.update(self._extract_object_keys(activity))
 
         # Get the objects for the ids we have collected
         objects = self.get_obj(object_ids)
         objects_dict = dict(((obj["id"], obj,) for obj in objects))
 
-        activities = self._hydrate_sub_activity(activities)
+        with self.instrumentation.span('hydrate_sub_activity'):
+            activities = self._hydrate_sub_activity(activities, partitions=partitions)
 
         activities_in_objects_ids = set()
         # replace the object ids with the hydrated objects
@@ -386,8 +1245,10 @@ class DatabaseBackend(BaseBackend):
         # If we did have activities that were objects, we need to hydrate those activities and
         # the objects for those activities
         if activities_in_objects_ids:
-            activities_query = self.get_raw_activities_query(activities_in_objects_ids)
-            sub_activities = self.get_raw_activities(activities_query)
+            sub_activities = []
+            for partition, activity_ids in self._group_by_partition(activities_in_objects_ids):
+                with self._use_partition(partition):
+                    sub_activities.extend(self.get_raw_activities(self.get_raw_activities_query(activity_ids)))
 
             activities_in_objects_dict = dict(((sub_activity["id"], sub_activity,) for sub_activity in sub_activities))
             for activity in activities:
@@ -417,7 +1278,36 @@ class DatabaseBackend(BaseBackend):
         """
         return uuid.uuid1().hex
 
-    def _hydrate_sub_activity(self, activities):
+    def _hydrate_sub_activity(self, activities, partitions=None):
+        """
+        Adds the replies and likes to ``activities``.
+
+        :type partitions: dict
+        :param partitions: with partitioning, a dict of activity ids to the partition the activity is stored
+            in. If not given, the partitions are looked up.
+        """
+        if self._partitioning is None:
+            return self._hydrate_partition_sub_activity(activities)
+
+        if partitions is None:
+            partitions = {}
+            for partition, activity_ids in self._group_by_partition(list(set(activity['id'] for activity in activities))):
+                partitions.update(((activity_id, partition,) for activity_id in activity_ids))
+
+        activities_by_partition = OrderedDict()
+        for activity in activities:
+            if activity['id'] in partitions:
+                activities_by_partition.setdefault(partitions[activity['id']], []).append(activity)
+
+        for partition, partition_activities in activities_by_partition.items():
+            with self._use_partition(partition):
+                self._hydrate_partition_sub_activity(partition_activities)
+        return activities
+
+    def _hydrate_partition_sub_activity(self, activities):
+        """
+        Adds the replies and likes to ``activities``, which are all in the current partition.
+        """
         activity_ids = set()
         for activity in activities:
             activity_ids.add(activity['id'])
@@ -450,7 +1340,7 @@ class DatabaseBackend(BaseBackend):
 
     def _get_select_multiple_sub_activities(self, sub_activity_attribute, activity_ids):
         sub_activity_stm = self._get_select_multiple_sub_activities_query(sub_activity_attribute, activity_ids)
-        results = self.engine.execute(sub_activity_stm).fetchall()
+        results = self._execute_read(sub_activity_stm)
         parsed_results = []
         for result in results:
             sub_activity_table = self._get_sub_activity_table(sub_activity_attribute)
@@ -477,16 +1367,20 @@ class DatabaseBackend(BaseBackend):
     def _get_sub_activity_table(self, sub_activity_attribute):
         return getattr(self, '{}_table'.format(sub_activity_attribute))
 
-    def get_raw_activities_query(self, activity_ids, **kwargs):
+    def get_raw_activities_query(self, activity_ids, since=None, until=None, **kwargs):
         activity_ids = map(self._extract_id, activity_ids)
         if not activity_ids:
             return []
 
         s = self._get_select_multiple_activities_query(activity_ids)
+        if since is not None:
+            s = s.where(self.activities_table.c.published >= self._get_db_compatiable_date_string(since))
+        if until is not None:
+            s = s.where(self.activities_table.c.published < self._get_db_compatiable_date_string(until))
         return s
 
     def get_raw_activities(self, activities_query):
-        activities = self.engine.execute(activities_query).fetchall()
+        activities = self._execute_read(activities_query)
         activities = [self._db_schema_to_activity_dict(activity) for activity in activities]
 
         return activities
@@ -541,19 +1435,13 @@ class DatabaseBackend(BaseBackend):
 
         return schema_dict
 
-    def _need_to_parse_json(self, schema_field_name, data):
-        if schema_field_name in DICT_FIELDS and isinstance(data, six.string_types) and data:
-            # TODO: This seems hacky. Is there a better way to do this?
-            if '{' in data or '[' in data:
-                return True
-        return False
-
     def _convert_to_activity_stream_schema(self, schema_dict, field_mapping, db_table):
         # we make a copy because we will be mutating the dict.
         # we will map official fields to db fields, and put the rest in `other_data`
         obj_dict = {}
         is_row_proxy = isinstance(schema_dict, RowProxy)
 
+        # the JSON columns were decoded once, by the result processors of their types
         for obj_field, db_schema_field in field_mapping.items():
             if is_row_proxy:
                 column_name = getattr(db_table.c, db_schema_field)
@@ -562,9 +1450,6 @@ class DatabaseBackend(BaseBackend):
             if column_name in schema_dict:
                 data = schema_dict[column_name]
 
-                if self._need_to_parse_json(db_schema_field, data):
-                    data = json.loads(data)
-
                 # SQLAlchemy requires datetime fields to be datetime instances
                 if obj_field in Model._datetime_fields:
                     data = self._get_datetime_obj(data)
@@ -578,10 +1463,7 @@ class DatabaseBackend(BaseBackend):
             other_data_column_name = 'other_data'
 
         if other_data_column_name in schema_dict and schema_dict[other_data_column_name] is not None:
-            other_data = schema_dict[other_data_column_name]
-            if self._need_to_parse_json('other_data', other_data):
-                other_data = json.loads(other_data)
-            obj_dict.update(other_data)
+            obj_dict.update(schema_dict[other_data_column_name])
 
         return obj_dict
 
@@ -614,6 +1496,9 @@ class DatabaseBackend(BaseBackend):
     def _get_db_compatiable_date_string(self, datetime_instance):
         datetime_instance = self._get_datetime_obj(datetime_instance)
 
+        if self.engine.dialect.name == 'sqlite':
+            # SQLite's DateTime type only accepts datetime objects
+            return datetime_instance.replace(tzinfo=None, microsecond=0)
         return datetime_instance.strftime('%Y-%m-%d %H:%M:%S')
 
     def _flatten(self, list_of_lists):
@@ -627,6 +1512,20 @@ class DatabaseBackend(BaseBackend):
 
         return obj_dict
 
+    def _get_parsed_and_validated_activity_dict(self, activity):
+        # Sub-activities live in their own tables, and a stored activity keeps the time it was last updated
+        activity = dict(((key, value,) for key, value in activity.items() if key not in Activity._response_fields))
+        updated = activity.get('updated')
+
+        activity = Activity(activity, backend=self)
+
+        activity.validate()
+        activity_dict = activity.get_parsed_dict()
+        if updated:
+            activity_dict['updated'] = updated
+
+        return activity_dict
+
     def _get_select_multiple_sub_activities_query(self, sub_activity_attribute, activity_ids):
         sub_activity_table = self._get_sub_activity_table(sub_activity_attribute)
         objects_table = self.objects_table
@@ -0,0 +1,222 @@
+"""
+Captures the SQL statements ``DatabaseBackend`` issues, with their row counts and timing, and optionally
+the query plan the database chose for them.
+
+Example::
+
+    with backend.capture_queries(explain=True) as capture:
+        client.get_activities(activity_ids, audience_targeting={'to': ['1234']})
+
+    print(capture.report())
+    for query in capture.queries:
+        if query.warnings:
+            ...
+
+Plans are read with ``EXPLAIN`` on MySQL and PostgreSQL and ``EXPLAIN QUERY PLAN`` on SQLite, on the same
+connection and in the same transaction as the statement, right after it ran. Only ``SELECT`` statements
+are explained, and a plan that cannot be read is reported as a warning of the query rather than raised. On
+PostgreSQL, where a failed statement aborts the transaction it ran in, the ``EXPLAIN`` runs in a savepoint
+that is rolled back if it fails.
+Statements issued by other threads while capturing are captured too.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from timeit import default_timer
+
+from sqlalchemy import event
+
+__all__ = ('CapturedQuery', 'QueryCapture', )
+
+_EXPLAIN_PREFIXES = {
+    'mysql': 'EXPLAIN ',
+    'postgresql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+
+# the dialects whose transactions a failed ``EXPLAIN`` would abort
+_SAVEPOINT_DIALECTS = frozenset(['postgresql'])
+_SAVEPOINT = 'sunspear_explain'
+
+
+class CapturedQuery(object):
+    """
+    A statement issued while capturing.
+
+    :ivar statement: the SQL, as sent to the database
+    :ivar parameters: the parameters bound to the statement
+    :ivar duration: how long the statement took, in seconds
+    :ivar rowcount: the number of rows the database reported, or ``None`` if the driver does not report it,
+        like SQLite for ``SELECT`` statements
+    :ivar executemany: ``True`` if the statement was run once for each of many parameter sets
+    :ivar plan: a list of dicts, one for every row of the query plan, or ``None`` if it was not explained
+    :ivar warnings: a list of problems found in the plan, like full table scans
+    """
+    def __init__(self, statement, parameters, duration, rowcount, executemany=False):
+        self.statement = statement
+        self.parameters = parameters
+        self.duration = duration
+        self.rowcount = rowcount
+        self.executemany = executemany
+        self.plan = None
+        self.warnings = []
+
+    @property
+    def is_select(self):
+        return self.statement.lstrip().upper().startswith('SELECT')
+
+    def __repr__(self):
+        return '<CapturedQuery {:.3f}ms {!r}>'.format(self.duration * 1000, self.statement[:60])
+
+
+class QueryCapture(object):
+    """
+    A context manager capturing the statements issued through ``engines``. Use
+    ``DatabaseBackend.capture_queries`` rather than creating one directly.
+
+    :type engines: list
+    :param engines: the ``sqlalchemy.engine.Engine`` objects to capture the statements of, e.g. the primary
+        and the read replicas
+    :type explain: boolean
+    :param explain: if ``True``, the plan of every ``SELECT`` is read and checked for full scans and
+        missing indexes
+    """
+    def __init__(self, engines, explain=False):
+        self.engines = list(engines)
+        self.explain = explain
+        self.queries = []
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for engine in self.engines:
+            event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+        return False
+
+    @property
+    def total_duration(self):
+        return sum(query.duration for query in self.queries)
+
+    @property
+    def warnings(self):
+        """
+        :return: the warnings of all queries
+        """
+        return [warning for query in self.queries for warning in query.warnings]
+
+    def report(self):
+        """
+        :return: a human readable summary of the captured statements, their plans and warnings
+        """
+        lines = ['{} statements in {:.3f}ms'.format(len(self.queries), self.total_duration * 1000)]
+        for i, query in enumerate(self.queries, 1):
+            lines.append('')
+            lines.append('#{} {:.3f}ms, {} rows{}'.format(
+                i, query.duration * 1000, '?' if query.rowcount is None else query.rowcount,
+                ', executemany' if query.executemany else ''))
+            lines.append(query.statement.strip())
+            for row in query.plan or []:
+                lines.append('  plan: ' + ', '.join('{}={}'.format(key, value) for key, value in sorted(row.items())))
+            for warning in query.warnings:
+                lines.append('  WARNING: ' + warning)
+        return '\n'.join(lines)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('sunspear_query_start', []).append(default_timer())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('sunspear_query_start')
+        if not starts:
+            # the statement started before capturing did
+            return
+        duration = default_timer() - starts.pop()
+        rowcount = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+
+        query = CapturedQuery(statement, parameters, duration, rowcount, executemany=executemany)
+        if self.explain and query.is_select and not executemany:
+            self._explain(conn, query)
+        self.queries.append(query)
+
+    def _explain(self, conn, query):
+        dialect_name = conn.dialect.name
+        prefix = _EXPLAIN_PREFIXES.get(dialect_name)
+        if prefix is None:
+            query.warnings.append('EXPLAIN is not supported for the {} dialect'.format(dialect_name))
+            return
+
+        savepoint = dialect_name in _SAVEPOINT_DIALECTS
+        # use the DBAPI connection directly so the EXPLAIN is not captured itself
+        try:
+            cursor = conn.connection.cursor()
+            try:
+                if savepoint:
+                    cursor.execute('SAVEPOINT ' + _SAVEPOINT)
+                try:
+                    cursor.execute(prefix + query.statement, query.parameters)
+                    columns = [column[0] for column in cursor.description]
+                    plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                except Exception:
+                    if savepoint:
+                        cursor.execute('ROLLBACK TO SAVEPOINT ' + _SAVEPOINT)
+                    raise
+                if savepoint:
+                    cursor.execute('RELEASE SAVEPOINT ' + _SAVEPOINT)
+                query.plan = plan
+            finally:
+                cursor.close()
+        except Exception as e:
+            # the statement itself succeeded, so its caller must not see the failure
+            query.warnings.append('EXPLAIN failed: {}'.format(e))
+            return
+
+        query.warnings.extend(_PLAN_CHECKS[dialect_name](query.plan))
+
+
+def _check_mysql_plan(plan):
+    warnings = []
+    for row in plan:
+        table = row.get('table')
+        if row.get('type') == 'ALL':
+            warnings.append('full scan of {}'.format(table))
+        elif row.get('type') == 'index':
+            warnings.append('full index scan of {}'.format(table))
+        extra = row.get('Extra') or ''
+        if 'Using filesort' in extra:
+            warnings.append('filesort for {}'.format(table))
+        if 'Using temporary' in extra:
+            warnings.append('temporary table for {}'.format(table))
+    return warnings
+
+
+def _check_postgresql_plan(plan):
+    warnings = []
+    for row in plan:
+        line = list(row.values())[0].strip()
+        if 'Seq Scan on ' in line:
+            warnings.append('full scan of {}'.format(line.split('Seq Scan on ', 1)[1].split()[0]))
+    return warnings
+
+
+def _check_sqlite_plan(plan):
+    warnings = []
+    for row in plan:
+        detail = row.get('detail') or ''
+        words = detail.split()
+        if words[:1] == ['SCAN'] and 'USING' not in words:
+            warnings.append('full scan of {}'.format(words[2] if words[1:2] == ['TABLE'] else words[1]))
+        if 'AUTOMATIC' in words:
+            warnings.append('missing index: {}'.format(detail))
+        if 'TEMP B-TREE' in detail:
+            warnings.append('temporary b-tree: {}'.format(detail))
+    return warnings
+
+
+_PLAN_CHECKS = {
+    'mysql': _check_mysql_plan,
+    'postgresql': _check_postgresql_plan,
+    'sqlite': _check_sqlite_plan,
+}
@@ -0,0 +1,82 @@
+"""
+Schema migrations for databases created by an older version of ``DatabaseBackend``.
+
+Every migration is idempotent: it inspects the database first and only changes what is missing, so it
+is safe to run on every deploy.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateIndex
+
+from . import schema
+
+__all__ = ('create_indexes', 'get_missing_indexes', )
+
+
+def get_missing_indexes(engine):
+    """
+    :type engine: ``sqlalchemy.engine.Engine``
+    :param engine: the engine of the database to inspect
+
+    :return: the ``sqlalchemy.Index`` objects declared in ``schema`` that the database does not have. An
+        index counts as present if the database has an index with the same name, or with the same columns
+        in the same order (e.g. the indexes MySQL creates for foreign keys).
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    missing = []
+    for table in schema.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        existing_indexes = inspector.get_indexes(table.name)
+        existing_names = set(index['name'] for index in existing_indexes)
+        existing_columns = set(tuple(index['column_names']) for index in existing_indexes)
+
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            columns = tuple(column.name for column in index.columns)
+            if index.name not in existing_names and columns not in existing_columns:
+                missing.append(index)
+    return missing
+
+
+def create_indexes(engine, online=True):
+    """
+    Adds the indexes declared in ``schema`` to an existing database. Tables that do not exist yet are
+    skipped; ``DatabaseBackend.create_tables`` creates them with their indexes.
+
+    :type engine: ``sqlalchemy.engine.Engine``
+    :param engine: the engine of the database to migrate
+    :type online: boolean
+    :param online: if ``True``, indexes are built without blocking writes where the database supports it:
+        ``ALGORITHM=INPLACE, LOCK=NONE`` on MySQL and ``CREATE INDEX CONCURRENTLY`` on PostgreSQL. Other
+        databases always build indexes the regular way.
+
+    :return: the names of the indexes that were created
+    """
+    created = []
+    for index in get_missing_indexes(engine):
+        _create_index(engine, index, online=online)
+        created.append(index.name)
+    return created
+
+
+def _create_index(engine, index, online=True):
+    dialect_name = engine.dialect.name
+
+    if online and dialect_name == 'mysql':
+        preparer = engine.dialect.identifier_preparer
+        statement = 'ALTER TABLE {} ADD INDEX {} ({}), ALGORITHM=INPLACE, LOCK=NONE'.format(
+            preparer.format_table(index.table), preparer.quote(index.name),
+            ', '.join(preparer.quote(column.name) for column in index.columns))
+        engine.execute(statement)
+    elif online and dialect_name == 'postgresql':
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        statement = str(CreateIndex(index).compile(dialect=engine.dialect))
+        statement = statement.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+        with engine.connect() as connection:
+            connection.execution_options(isolation_level='AUTOCOMMIT').execute(statement)
+    else:
+        index.create(engine)
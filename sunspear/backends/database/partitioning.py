@@ -0,0 +1,161 @@
+"""
+Time partitioning of the activities stored by ``DatabaseBackend``.
+
+With ``DatabaseBackend(..., partitioning=MonthlyPartitioning())`` every activity is stored in the partition
+of the calendar month (UTC) it was published in. A partition is a set of tables named after the month:
+``activities_p201601``, with the replies and likes of its activities in ``replies_p201601`` and
+``likes_p201601``, and their audience targeting in ``to_p201601``, ``bto_p201601``, ``cc_p201601`` and
+``bcc_p201601``. Objects are not partitioned. A reply or like is itself an activity stored in the partition
+of its own ``published`` time, while the row linking it to its parent lives in the partition of the parent,
+so a partition can be dropped as a whole without leaving rows that reference it.
+
+Partitions are created the first time an activity is written to them, except in a transaction: a partition
+must exist before a ``DatabaseBackend.transaction`` writes to it, see ``DatabaseBackend.create_partition``.
+
+The database's native partitioning (``PARTITION BY RANGE``) is not used: MySQL does not support foreign keys
+on partitioned tables, and PostgreSQL requires the primary key of a partitioned table to include the
+partitioning column and only supports foreign keys referencing one since version 12, while the cascading
+deletes of the schema rely on foreign keys to ``activities``. Routing to a table per month works the same on
+every database.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import datetime
+import re
+import threading
+
+from dateutil import tz
+from sqlalchemy import Column, ForeignKey, Index, MetaData, Table, UniqueConstraint
+
+from . import schema
+
+__all__ = ('MonthlyPartitioning', 'PARTITIONED_TABLES', )
+
+#: the tables that are partitioned, in the order they can be created in
+PARTITIONED_TABLES = ('activities', 'replies', 'likes', 'to', 'bto', 'cc', 'bcc', )
+
+_PARTITION_TABLE_NAME_RE = re.compile(r'^activities_(p\d{6})$')
+
+
+def _to_naive_utc(datetime_instance):
+    if datetime_instance.tzinfo is not None:
+        datetime_instance = datetime_instance.astimezone(tz.tzutc()).replace(tzinfo=None)
+    return datetime_instance
+
+
+class MonthlyPartitioning(object):
+    """
+    Partitions activities by the month they were published in. Partitions are named ``pYYYYMM``.
+
+    :ivar metadata: the ``sqlalchemy.MetaData`` the tables of the partitions are defined in
+    """
+    def __init__(self):
+        self.metadata = MetaData()
+        # the partitions reference the objects, which have to be in the same metadata
+        schema.objects_table.tometadata(self.metadata)
+
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get_name(self, published):
+        """
+        :type published: datetime
+        :param published: the time an activity was published. Naive datetimes are in UTC.
+
+        :return: the name of the partition an activity published at ``published`` belongs to
+        """
+        published = _to_naive_utc(published)
+        return 'p{:04d}{:02d}'.format(published.year, published.month)
+
+    def get_bounds(self, name):
+        """
+        :return: a tuple of the first moment of partition ``name`` and the first moment after it, as naive
+            UTC datetimes
+        """
+        year, month = int(name[1:5]), int(name[5:7])
+        start = datetime.datetime(year, month, 1)
+        if month == 12:
+            return start, datetime.datetime(year + 1, 1, 1)
+        return start, datetime.datetime(year, month + 1, 1)
+
+    def ends_before(self, name, before):
+        """
+        :return: ``True`` if partition ``name`` only holds activities published before ``before``
+        """
+        return self.get_bounds(name)[1] <= _to_naive_utc(before)
+
+    def get_partition_name_from_table_name(self, table_name):
+        """
+        :return: the name of the partition ``table_name`` is the activities table of, or ``None`` if it is not
+            the activities table of a partition
+        """
+        match = _PARTITION_TABLE_NAME_RE.match(table_name)
+        return match.group(1) if match else None
+
+    def prune(self, names, since=None, until=None):
+        """
+        :type names: list
+        :param names: names of partitions
+        :type since: datetime
+        :param since: if given, partitions that only hold activities published before ``since`` are left out
+        :type until: datetime
+        :param until: if given, partitions that only hold activities published at or after ``until`` are
+            left out
+
+        :return: the partitions in ``names`` that can hold activities published in ``[since, until)``
+        """
+        since = _to_naive_utc(since) if since is not None else None
+        until = _to_naive_utc(until) if until is not None else None
+
+        pruned = []
+        for name in names:
+            start, end = self.get_bounds(name)
+            if since is not None and end <= since:
+                continue
+            if until is not None and start >= until:
+                continue
+            pruned.append(name)
+        return pruned
+
+    def get_tables(self, name):
+        """
+        :return: a dict of the names of the partitioned tables (``activities``, ``replies``, ...) to the
+            ``sqlalchemy.Table`` of partition ``name``
+        """
+        with self._lock:
+            if name not in self._tables:
+                self._tables[name] = dict(((table_name, self._copy_table(schema.tables[table_name], name),)
+                                           for table_name in PARTITIONED_TABLES))
+            return self._tables[name]
+
+    def _copy_table(self, table, name):
+        """
+        Copies ``table`` of the schema into partition ``name``, with its foreign keys to other partitioned
+        tables pointing to the tables of the same partition.
+        """
+        partition_table_name = '{}_{}'.format(table.name, name)
+
+        args = []
+        for column in table.columns:
+            foreign_keys = [ForeignKey(self._get_target(foreign_key.target_fullname, name), ondelete=foreign_key.ondelete)
+                            for foreign_key in column.foreign_keys]
+            if foreign_keys:
+                args.append(Column(column.name, *foreign_keys, primary_key=column.primary_key, nullable=column.nullable))
+            else:
+                args.append(Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable))
+
+        for constraint in table.constraints:
+            if isinstance(constraint, UniqueConstraint):
+                args.append(UniqueConstraint(*[column.name for column in constraint.columns]))
+
+        for index in table.indexes:
+            index_name = index.name.replace('ix_{}_'.format(table.name), 'ix_{}_'.format(partition_table_name), 1)
+            args.append(Index(index_name, *[column.name for column in index.columns]))
+
+        return Table(partition_table_name, self.metadata, *args)
+
+    def _get_target(self, target_fullname, name):
+        table_name, column_name = target_fullname.split('.')
+        if table_name in PARTITIONED_TABLES:
+            table_name = '{}_{}'.format(table_name, name)
+        return '{}.{}'.format(table_name, column_name)
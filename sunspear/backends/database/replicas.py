@@ -0,0 +1,158 @@
+"""
+Routing of the reads of ``DatabaseBackend`` to read replicas.
+
+With ``DatabaseBackend(..., read_replicas=['mysql://replica1/sunspear', 'mysql://replica2/sunspear'])`` the
+statements reading activities, objects, replies and likes for ``get_activity`` and ``get_obj`` are sent to
+the replicas in turn, while every write, and every read made while writing, goes to the primary.
+
+Replicas are checked with ``SELECT 1`` every ``health_check_interval`` seconds, by the first read after the
+interval has passed. A replica that fails a check, or a read, is not used until it passes a check again; the
+failed read is retried on the primary. If ``max_lag`` is given, a MySQL or PostgreSQL replica that is more
+than ``max_lag`` seconds behind the primary also fails its check, as does one that reports no lag, e.g. a
+MySQL replica whose replication threads stopped. When no replica is healthy, reads go to the primary.
+
+Reads are sticky to the primary for ``sticky_seconds`` after a write of the same session, so a session
+reads its own writes despite replication lag. Every thread has its own session, unless another one is
+activated with ``DatabaseBackend.session``, e.g. to share one between the threads serving a user.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import itertools
+import threading
+import time
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import QueuePool
+
+__all__ = ('ReadSession', 'ReplicaSet', 'get_pool_status', )
+
+_REPLICATION_LAG_QUERIES = {
+    'mysql': 'SHOW SLAVE STATUS',
+    'postgresql': 'SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())',
+}
+
+
+class ReadSession(object):
+    """
+    Remembers when a session last wrote to the primary.
+
+    :ivar last_write: the time of the last write, as returned by ``time.time``, or ``None``
+    """
+    def __init__(self):
+        self.last_write = None
+
+    def is_sticky(self, now, sticky_seconds):
+        """
+        :return: ``True`` if the session wrote less than ``sticky_seconds`` before ``now``
+        """
+        return self.last_write is not None and now - self.last_write < sticky_seconds
+
+
+class ReplicaSet(object):
+    """
+    The engines of the read replicas, and which of them are healthy.
+
+    :type engines: list
+    :param engines: a list of tuples of a name and the ``sqlalchemy.engine.Engine`` of a replica
+    :type health_check_interval: float
+    :param health_check_interval: the number of seconds between health checks
+    :type max_lag: float
+    :param max_lag: if given, replicas more than ``max_lag`` seconds behind the primary are unhealthy
+    """
+    def __init__(self, engines, health_check_interval=10, max_lag=None, clock=time.time):
+        self.engines = list(engines)
+        self.health_check_interval = health_check_interval
+        self.max_lag = max_lag
+
+        self._clock = clock
+        self._unhealthy = set()
+        self._next_check = clock() + health_check_interval
+        self._lock = threading.Lock()
+        self._round_robin = itertools.cycle(range(len(self.engines)))
+
+    def get_engine(self):
+        """
+        :return: the engine of the next healthy replica, or ``None`` if none is healthy
+        """
+        if self._clock() >= self._next_check and self._lock.acquire(False):
+            try:
+                self.check_health()
+            finally:
+                self._lock.release()
+
+        for _ in range(len(self.engines)):
+            name, engine = self.engines[next(self._round_robin)]
+            if name not in self._unhealthy:
+                return engine
+        return None
+
+    def get_name(self, engine):
+        for name, replica_engine in self.engines:
+            if replica_engine is engine:
+                return name
+        return None
+
+    def mark_unhealthy(self, engine):
+        """
+        Stops using the replica of ``engine`` until it passes a health check.
+        """
+        self._unhealthy.add(self.get_name(engine))
+
+    def is_healthy(self, name):
+        return name not in self._unhealthy
+
+    def check_health(self):
+        """
+        Checks every replica and updates which of them are used.
+        """
+        for name, engine in self.engines:
+            if self._is_healthy(engine):
+                self._unhealthy.discard(name)
+            else:
+                self._unhealthy.add(name)
+        self._next_check = self._clock() + self.health_check_interval
+
+    def _is_healthy(self, engine):
+        try:
+            with engine.connect() as connection:
+                connection.execute('SELECT 1')
+                if self.max_lag is not None and connection.dialect.name in _REPLICATION_LAG_QUERIES:
+                    lag = _get_replication_lag(connection)
+                    # a replica that is not replicating has no lag
+                    return lag is not None and lag <= self.max_lag
+        except DBAPIError:
+            return False
+        return True
+
+
+def _get_replication_lag(connection):
+    """
+    :return: how many seconds the replica of ``connection`` is behind its primary, or ``None`` if it is not
+        replicating
+    """
+    row = connection.execute(_REPLICATION_LAG_QUERIES[connection.dialect.name]).first()
+    if row is None:
+        return None
+    if connection.dialect.name == 'mysql':
+        return row['Seconds_Behind_Master']
+    return row[0]
+
+
+def get_pool_status(engine):
+    """
+    :return: a dict of the ``size`` of the connection pool of ``engine``, the connections ``checked_out``
+        of it, the ``capacity`` it can grow to with overflow, and its ``saturation``, the fraction of the
+        capacity checked out. ``None`` if the pool is not a ``QueuePool``.
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return None
+
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    checked_out = pool.checkedout()
+    return {
+        'size': pool.size(),
+        'checked_out': checked_out,
+        'capacity': capacity,
+        'saturation': checked_out / capacity if capacity else 1.0,
+    }
@@ -1,18 +1,25 @@
-from sqlalchemy import Table, Column, DateTime, Integer, String, Text, MetaData, ForeignKey, UniqueConstraint
+from sqlalchemy import Table, Column, DateTime, Index, Integer, String, MetaData, ForeignKey, UniqueConstraint
 import types as custom_types
 
 
 metadata = MetaData()
 
+# Secondary indexes are named ``ix_<table>_<columns>``, and cover the lookups in ``db.py``: audience
+# targeting joins on ``activity`` and filters on ``object``, replies and likes are read by ``in_reply_to``
+# newest first, ``since`` scans filter on ``published``, and deleting an object cascades to the activities
+# and replies that have it as their actor, object or target. ``migrations.create_indexes`` adds them to
+# databases created before they were declared.
+
 objects_table = Table('objects', metadata,
                       Column('id', String(32), primary_key=True),
                       Column('object_type', String(256), nullable=False),
                       Column('display_name', String(256)),
-                      Column('content', Text),
+                      Column('content', custom_types.CompressedText()),
                       Column('published', DateTime(timezone=True), nullable=False),
                       Column('updated', DateTime(timezone=True)),
                       Column('image', custom_types.JSONSmallDict(4096)),
-                      Column('other_data', custom_types.JSONDict()))
+                      Column('other_data', custom_types.JSONDict()),
+                      Index('ix_objects_published', 'published'))
 
 activities_table = Table('activities', metadata,
                          Column('id', String(32), primary_key=True),
@@ -23,11 +30,16 @@ activities_table = Table('activities', metadata,
                          Column('author', ForeignKey('objects.id', ondelete='SET NULL')),
                          Column('generator', ForeignKey('objects.id', ondelete='SET NULL')),
                          Column('provider', ForeignKey('objects.id', ondelete='SET NULL')),
-                         Column('content', Text),
+                         Column('content', custom_types.CompressedText()),
                          Column('published', DateTime(timezone=True), nullable=False),
                          Column('updated', DateTime(timezone=True)),
                          Column('icon', custom_types.JSONSmallDict(4096)),
-                         Column('other_data', custom_types.JSONDict()))
+                         Column('other_data', custom_types.JSONDict()),
+                         Index('ix_activities_actor_published', 'actor', 'published'),
+                         Index('ix_activities_verb_published', 'verb', 'published'),
+                         Index('ix_activities_published', 'published'),
+                         Index('ix_activities_object', 'object'),
+                         Index('ix_activities_target', 'target'))
 
 replies_table = Table('replies', metadata,
                       Column('id', String(32), primary_key=True),
@@ -35,8 +47,10 @@ replies_table = Table('replies', metadata,
                       Column('actor', ForeignKey('objects.id', ondelete='CASCADE'), nullable=False),
                       Column('published', DateTime(timezone=True), nullable=False),
                       Column('updated', DateTime(timezone=True)),
-                      Column('content', Text),
-                      Column('other_data', custom_types.JSONDict()))
+                      Column('content', custom_types.CompressedText()),
+                      Column('other_data', custom_types.JSONDict()),
+                      Index('ix_replies_in_reply_to_published', 'in_reply_to', 'published'),
+                      Index('ix_replies_actor', 'actor'))
 
 likes_table = Table('likes', metadata,
                     Column('id', String(32), primary_key=True),
@@ -44,29 +58,38 @@ likes_table = Table('likes', metadata,
                     Column('actor', ForeignKey('objects.id', ondelete='CASCADE'), nullable=False),
                     Column('published', DateTime(timezone=True), nullable=False),
                     Column('updated', DateTime(timezone=True)),
-                    Column('content', Text),
+                    Column('content', custom_types.CompressedText()),
                     Column('other_data', custom_types.JSONDict()),
-                    UniqueConstraint('actor', 'in_reply_to'))
+                    UniqueConstraint('actor', 'in_reply_to'),
+                    Index('ix_likes_in_reply_to_published', 'in_reply_to', 'published'))
 
 to_table = Table('to', metadata,
                  Column('id', Integer, primary_key=True),
                  Column('object', ForeignKey('objects.id', ondelete='CASCADE')),
-                 Column('activity', ForeignKey('activities.id', ondelete='CASCADE')))
+                 Column('activity', ForeignKey('activities.id', ondelete='CASCADE')),
+                 Index('ix_to_activity_object', 'activity', 'object'),
+                 Index('ix_to_object_activity', 'object', 'activity'))
 
 bto_table = Table('bto', metadata,
                   Column('id', Integer, primary_key=True),
                   Column('object', ForeignKey('objects.id', ondelete='CASCADE')),
-                  Column('activity', ForeignKey('activities.id', ondelete='CASCADE')))
+                  Column('activity', ForeignKey('activities.id', ondelete='CASCADE')),
+                  Index('ix_bto_activity_object', 'activity', 'object'),
+                  Index('ix_bto_object_activity', 'object', 'activity'))
 
 cc_table = Table('cc', metadata,
                  Column('id', Integer, primary_key=True),
                  Column('object', ForeignKey('objects.id', ondelete='CASCADE')),
-                 Column('activity', ForeignKey('activities.id', ondelete='CASCADE')))
+                 Column('activity', ForeignKey('activities.id', ondelete='CASCADE')),
+                 Index('ix_cc_activity_object', 'activity', 'object'),
+                 Index('ix_cc_object_activity', 'object', 'activity'))
 
 bcc_table = Table('bcc', metadata,
                   Column('id', Integer, primary_key=True),
                   Column('object', ForeignKey('objects.id', ondelete='CASCADE')),
-                  Column('activity', ForeignKey('activities.id', ondelete='CASCADE')))
+                  Column('activity', ForeignKey('activities.id', ondelete='CASCADE')),
+                  Index('ix_bcc_activity_object', 'activity', 'object'),
+                  Index('ix_bcc_object_activity', 'object', 'activity'))
 
 tables = {
     'objects': objects_table,
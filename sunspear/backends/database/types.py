@@ -1,12 +1,82 @@
-from sqlalchemy.sql import operators
-from sqlalchemy import String
-from sqlalchemy.types import TypeDecorator, CHAR, VARCHAR, TEXT
+"""
+Column types of the schema.
+
+``CompressedText`` and ``JSONDict`` columns can be compressed transparently: after ``set_compression(1024)``,
+their values of 1024 characters or more are stored as a header character followed by the base64 of their
+zlib stream, when that is shorter. The header names the codec; values without one are read as they are, so
+rows written before compression was turned on, or by a process that has it off, are read whatever the
+setting. Compressed values are still ``TEXT``, so no migration is needed. An uncompressed value that starts
+with a header character is stored with the ``RAW_HEADER`` in front of it.
+
+Riak values are not compressed: the MapReduce phases of ``RiakBackend`` parse them as JSON on the Riak
+nodes. Use the compression of the eleveldb storage backend there.
+"""
+import base64
+import uuid
+import zlib
+
+import six
+from sqlalchemy import String, Text
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import operators
+from sqlalchemy.types import CHAR, TEXT, VARCHAR, TypeDecorator
 
-import json
-import uuid
+from sunspear import jsoncodec
+
+__all__ = ['GUID', 'CompressedText', 'JSONDict', 'JSONSmallDict', 'set_compression', 'compress_text',
+           'decompress_text']
+
+#: the header of a value compressed with zlib
+ZLIB_HEADER = u'\x01'
+#: the header of an uncompressed value that starts with a header character
+RAW_HEADER = u'\x02'
+
+_compression = {'threshold': None, 'level': 6}
+
+
+def set_compression(threshold=1024, level=6):
+    """
+    Compresses the values of ``CompressedText`` and ``JSONDict`` columns written from now on that are at least
+    ``threshold`` characters long.
+
+    :type threshold: int
+    :param threshold: the length from which values are compressed, or ``None`` to stop compressing
+    :type level: int
+    :param level: the zlib compression level, from 1 (fastest) to 9 (smallest)
 
-__all__ = ['GUID', 'JSONDict', 'JSONSmallDict']
+    :return: the previous threshold
+    """
+    previous = _compression['threshold']
+    _compression.update(threshold=threshold, level=level)
+    return previous
+
+
+def compress_text(value):
+    """
+    :return: ``value`` as it is stored, compressed if compression is on and ``value`` is long enough
+    """
+    threshold = _compression['threshold']
+    if threshold is not None and len(value) >= threshold:
+        data = value.encode('utf-8') if isinstance(value, six.text_type) else value
+        compressed = ZLIB_HEADER + base64.b64encode(zlib.compress(data, _compression['level'])).decode('ascii')
+        if len(compressed) < len(value):
+            return compressed
+
+    if value[:1] in (ZLIB_HEADER, RAW_HEADER):
+        return RAW_HEADER + value
+    return value
+
+
+def decompress_text(value):
+    """
+    :return: the value ``compress_text`` was given for the stored ``value``
+    """
+    header = value[:1]
+    if header == ZLIB_HEADER:
+        return zlib.decompress(base64.b64decode(value[1:])).decode('utf-8')
+    if header == RAW_HEADER:
+        return value[1:]
+    return value
 
 
 class GUID(TypeDecorator):
@@ -44,7 +114,8 @@ class GUID(TypeDecorator):
 
 
 class JSONEncodedSmallDict(TypeDecorator):
-    """Represents an immutable structure as a json-encoded string.
+    """Represents an immutable structure as a json-encoded string, using the codec of
+    ``sunspear.jsoncodec``.
 
     Usage::
 
@@ -62,20 +133,59 @@ class JSONEncodedSmallDict(TypeDecorator):
 
     def process_bind_param(self, value, dialect):
         if value is not None:
-            value = json.dumps(value)
+            value = jsoncodec.dumps(value)
 
         return value
 
     def process_result_value(self, value, dialect):
         if value is not None:
-            value = json.loads(value)
+            value = jsoncodec.loads(value)
         return value
 
 
 class JSONEncodedBigDict(JSONEncodedSmallDict):
+    """Represents an immutable structure as a json-encoded string, compressed if
+    ``set_compression`` is on.
+
+    """
 
     impl = TEXT
 
+    def process_bind_param(self, value, dialect):
+        value = super(JSONEncodedBigDict, self).process_bind_param(value, dialect)
+        if value is not None:
+            value = compress_text(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            value = decompress_text(value)
+        return super(JSONEncodedBigDict, self).process_result_value(value, dialect)
+
+
+class CompressedText(TypeDecorator):
+    """Text, compressed if ``set_compression`` is on.
+
+    Comparisons are made with the stored value, so they only match values that were too short to be
+    compressed.
+
+    """
+
+    impl = TEXT
+
+    def coerce_compared_value(self, op, value):
+        return Text()
+
+    def process_bind_param(self, value, dialect):
+        if value is not None:
+            value = compress_text(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            value = decompress_text(value)
+        return value
+
 
 JSONDict = JSONEncodedBigDict
 JSONSmallDict = JSONEncodedSmallDict
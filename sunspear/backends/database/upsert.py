@@ -0,0 +1,66 @@
+"""
+A multi-row ``INSERT`` that updates the rows that already exist, using the native upsert of the database:
+``INSERT ... ON DUPLICATE KEY UPDATE`` on MySQL and ``INSERT ... ON CONFLICT DO UPDATE`` on PostgreSQL and
+SQLite 3.24 or newer. Other databases do not support it; see ``supports_upsert``.
+"""
+from __future__ import absolute_import, unicode_literals
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+__all__ = ('Upsert', 'supports_upsert', )
+
+
+def supports_upsert(dialect):
+    """
+    :type dialect: ``sqlalchemy.engine.interfaces.Dialect``
+
+    :return: ``True`` if ``Upsert`` can be compiled for ``dialect``
+    """
+    if dialect.name in ('mysql', 'postgresql'):
+        return True
+    if dialect.name == 'sqlite':
+        return dialect.dbapi is not None and dialect.dbapi.sqlite_version_info >= (3, 24, 0)
+    return False
+
+
+class Upsert(Executable, ClauseElement):
+    """
+    Inserts ``rows`` into ``table``, updating the columns of the rows whose primary key already exists.
+
+    :type table: ``sqlalchemy.Table``
+    :param table: a table with a single column primary key
+    :type rows: list
+    :param rows: a list of dicts, all with the same keys
+    """
+    _execution_options = Executable._execution_options.union({'autocommit': True})
+    _returning = None
+
+    def __init__(self, table, rows):
+        self.table = table
+        self.insert = table.insert().values(rows)
+        self.primary_key = table.primary_key.columns.values()[0].name
+        self.update_columns = [column.name for column in table.columns
+                               if column.name in rows[0] and column.name != self.primary_key]
+
+
+@compiles(Upsert, 'mysql')
+def _compile_mysql_upsert(upsert, compiler, **kw):
+    preparer = compiler.preparer
+    # updating the primary key to itself makes a duplicate a no-op
+    columns = [preparer.quote(name) for name in upsert.update_columns or [upsert.primary_key]]
+    return '{} ON DUPLICATE KEY UPDATE {}'.format(
+        compiler.process(upsert.insert, **kw), ', '.join('{0} = VALUES({0})'.format(column) for column in columns))
+
+
+@compiles(Upsert, 'postgresql')
+@compiles(Upsert, 'sqlite')
+def _compile_on_conflict_upsert(upsert, compiler, **kw):
+    preparer = compiler.preparer
+    insert = compiler.process(upsert.insert, **kw)
+    if not upsert.update_columns:
+        return '{} ON CONFLICT ({}) DO NOTHING'.format(insert, preparer.quote(upsert.primary_key))
+
+    return '{} ON CONFLICT ({}) DO UPDATE SET {}'.format(
+        insert, preparer.quote(upsert.primary_key),
+        ', '.join('{0} = excluded.{0}'.format(preparer.quote(name)) for name in upsert.update_columns))
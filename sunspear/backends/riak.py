@@ -20,14 +20,40 @@ from __future__ import absolute_import
 import calendar
 import copy
 import datetime
+import random
+import threading
+import time
 import uuid
-
-from riak import RiakClient
+from collections import OrderedDict
+from contextlib import closing
+from itertools import chain
+
+import six
+from dateutil.parser import parse
+from riak import RiakClient, RiakError
+from riak.util import bytes_to_str
+from six.moves import queue
+from sunspear import jsoncodec
 from sunspear.activitystreams.models import Activity, Model, Object
-from sunspear.backends.base import SUB_ACTIVITY_MAP, BaseBackend
-from sunspear.exceptions import SunspearValidationException
+from sunspear.backends.base import CONFLICT_SKIP, SUB_ACTIVITY_MAP, BaseBackend
+from sunspear.exceptions import (SunspearNotFoundException,
+                                 SunspearRiakException,
+                                 SunspearValidationException)
+
+__all__ = ('RiakBackend', 'resolve_activity_siblings', 'encode_json', 'decode_json', )
+
+# ends the workers of ``RiakBackend._delete_keys``
+_STOP = object()
+
+# the end of the ``$key`` range queries listing every key; it sorts after any key shorter than it
+_LAST_KEY = '\xff' * 1024
 
-__all__ = ('RiakBackend', )
+# the user metadata of an activity listing the ids of the sub-activities removed from one of its
+# ``Activity._response_fields``, as a JSON list, oldest first. Only the last ``MAX_REMOVED`` ids are kept:
+# they are only needed while a sibling written before the removal can still come back, and a sibling that
+# misses more removals than that is not expected.
+REMOVED_USERMETA = 'removed_{}'
+MAX_REMOVED = 100
 
 
 JS_MAP = """
@@ -143,12 +169,113 @@ JS_REDUCE_OBJS = """
 """
 
 
+def resolve_activity_siblings(riak_object):
+    """
+    Resolves the siblings of an activity written by concurrent clients. The sibling modified last is kept,
+    with the ``replies`` and ``likes`` of all of the siblings, less the ones any of them removed. The last
+    ``MAX_REMOVED`` removed sub-activities are remembered in the ``REMOVED_USERMETA`` of the activity, so
+    they are not brought back by a sibling that still has them.
+
+    :type riak_object: RiakObject
+    :param riak_object: an activity with more than one sibling
+    """
+    siblings = riak_object.siblings
+    latest = max(siblings, key=lambda sibling: sibling.last_modified or 0)
+    data = copy.deepcopy(latest.data)
+    usermeta = dict(latest.usermeta)
+
+    for field in Activity._response_fields:
+        removed = []
+        for sibling in siblings:
+            removed.extend(_get_removed(sibling.usermeta, field))
+        if removed:
+            _set_removed(usermeta, field, removed)
+        removed = set(removed)
+
+        collections = [sibling.data[field] for sibling in siblings if sibling.data and field in sibling.data]
+        if not collections:
+            continue
+
+        items = OrderedDict()
+        for collection in collections:
+            for item in collection['items']:
+                if item['id'] not in removed:
+                    items.setdefault(item['id'], item)
+        # the newest sub-activity is at the top of the list
+        items = sorted(items.values(), key=lambda item: item.get('published'), reverse=True)
+        if items:
+            data[field] = {'totalItems': len(items), 'items': items}
+        else:
+            data.pop(field, None)
+
+    riak_object.siblings = [latest]
+    riak_object.data = data
+    riak_object.usermeta = usermeta
+
+
+def _get_removed(usermeta, field):
+    """
+    :return: the ids of the sub-activities removed from ``field``, oldest first
+    """
+    return jsoncodec.loads(usermeta.get(REMOVED_USERMETA.format(field), '[]'))
+
+
+def _set_removed(usermeta, field, removed):
+    """
+    Sets the ids of the sub-activities removed from ``field`` in ``usermeta``, keeping the last ``MAX_REMOVED``.
+
+    :type removed: list
+    :param removed: ids, oldest first. Only the last occurrence of an id is kept.
+    """
+    removed = list(reversed(OrderedDict.fromkeys(reversed(removed))))
+    usermeta[REMOVED_USERMETA.format(field)] = jsoncodec.dumps(removed[-MAX_REMOVED:])
+
+
+def encode_json(data):
+    """
+    Encodes the value of a ``RiakObject`` with ``sunspear.jsoncodec``, as UTF-8 JSON like the default encoder of
+    ``RiakClient``.
+    """
+    data = jsoncodec.dumps(data, ensure_ascii=False)
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+    return data
+
+
+def decode_json(data):
+    """
+    Decodes the value of a ``RiakObject`` with ``sunspear.jsoncodec``.
+    """
+    return jsoncodec.loads(bytes_to_str(data))
+
+
 class RiakBackend(BaseBackend):
+    """
+    Stores objects and activities in riak. Replies and likes are embedded in the activity they were
+    made on.
+
+    Updates of activities, including adding and removing replies and likes, are conditional writes
+    with the vector clock the activity was read with. The backend enables ``allow_mult`` on the activities
+    bucket before it first updates an activity, so riak keeps writes racing with each other as siblings,
+    which are merged by ``resolve_activity_siblings``. Siblings are merged when an activity is updated; until then,
+    ``get_activity`` returns one of them.
+    Failed updates are retried up to ``max_retries`` times, after a random delay of up to
+    ``retry_backoff`` seconds that doubles with every retry.
+    """
     def __init__(
         self, protocol="pbc", nodes=[], objects_bucket_name="objects",
-            activities_bucket_name="activities", **kwargs):
+            activities_bucket_name="activities", client=None, instrumentation=None, max_retries=3,
+            retry_backoff=0.01, **kwargs):
 
-        self._riak_backend = RiakClient(protocol=protocol, nodes=nodes)
+        # ``client`` takes an already configured ``RiakClient``, e.g. ``sunspear.testing.fakeriak.FakeRiakClient``
+        self._riak_backend = client if client is not None else RiakClient(protocol=protocol, nodes=nodes)
+        if instrumentation is not None:
+            self.set_instrumentation(instrumentation)
+
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff
+        self._random = random.Random()
+        self._siblings_enabled = False
 
         r_value = kwargs.get("r")
         w_value = kwargs.get("w")
@@ -158,6 +285,10 @@ class RiakBackend(BaseBackend):
 
         self._objects = self._riak_backend.bucket(objects_bucket_name)
         self._activities = self._riak_backend.bucket(activities_bucket_name)
+        self._activities.resolver = resolve_activity_siblings
+        for bucket in (self._objects, self._activities):
+            bucket.set_encoder('application/json', encode_json)
+            bucket.set_decoder('application/json', decode_json)
 
         if r_value:
             self._objects.r = r_value
@@ -181,33 +312,293 @@ class RiakBackend(BaseBackend):
 
     def clear_all(self, **kwargs):
         """
-        Deletes all activity stream data from riak
+        Deletes all activity stream data from riak. See ``clear_all_objects`` for the options.
         """
-        self.clear_all_activities()
-        self.clear_all_objects()
+        self.clear_all_activities(**kwargs)
+        self.clear_all_objects(**kwargs)
 
     def clear_all_objects(self, **kwargs):
         """
-        Deletes all objects data from riak
+        Deletes all objects data from riak. See ``_purge_bucket`` for the options.
+
+        :return: the number of objects deleted
         """
-        for key in self._objects.get_keys():
-            self._objects.get(key).delete(r='all', w='all', dw='all')
-            assert not self._objects.get(key).exists
+        return self._purge_bucket(self._objects, **kwargs)
 
     def clear_all_activities(self, **kwargs):
         """
-        Deletes all activities data from riak
+        Deletes all activities data from riak. See ``_purge_bucket`` for the options.
+
+        :return: the number of activities deleted
+        """
+        return self._purge_bucket(self._activities, **kwargs)
+
+    def _purge_bucket(self, bucket, concurrency=10, batch_size=1000, sample_size=100, progress=None, **kwargs):
+        """
+        Deletes every key of ``bucket``. Keys are streamed from riak and deleted by ``concurrency`` threads,
+        without fetching them first. Once all keys are deleted, a random sample of them is read back with
+        ``r='all'`` to verify they are gone.
+
+        :type concurrency: int
+        :param concurrency: the number of deletes in flight at once
+        :type batch_size: int
+        :param batch_size: the number of keys streamed at once. ``progress`` is called after every batch.
+        :type sample_size: int
+        :param sample_size: the number of deleted keys read back
+        :type progress: callable
+        :param progress: called with the number of keys deleted so far
+
+        :raises: ``SunspearRiakException`` if a key could not be deleted, or a sampled key still exists
+        :return: the number of keys deleted
+        """
+        sample = []
+        seen = [0]
+
+        def sample_keys(keys):
+            # reservoir sampling, as the keys are never all in memory at once
+            for key in keys:
+                seen[0] += 1
+                if len(sample) < sample_size:
+                    sample.append(key)
+                else:
+                    i = self._random.randint(0, seen[0] - 1)
+                    if i < sample_size:
+                        sample[i] = key
+                yield key
+
+        batches = self._iter_key_batches(bucket, batch_size=batch_size)
+        try:
+            deleted = self._delete_keys(
+                bucket, (sample_keys(keys) for keys in batches), concurrency=concurrency, progress=progress)
+        finally:
+            self._clear_cached()
+
+        self._count_requests('get', len(sample))
+        for riak_obj in bucket.multiget(sample, r='all') if sample else []:
+            if isinstance(riak_obj, tuple):
+                raise SunspearRiakException("Failed to fetch {}: {}".format(riak_obj[2], riak_obj[3]))
+            if riak_obj.exists:
+                raise SunspearRiakException("{} still exists after it was deleted".format(riak_obj.key))
+
+        return deleted
+
+    def _delete_keys(self, bucket, key_batches, concurrency=10, progress=None):
+        """
+        Deletes keys of ``bucket`` with a pool of ``concurrency`` threads. Batches are handed to the threads
+        as they are taken from ``key_batches``, so at most ``concurrency`` keys are in flight and ``key_batches``
+        can be a stream.
+
+        :type key_batches: iterable
+        :param key_batches: lists of keys
+        :type progress: callable
+        :param progress: called with the number of keys deleted so far after every batch
+
+        :raises: ``SunspearRiakException`` if a key could not be deleted
+        :return: the number of keys deleted
+        """
+        pending = queue.Queue(maxsize=concurrency)
+        errors = []
+
+        def delete():
+            while True:
+                key = pending.get()
+                try:
+                    if key is _STOP:
+                        return
+                    bucket.delete(key)
+                except Exception as e:
+                    errors.append((key, e,))
+                finally:
+                    pending.task_done()
+
+        workers = [threading.Thread(target=delete) for _ in range(concurrency)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        deleted = 0
+        try:
+            for keys in key_batches:
+                count = 0
+                for key in keys:
+                    pending.put(key)
+                    count += 1
+                pending.join()
+                self._count_requests('delete', count)
+                if errors:
+                    break
+
+                deleted += count
+                self.instrumentation.incr('riak.deletes', count)
+                if progress is not None:
+                    progress(deleted)
+        finally:
+            for _ in workers:
+                pending.put(_STOP)
+            for worker in workers:
+                worker.join()
+
+        if errors:
+            raise SunspearRiakException("Failed to delete {} keys, e.g. {}: {}".format(
+                len(errors), errors[0][0], errors[0][1]))
+        return deleted
+
+    def iter_objects(self, batch_size=1000, since=None, after=None, **kwargs):
+        """
+        Iterates over all objects in riak, ordered by key. Keys are listed from the ``$key`` index and the
+        objects are fetched ``batch_size`` at a time. There is no index of ``published``, so with ``since``
+        every object is still fetched, and the ones published before it are skipped.
+        """
+        return self._iter_bucket(self._objects, batch_size=batch_size, since=since, after=after)
+
+    def iter_activities(self, batch_size=1000, since=None, after=None, **kwargs):
+        """
+        Iterates over all activities in riak, ordered by key. Keys are listed from the ``$key`` index and the
+        activities are fetched ``batch_size`` at a time. There is no index of ``published``, so with ``since``
+        every activity is still fetched, and the ones published before it are skipped.
+        """
+        return self._iter_bucket(self._activities, batch_size=batch_size, since=since, after=after)
+
+    def _iter_bucket(self, bucket, batch_size=1000, since=None, after=None):
+        since_timestamp = None if since is None else self._get_timestamp(self._parse_datetime(since))
+        for keys in self._iter_sorted_key_batches(bucket, batch_size=batch_size, after=after):
+            self._count_requests('get', len(keys))
+            riak_objs = {}
+            for riak_obj in bucket.multiget(keys):
+                if isinstance(riak_obj, tuple):
+                    raise SunspearRiakException("Failed to fetch {}: {}".format(riak_obj[2], riak_obj[3]))
+                riak_objs[riak_obj.key] = riak_obj
+
+            # in the order of the keys rather than the order the fetches finished in
+            for key in keys:
+                riak_obj = riak_objs[key]
+                if riak_obj.exists and (since_timestamp is None or self._published_since(riak_obj.data, since_timestamp)):
+                    yield riak_obj.data
+
+    def _published_since(self, data, since_timestamp):
+        published = data.get('published')
+        return bool(published) and self._get_timestamp(self._parse_datetime(published)) >= since_timestamp
+
+    def _iter_key_batches(self, bucket, batch_size=1000):
+        """
+        Streams the keys of ``bucket`` in lists of at most ``batch_size`` keys, without ever
+        listing all keys in memory.
+        """
+        self._count_requests('stream_keys')
+        return self._iter_stream_batches(bucket.stream_keys(), batch_size=batch_size)
+
+    def _iter_sorted_key_batches(self, bucket, batch_size=1000, after=None):
+        """
+        Lists the keys of ``bucket`` in order, in lists of at most ``batch_size`` keys, with a range query of
+        the ``$key`` index for every list. Unlike ``_iter_key_batches``, the listing is the same every time,
+        and can start after any key.
+
+        :type after: string
+        :param after: if given, only the keys sorting after it are listed
+        """
+        while True:
+            self._count_requests('get_index')
+            # the range starts at ``after`` itself
+            keys = [key for key in bucket.get_index('$key', after or '', _LAST_KEY, max_results=batch_size + 1)
+                    if key != after][:batch_size]
+            if keys:
+                yield keys
+            if len(keys) < batch_size:
+                return
+            after = keys[-1]
+
+    def _iter_stream_batches(self, stream, batch_size=1000):
+        """
+        Regroups the chunks of keys of a key or index ``stream`` in lists of at most ``batch_size`` keys,
+        and closes the stream once it is consumed.
+        """
+        batch = []
+        with closing(stream):
+            for keys in stream:
+                batch.extend(keys)
+                while len(batch) >= batch_size:
+                    yield batch[:batch_size]
+                    batch = batch[batch_size:]
+        if batch:
+            yield batch
+
+    def bulk_create_objects(self, objs, on_conflict=CONFLICT_SKIP, **kwargs):
+        """
+        Stores a batch of objects with parallel puts. When skipping conflicts, existing objects are
+        found with one parallel fetch for the whole batch.
+        """
+        self._validate_conflict_strategy(on_conflict)
+
+        riak_objs = []
+        for obj in objs:
+            obj = Object(obj, backend=self)
+            obj.validate()
+            obj_dict = obj.get_parsed_dict()
+
+            riak_obj = self._objects.new(key=self._extract_id(obj_dict))
+            riak_obj.data = obj_dict
+            riak_objs.append(self.set_general_indexes(riak_obj))
+
+        return self._bulk_store(self._objects, riak_objs, on_conflict)
+
+    def bulk_create_activities(self, activities, on_conflict=CONFLICT_SKIP, **kwargs):
         """
-        for key in self._activities.get_keys():
-            self._activities.get(key).delete(r='all', w='all', dw='all')
-            assert not self._activities.get(key).exists
+        Stores a batch of dehydrated activities with parallel puts. Replies and likes get their
+        ``inreplyto_bin`` index from the ``inReplyTo`` of their objects, which are fetched in one call.
+        """
+        self._validate_conflict_strategy(on_conflict)
+
+        parents = self._get_sub_activity_parents(activities)
+
+        riak_objs = []
+        for activity in activities:
+            updated = activity.get('updated')
+            activity = Activity(activity, backend=self)
+            activity.validate()
+            activity_dict = activity.get_parsed_dict()
+            if updated:
+                activity_dict['updated'] = updated
+
+            riak_obj = self._activities.new(key=self._extract_id(activity_dict))
+            riak_obj.data = activity_dict
+            riak_obj = self.set_activity_indexes(self.set_general_indexes(riak_obj))
+            if activity_dict['id'] in parents:
+                riak_obj = self.set_sub_item_indexes(riak_obj, activity_id=parents[activity_dict['id']][0])
+            riak_objs.append(riak_obj)
+
+        return self._bulk_store(self._activities, riak_objs, on_conflict)
+
+    def _bulk_store(self, bucket, riak_objs, on_conflict):
+        if riak_objs and on_conflict == CONFLICT_SKIP:
+            existing_keys = set()
+            self._count_requests('get', len(riak_objs))
+            for riak_obj in bucket.multiget([riak_obj.key for riak_obj in riak_objs]):
+                if isinstance(riak_obj, tuple):
+                    raise SunspearRiakException("Failed to fetch {}: {}".format(riak_obj[2], riak_obj[3]))
+                if riak_obj.exists:
+                    existing_keys.add(riak_obj.key)
+            riak_objs = [riak_obj for riak_obj in riak_objs if riak_obj.key not in existing_keys]
+
+        if riak_objs:
+            self._count_requests('store', len(riak_objs))
+            try:
+                for result in self._riak_backend.multiput(riak_objs):
+                    if isinstance(result, tuple):
+                        raise SunspearRiakException("Failed to store {}: {}".format(result[0].key, result[1]))
+            finally:
+                # some keys may have been stored even if others failed
+                self._invalidate_cached([riak_obj.key for riak_obj in riak_objs])
+
+        return len(riak_objs)
 
     def obj_exists(self, obj, **kwargs):
         obj_id = self._extract_id(obj)
+        self._count_requests('get')
         return self._objects.get(obj_id).exists
 
     def activity_exists(self, activity, **kwargs):
         activity_id = self._extract_id(activity)
+        self._count_requests('get')
         return self._activities.get(activity_id).exists
 
     def obj_create(self, obj, **kwargs):
@@ -222,6 +613,7 @@ class RiakBackend(BaseBackend):
         riak_obj.data = obj_dict
         riak_obj = self.set_general_indexes(riak_obj)
 
+        self._count_requests('store')
         riak_obj.store()
 
         #finally save the data
@@ -256,11 +648,13 @@ class RiakBackend(BaseBackend):
         for o in obj:
             objects = objects.add(object_bucket_name, self._extract_id(o))
 
+        self.instrumentation.incr('riak.mapreduce')
         results = objects.map(JS_MAP_OBJS).reduce(JS_REDUCE_OBJS).run()
         return results or []
 
     def obj_delete(self, obj, **kwargs):
         obj_id = self._extract_id(obj)
+        self._count_requests('delete')
         self._objects.new(key=obj_id).delete()
 
     def activity_create(self, activity, **kwargs):
@@ -286,6 +680,7 @@ class RiakBackend(BaseBackend):
         if activity_dict['verb'] in SUB_ACTIVITY_MAP:
             riak_obj = self.set_sub_item_indexes(riak_obj, **kwargs)
 
+        self._count_requests('store')
         riak_obj.store()
 
         return self.dehydrate_activities([riak_obj.data])[0]
@@ -315,19 +710,122 @@ class RiakBackend(BaseBackend):
 
         return riak_object
 
-    def activity_delete(self, activity, **kwargs):
+    def activity_delete(self, activity, concurrency=10, batch_size=1000, count_deleted=False, **kwargs):
         """
-        Deletes an activity item and all associated sub items
+        Deletes an activity item and all associated sub items. The sub items are found with their
+        ``inreplyto_bin`` index, streamed in batches of ``batch_size`` keys and deleted by ``concurrency``
+        threads, before the activity itself is deleted. The threads are only started for an activity that
+        has sub items.
+
+        :type count_deleted: bool
+        :param count_deleted: if ``True``, the activity is read before it is deleted, to tell whether it
+            existed. Riak deletes do not tell.
+
+        :return: with ``count_deleted``, the number of activities deleted, not counting their sub items:
+            ``0`` if the activity did not exist. ``None`` otherwise.
         """
-        activity_dict = self.get_activity(activity, **kwargs)[0]
-        for response_field in Activity._response_fields:
-            if response_field in activity_dict:
-                for response_item in activity_dict[response_field]['items']:
-                    self._activities.get(response_item['id']).delete()
-        self._activities.get(self._extract_id(activity_dict)).delete()
+        activity_id = str(self._extract_id(activity))
+
+        self._count_requests('stream_index')
+        sub_item_keys = self._iter_stream_batches(
+            self._activities.stream_index('inreplyto_bin', activity_id), batch_size=batch_size)
+        first_keys = next(sub_item_keys, None)
+        if first_keys is not None:
+            self._delete_keys(self._activities, chain([first_keys], sub_item_keys), concurrency=concurrency)
+
+        exists = None
+        if count_deleted:
+            self._count_requests('get')
+            exists = self._activities.get(activity_id).exists
+        self._count_requests('delete')
+        self._activities.delete(activity_id)
+        if count_deleted:
+            return 1 if exists else 0
 
     def activity_update(self, activity, **kwargs):
-        return self.activity_create(activity, **kwargs)
+        """
+        Replaces an activity with a conditional write, see ``_update_activity``. The activity is created if
+        it does not exist.
+        """
+        activity = Activity(activity, backend=self)
+
+        activity.validate()
+        activity_dict = activity.get_parsed_dict()
+
+        def replace(riak_obj):
+            riak_obj.data = copy.deepcopy(activity_dict)
+            if activity_dict['verb'] in SUB_ACTIVITY_MAP and (kwargs.get('activity_id') or not riak_obj.exists):
+                self.set_sub_item_indexes(riak_obj, **kwargs)
+
+        activity_dict = self._update_activity(self._extract_id(activity_dict), replace, create=True)
+        return self.dehydrate_activities([activity_dict])[0]
+
+    def _update_activity(self, activity_id, update, create=False):
+        """
+        Updates a stored activity with a conditional write: the activity is read with its vector clock,
+        changed by ``update`` and stored with the same vector clock, so riak can tell a write racing with
+        another one, and keep both as siblings instead of losing one. The write returns the stored
+        activity; if it came back merged with a concurrent write, or failed with a ``RiakError``, the
+        update is retried, at most ``max_retries`` times. If the last retry comes back merged too, the merged
+        activity is written back as it is.
+
+        :type update: callable
+        :param update: a function changing the data of the fetched ``RiakObject``. It is called again for
+            every retry, so it has to give the same result when it is applied twice.
+        :type create: bool
+        :param create: if ``True``, ``update`` is also called for an activity that does not exist
+
+        :raises: ``SunspearNotFoundException`` if the activity does not exist and ``create`` is ``False``
+        :return: the data of the stored activity
+        """
+        self._enable_siblings()
+        for attempt in range(self._max_retries + 1):
+            if attempt:
+                self.instrumentation.incr('riak.retries')
+                # full jitter, so clients that collided do not collide again on their retries
+                time.sleep(self._random.uniform(0, self._retry_backoff * 2 ** (attempt - 1)))
+
+            try:
+                self._count_requests('get')
+                riak_obj = self._activities.get(activity_id)
+                if not riak_obj.exists and not create:
+                    raise SunspearNotFoundException("Activity {} does not exist".format(activity_id))
+
+                update(riak_obj)
+                data = riak_obj.data
+                riak_obj = self.set_activity_indexes(self.set_general_indexes(riak_obj))
+                self._count_requests('store')
+                riak_obj.store(return_body=True)
+            except RiakError:
+                if attempt == self._max_retries:
+                    raise
+                continue
+
+            if riak_obj.data == data:
+                break
+            # a concurrent write was merged into the stored activity. Writing the merged value back
+            # replaces the siblings
+            self.instrumentation.incr('riak.siblings')
+        else:
+            # the last attempt was merged too: its merged value is written back without another retry.
+            # A write racing with it is kept as a sibling, and merged by the next read or update.
+            self._count_requests('store')
+            riak_obj.store(return_body=False)
+
+        return riak_obj.data
+
+    def _enable_siblings(self):
+        """
+        Enables ``allow_mult`` on the activities bucket if it is not, once per backend. Without siblings, the
+        last of concurrent updates of an activity wins and the others are lost.
+        """
+        if self._siblings_enabled:
+            return
+        self._count_requests('get_bucket_props')
+        if not self._activities.allow_mult:
+            self._count_requests('set_bucket_props')
+            self._activities.allow_mult = True
+        self._siblings_enabled = True
 
     def activity_get(
         self, activity_ids=[], raw_filter="", filters={}, include_public=False,
@@ -361,16 +859,20 @@ class RiakBackend(BaseBackend):
         if not activity_ids:
             return []
 
-        activities = self._get_many_activities(
-            activity_ids, raw_filter=raw_filter, filters=filters, include_public=include_public,
-            audience_targeting=audience_targeting)
+        generation = self.activity_cache.generation if self.activity_cache is not None else None
+        with self.instrumentation.span('fetch'):
+            activities = self._get_many_activities(
+                activity_ids, raw_filter=raw_filter, filters=filters, include_public=include_public,
+                audience_targeting=audience_targeting)
 
-        activities = self.dehydrate_activities(activities)
+        with self.instrumentation.span('hydrate'):
+            activities = self._hydrate_cached(activities, generation, self.dehydrate_activities)
 
         if aggregation_pipeline:
-            original_activities = copy.deepcopy(activities)
-            for aggregator in aggregation_pipeline:
-                activities = aggregator.process(activities, original_activities, aggregation_pipeline)
+            with self.instrumentation.span('aggregation'):
+                original_activities = copy.deepcopy(activities)
+                for aggregator in aggregation_pipeline:
+                    activities = aggregator.process(activities, original_activities, aggregation_pipeline)
         return activities
 
     def sub_activity_create(
@@ -381,6 +883,7 @@ class RiakBackend(BaseBackend):
         object_type = kwargs.get('object_type', sub_activity_verb)
 
         activity_id = self._extract_id(activity)
+        self._count_requests('get')
         activity_model = Activity(self._activities.get(key=activity_id).data, backend=self)
 
         sub_activity_obj, original_activity_obj = activity_model\
@@ -391,13 +894,24 @@ class RiakBackend(BaseBackend):
 
         sub_activity_obj = self.create_activity(sub_activity_obj, activity_id=original_activity_obj['id'])
 
-        original_activity_obj[sub_activity_attribute]['items'][0]['actor'] = sub_activity_obj['actor']['id']
-        original_activity_obj[sub_activity_attribute]['items'][0]['id'] = sub_activity_obj['id']
-        original_activity_obj[sub_activity_attribute]['items'][0]['published'] = sub_activity_obj['published']
-        original_activity_obj[sub_activity_attribute]['items'][0]['object']['id'] = sub_activity_obj['id']
-        original_activity_obj = self.activity_update(original_activity_obj)
+        sub_item = original_activity_obj[sub_activity_attribute]['items'][0]
+        sub_item['actor'] = sub_activity_obj['actor']['id']
+        sub_item['id'] = sub_activity_obj['id']
+        sub_item['published'] = sub_activity_obj['published']
+        sub_item['object']['id'] = sub_activity_obj['id']
 
-        return sub_activity_obj, original_activity_obj
+        # the sub-item is added to the activity as it is stored now, which may have changed since it was
+        # read above
+        def add_sub_item(riak_obj):
+            activity_data = riak_obj.data
+            collection = activity_data.setdefault(sub_activity_attribute, {'totalItems': 0, 'items': []})
+            if sub_item['id'] not in [item['id'] for item in collection['items']]:
+                collection['items'].insert(0, sub_item)
+            collection['totalItems'] = len(collection['items'])
+
+        activity_data = self._update_activity(activity_id, add_sub_item)
+
+        return sub_activity_obj, self.dehydrate_activities([activity_data])[0]
 
     def sub_activity_delete(self, sub_activity, sub_activity_verb, **kwargs):
         """
@@ -414,23 +928,31 @@ class RiakBackend(BaseBackend):
         sub_activity_model = SUB_ACTIVITY_MAP[sub_activity_verb.lower()][0]
         sub_activity_id = self._extract_id(sub_activity)
 
+        self._count_requests('get')
         sub_activity_riak_model = self._activities.get(sub_activity_id)
         if sub_activity_riak_model.data['verb'] != sub_activity_model.sub_item_verb:
             raise SunspearValidationException("Trying to delete something that is not a {}.".format(sub_activity_model.sub_item_verb))
 
         #clean up the reference from the original activity
         in_reply_to_key = filter(lambda x: x[0] == 'inreplyto_bin', sub_activity_riak_model.indexes)[0][1]
-        activity = self._activities.get(key=in_reply_to_key)
-        activity_data = activity.data
-        activity_data[sub_activity_model.sub_item_key]['totalItems'] -= 1
-        activity_data[sub_activity_model.sub_item_key]['items'] = filter(
-            lambda x: x["id"] != sub_activity_id,
-            activity_data[sub_activity_model.sub_item_key]['items'])
-
-        updated_activity = self.update_activity(activity_data, **kwargs)
+        sub_item_key = sub_activity_model.sub_item_key
+
+        def remove_sub_item(riak_obj):
+            collection = riak_obj.data.pop(sub_item_key, {'items': []})
+            collection['items'] = filter(lambda x: x["id"] != sub_activity_id, collection['items'])
+            collection['totalItems'] = len(collection['items'])
+            # like ``Activity.parse_data``, empty collections are left out
+            if collection['items']:
+                riak_obj.data[sub_item_key] = collection
+
+            usermeta = dict(riak_obj.usermeta)
+            _set_removed(usermeta, sub_item_key, _get_removed(usermeta, sub_item_key) + [sub_activity_id])
+            riak_obj.usermeta = usermeta
+
+        activity_data = self._update_activity(in_reply_to_key, remove_sub_item)
         self.delete_activity(sub_activity_id)
 
-        return updated_activity
+        return self.dehydrate_activities([activity_data])[0]
 
     def set_sub_item_indexes(self, riak_object, **kwargs):
         """
@@ -485,6 +1007,7 @@ class RiakBackend(BaseBackend):
             filters = filters or None
             results = results.reduce(JS_REDUCE_FILTER_PROP, options={'arg': {'raw_filter': raw_filter, 'filters': filters}})
 
+        self.instrumentation.incr('riak.mapreduce')
         results = results.reduce(JS_REDUCE).run()
         results = results or []
 
@@ -495,11 +1018,30 @@ class RiakBackend(BaseBackend):
 
         return reordered_results
 
-    def _get_timestamp(self):
+    def _count_requests(self, operation, count=1):
+        """
+        Counts ``count`` requests to riak other than MapReduce jobs, e.g. the gets of a ``multiget``.
+
+        :type operation: string
+        :param operation: ``get``, ``store``, ``delete``, ``get_index``, ``stream_keys`` or ``stream_index``
+        """
+        if count:
+            self.instrumentation.incr('riak.requests', count, operation=operation)
+
+    def _parse_datetime(self, value):
+        """
+        :return: ``value`` if it is a ``datetime``, else the ``datetime`` of the string ``value``
+        """
+        if isinstance(value, datetime.datetime):
+            return value
+        return parse(value)
+
+    def _get_timestamp(self, dt_obj=None):
         """
-        returns a unix timestamp representing the ``datetime`` object
+        returns a unix timestamp representing the ``datetime`` object. Defaults to the current time.
         """
-        dt_obj = datetime.datetime.utcnow()
+        if dt_obj is None:
+            dt_obj = datetime.datetime.utcnow()
         return long((calendar.timegm(dt_obj.utctimetuple()) * 1000)) + (dt_obj.microsecond / 1000)
 
     def get_new_id(self):
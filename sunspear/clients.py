@@ -93,6 +93,15 @@ class SunspearClient(object):
         """
         return self._backend.delete_activity(activity_id, **kwargs)
 
+    def delete_activities(self, activity_ids, **kwargs):
+        """
+        Deletes a batch of activity items and all their associated sub items
+
+        :type activity_ids: list
+        :param activity_ids: the ids of the activities to delete
+        """
+        return self._backend.delete_activities(activity_ids, **kwargs)
+
     def delete_reply(self, activity_id, **kwargs):
         """
         Deletes a ``reply`` made on an activity. This will also update the corresponding activity.
@@ -130,6 +139,47 @@ class SunspearClient(object):
         """
         return self._backend.get_activity(activity_ids=activity_ids, **kwargs)
 
+    def get_activities_json(self, activity_ids=[], **kwargs):
+        """
+        Gets a list of activities, encoded to JSON. Takes the same arguments as ``get_activities``.
+
+        :type activity_ids: list
+        :param activity_ids: The list of activities you want to retrieve
+        :return: the JSON array of the activities, as UTF-8 encoded bytes
+        """
+        return self._backend.get_activity_json(activity_ids=activity_ids, **kwargs)
+
+    def stream_activities(self, activity_ids, **kwargs):
+        """
+        Lazily gets activities in batches. Useful for exports and backfills where the full list of
+        activities would not fit in memory. Please see ``stream_activities`` of the backend for all
+        ``kwargs`` supported.
+
+        :type activity_ids: iterable
+        :param activity_ids: An iterable of ids of the activities you want to retrieve
+        :return: an iterator of activities
+        """
+        return self._backend.stream_activities(activity_ids, **kwargs)
+
+    def iter_objects(self, **kwargs):
+        """
+        Iterates over every object in the backend in bounded batches. Please see ``iter_objects`` of the
+        backend for all ``kwargs`` supported.
+
+        :return: an iterator of objects
+        """
+        return self._backend.iter_objects(**kwargs)
+
+    def iter_activities(self, **kwargs):
+        """
+        Iterates over every activity in the backend in bounded batches. Activities are returned as they are
+        stored, i.e. with references to their objects. Please see ``iter_activities`` of the backend for all
+        ``kwargs`` supported.
+
+        :return: an iterator of activities
+        """
+        return self._backend.iter_activities(**kwargs)
+
     def get_backend(self):
         """
         The backend the client was initialized with.
@@ -0,0 +1,58 @@
+"""
+Streams the contents of a backend out as `JSON Lines <http://jsonlines.org/>`_, for backups,
+reindexing and analytics jobs.
+
+Every line is a JSON document of the form ``{"kind": "object", "data": {...}}`` or
+``{"kind": "activity", "data": {...}}``. All objects are written before any activities, so a
+dump can be loaded back in a single pass.
+"""
+from __future__ import absolute_import
+
+import json
+
+__all__ = ('iter_records', 'dump_jsonl', )
+
+OBJECT_KIND = 'object'
+ACTIVITY_KIND = 'activity'
+
+
+def iter_records(backend, batch_size=1000, since=None):
+    """
+    Iterates over every object and then every activity in ``backend`` as export records.
+
+    :type backend: ``sunspear.backends.base.BaseBackend``
+    :param backend: the backend to export
+    :type batch_size: int
+    :param batch_size: the number of items fetched from the backend in one round trip
+    :type since: datetime
+    :param since: if provided, only items published on or after this time are exported
+    """
+    for obj in backend.iter_objects(batch_size=batch_size, since=since):
+        yield {'kind': OBJECT_KIND, 'data': obj}
+
+    for activity in backend.iter_activities(batch_size=batch_size, since=since):
+        yield {'kind': ACTIVITY_KIND, 'data': activity}
+
+
+def dump_jsonl(backend, fp, batch_size=1000, since=None):
+    """
+    Writes every object and activity in ``backend`` to the file-like object ``fp``, one JSON
+    document per line. Memory use is bounded by ``batch_size``.
+
+    :type backend: ``sunspear.backends.base.BaseBackend``
+    :param backend: the backend to export
+    :type fp: file
+    :param fp: a file-like object opened for writing
+    :type batch_size: int
+    :param batch_size: the number of items fetched from the backend in one round trip
+    :type since: datetime
+    :param since: if provided, only items published on or after this time are exported
+
+    :return: the number of records written
+    """
+    count = 0
+    for record in iter_records(backend, batch_size=batch_size, since=since):
+        fp.write(json.dumps(record, separators=(',', ':')))
+        fp.write('\n')
+        count += 1
+    return count
@@ -0,0 +1,180 @@
+"""
+Encoding of hydrated activities to JSON, reusing the encoding of the large objects they embed.
+
+A feed embeds the same actors and objects in many activities. ``FragmentEncoder`` encodes every object once
+into a JSON fragment and caches the fragments of the large ones. A page of activities is encoded with one call
+to the JSON codec, with placeholders for the cached fragments, which are then put in their place. Small objects
+are encoded with the rest of the page: the codec encodes them faster than their fragments can be put back.
+
+Looking for the objects of a page has a cost of its own, so the encoder is only worth it for feeds whose objects
+are mostly larger than ``min_size``, e.g. users with long profiles. It is off by default::
+
+    from sunspear.fragments import FragmentEncoder
+
+    backend.set_fragment_encoder(FragmentEncoder(min_size=2048))
+
+A fragment is used while the object it was encoded from has the same ``updated`` and ``published`` times.
+The backend drops the fragment of an object it updates or deletes; fragments of objects changed by other
+processes are used for at most ``max_age`` seconds.
+"""
+from __future__ import absolute_import
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import six
+from sunspear import jsoncodec
+from sunspear.activitystreams.models import Activity
+
+__all__ = ('FragmentEncoder', )
+
+_OBJECT_FIELDS = frozenset(Activity._object_fields + Activity._direct_audience_targeting_fields
+                           + Activity._indirect_audience_targeting_fields)
+_RESPONSE_FIELDS = frozenset(Activity._response_fields)
+
+
+def _to_bytes(data):
+    return data.encode('utf-8') if isinstance(data, six.text_type) else data
+
+
+class FragmentEncoder(object):
+    """
+    Encodes activities to JSON with a cache of the fragments of the large objects they embed.
+
+    :type max_size: int
+    :param max_size: the number of objects kept; the oldest are dropped first
+    :type max_age: float
+    :param max_age: the number of seconds a fragment is used for, or ``None`` to use it until it is dropped
+    :type min_size: int
+    :param min_size: the size, in bytes, of the JSON of an object from which its fragment is reused
+    """
+    def __init__(self, max_size=10000, max_age=60, min_size=2048, clock=time.time):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.min_size = min_size
+
+        self._clock = clock
+        # object id -> (version, fragment, or ``None`` for an object smaller than ``min_size``, time encoded)
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode_activities(self, activities):
+        """
+        :type activities: list
+        :param activities: hydrated activities, as returned by ``get_activity``
+
+        :return: the JSON array of ``activities``, as bytes
+        """
+        fragments = []
+        # unique to the call, so no value of the activities can be mistaken for a placeholder
+        prefix = '__fragment_{}_'.format(uuid.uuid4().hex)
+        now = self._clock()
+        activities = [self._replace_objects(activity, fragments, prefix, now) for activity in activities]
+        return _splice(_dumps(activities), fragments, prefix)
+
+    def encode_activity(self, activity):
+        """
+        :return: the JSON of ``activity``, as bytes
+        """
+        return self.encode_activities([activity])[1:-1]
+
+    def invalidate(self, obj_id):
+        """
+        Drops the fragment of the object ``obj_id``.
+        """
+        with self._lock:
+            self._fragments.pop(obj_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def _replace_objects(self, activity, fragments, prefix, now):
+        """
+        :return: ``activity`` with placeholders for the objects that have a fragment, in a copy if there are
+            any, also in its replies and likes. The fragments are appended to ``fragments``.
+        """
+        if not isinstance(activity, dict):
+            return activity
+
+        replaced = {}
+        for key in _OBJECT_FIELDS.intersection(activity):
+            value = activity[key]
+            if isinstance(value, dict):
+                obj = self._replace_object(value, fragments, prefix, now)
+                if obj is not value:
+                    replaced[key] = obj
+            elif isinstance(value, list):
+                objs = [self._replace_object(obj, fragments, prefix, now) for obj in value]
+                if any(obj is not item for obj, item in zip(objs, value)):
+                    replaced[key] = objs
+
+        for key in _RESPONSE_FIELDS.intersection(activity):
+            value = activity[key]
+            if isinstance(value, dict) and value.get('items'):
+                items = [self._replace_objects(item, fragments, prefix, now) for item in value['items']]
+                if any(item is not original for item, original in zip(items, value['items'])):
+                    replaced[key] = dict(value, items=items)
+
+        if not replaced:
+            return activity
+        activity = dict(activity)
+        activity.update(replaced)
+        return activity
+
+    def _replace_object(self, value, fragments, prefix, now):
+        # stored objects always have a published time, unlike the references to sub-activities
+        if not isinstance(value, dict) or 'id' not in value or 'published' not in value:
+            return value
+        fragment = self._get_fragment(value, now)
+        if fragment is None:
+            return value
+        fragments.append(fragment)
+        return prefix + str(len(fragments) - 1)
+
+    def _get_fragment(self, obj, now):
+        """
+        :return: the fragment of ``obj``, or ``None`` if it is smaller than ``min_size``
+        """
+        obj_id, version = obj['id'], (obj.get('updated'), obj['published'],)
+        # reading a dict is atomic, only writes take the lock
+        cached = self._fragments.get(obj_id)
+        if cached is not None and cached[0] == version and (self.max_age is None or now - cached[2] < self.max_age):
+            return cached[1]
+
+        fragment = _dumps(obj)
+        if len(fragment) < self.min_size:
+            fragment = None
+        with self._lock:
+            self._fragments.pop(obj_id, None)
+            self._fragments[obj_id] = (version, fragment, now,)
+            while len(self._fragments) > self.max_size:
+                self._fragments.popitem(last=False)
+        return fragment
+
+
+def _dumps(value):
+    # ASCII JSON is also valid UTF-8
+    return _to_bytes(jsoncodec.dumps(value))
+
+
+def _splice(data, fragments, prefix):
+    """
+    :type data: bytes
+    :param data: JSON with the placeholders ``"<prefix><index>"``
+    :type fragments: list
+    :param fragments: the JSON of the values of the placeholders, by index
+
+    :return: ``data`` with every placeholder replaced by its fragment
+    """
+    if not fragments:
+        return data
+    parts = data.split(b'"' + prefix.encode('ascii'))
+    spliced = [parts[0]]
+    for part in parts[1:]:
+        index, rest = part.split(b'"', 1)
+        spliced.append(fragments[int(index)])
+        spliced.append(rest)
+    return b''.join(spliced)
@@ -0,0 +1,222 @@
+"""
+Bulk loads `JSON Lines <http://jsonlines.org/>`_ dumps written by ``sunspear.export`` into a backend.
+
+Records are written in batches through the backend's ``bulk_create_*`` methods instead of
+``create_activity``, so there are no per-record existence checks. Loading happens in phases: all
+objects, then all activities with their audience targeting, then a second pass over the dump links
+replies and likes to the activities they were made on. Each phase finishes before the next one starts,
+so rows are never written before the rows they reference.
+
+The same functionality is available on the command line as ``sunspear-import``.
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import sys
+import time
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from sunspear.backends.base import (CONFLICT_SKIP, CONFLICT_STRATEGIES,
+                                    SUB_ACTIVITY_MAP)
+from sunspear.exceptions import SunspearInvalidConfigurationError
+from sunspear.export import ACTIVITY_KIND, OBJECT_KIND
+
+__all__ = ('ImportProgress', 'load_jsonl', 'main', )
+
+SUB_ACTIVITY_KIND = 'sub_activity'
+
+
+class ImportProgress(object):
+    """
+    Counts the records written by ``load_jsonl`` and their throughput.
+    """
+    def __init__(self):
+        self.started_at = time.time()
+        self.counts = {OBJECT_KIND: 0, ACTIVITY_KIND: 0, SUB_ACTIVITY_KIND: 0}
+        self.records_read = 0
+
+    def add(self, kind, count):
+        self.counts[kind] += count
+
+    @property
+    def written(self):
+        return sum(self.counts.values())
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started_at
+
+    @property
+    def throughput(self):
+        """
+        Records read per second.
+        """
+        elapsed = self.elapsed
+        return self.records_read / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return "read {} records in {:.1f}s ({:.0f}/s): {} objects, {} activities, {} sub-activities written".format(
+            self.records_read, self.elapsed, self.throughput, self.counts[OBJECT_KIND],
+            self.counts[ACTIVITY_KIND], self.counts[SUB_ACTIVITY_KIND])
+
+
+class _BatchWriter(object):
+    """
+    Writes batches on a pool of worker threads, keeping at most ``max_pending`` batches in flight so
+    memory stays bounded no matter how large the dump is.
+    """
+    def __init__(self, pool, max_pending, progress, callback=None):
+        self._pool = pool
+        self._max_pending = max_pending
+        self._progress = progress
+        self._callback = callback
+        self._pending = deque()
+
+    def submit(self, kind, func, batch, on_conflict, done=None):
+        """
+        :type done: callable
+        :param done: called once ``batch`` and every batch submitted before it have been written
+        """
+        if len(self._pending) >= self._max_pending:
+            self._wait_for_oldest()
+        self._pending.append((kind, self._pool.apply_async(func, (batch,), {'on_conflict': on_conflict}), done,))
+
+    def wait(self):
+        while self._pending:
+            self._wait_for_oldest()
+
+    def _wait_for_oldest(self):
+        kind, result, done = self._pending.popleft()
+        self._progress.add(kind, result.get())
+        if done is not None:
+            done()
+        if self._callback is not None:
+            self._callback(self._progress)
+
+
+def _iter_records(fp):
+    for line in fp:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def load_jsonl(backend, fp, batch_size=500, on_conflict=CONFLICT_SKIP, workers=4, progress_callback=None):
+    """
+    Loads a JSON Lines dump into ``backend``.
+
+    :type backend: ``sunspear.backends.base.BaseBackend``
+    :param backend: the backend to load the records into
+    :type fp: file
+    :param fp: a file-like object containing the dump. It is read twice, so it must support ``seek``.
+    :type batch_size: int
+    :param batch_size: the number of records written to the backend in one batch
+    :type on_conflict: string
+    :param on_conflict: ``skip`` leaves records that already exist untouched, ``overwrite`` replaces them
+    :type workers: int
+    :param workers: the number of batches written concurrently
+    :type progress_callback: callable
+    :param progress_callback: called with an ``ImportProgress`` every time a batch has been written
+
+    :raises: ``SunspearInvalidConfigurationError`` if ``on_conflict`` is not a known strategy.
+    :return: an ``ImportProgress`` with the final counts
+    """
+    if on_conflict not in CONFLICT_STRATEGIES:
+        raise SunspearInvalidConfigurationError("Unknown conflict strategy {!r}".format(on_conflict))
+
+    progress = ImportProgress()
+    writers = {
+        OBJECT_KIND: backend.bulk_create_objects,
+        ACTIVITY_KIND: backend.bulk_create_activities,
+    }
+
+    pool = ThreadPool(workers)
+    try:
+        writer = _BatchWriter(pool, max_pending=workers * 2, progress=progress, callback=progress_callback)
+
+        # First pass: objects, then activities
+        current_kind = None
+        batch = []
+        for record in _iter_records(fp):
+            progress.records_read += 1
+            kind = record['kind']
+            if kind != current_kind:
+                if batch:
+                    writer.submit(current_kind, writers[current_kind], batch, on_conflict)
+                    batch = []
+                # everything of the previous kind has to be stored before anything that references it
+                writer.wait()
+                current_kind = kind
+            batch.append(record['data'])
+            if len(batch) >= batch_size:
+                writer.submit(kind, writers[kind], batch, on_conflict)
+                batch = []
+        if batch:
+            writer.submit(current_kind, writers[current_kind], batch, on_conflict)
+        writer.wait()
+
+        # Second pass: now that every activity is stored, link the replies and likes to their parents
+        fp.seek(0)
+        batch = []
+        for record in _iter_records(fp):
+            if record['kind'] == ACTIVITY_KIND and record['data'].get('verb') in SUB_ACTIVITY_MAP:
+                batch.append(record['data'])
+                if len(batch) >= batch_size:
+                    writer.submit(SUB_ACTIVITY_KIND, backend.bulk_create_sub_activities, batch, on_conflict)
+                    batch = []
+        if batch:
+            writer.submit(SUB_ACTIVITY_KIND, backend.bulk_create_sub_activities, batch, on_conflict)
+        writer.wait()
+    finally:
+        pool.close()
+        pool.join()
+
+    return progress
+
+
+def _get_backend(args):
+    if args.backend == 'database':
+        from sunspear.backends.database.db import DatabaseBackend
+        return DatabaseBackend(db_connection_string=args.db_connection_string, poolsize=args.workers)
+
+    from sunspear.backends.riak import RiakBackend
+    nodes = [{'host': host, '{}_port'.format('http' if args.riak_protocol == 'http' else 'pb'): args.riak_port}
+             for host in args.riak_host]
+    return RiakBackend(protocol=args.riak_protocol, nodes=nodes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='sunspear-import', description='Bulk load a JSON Lines dump into a sunspear backend.')
+    parser.add_argument('path', help='the JSON Lines dump to load')
+    parser.add_argument('--backend', choices=['database', 'riak'], default='database')
+    parser.add_argument('--db-connection-string', help='SQLAlchemy connection string for the database backend')
+    parser.add_argument('--riak-host', action='append', default=[], help='a riak node. Can be given more than once.')
+    parser.add_argument('--riak-port', type=int, default=8087)
+    parser.add_argument('--riak-protocol', choices=['pbc', 'http'], default='pbc')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--on-conflict', choices=CONFLICT_STRATEGIES, default=CONFLICT_SKIP)
+    args = parser.parse_args(argv)
+
+    if args.backend == 'database' and not args.db_connection_string:
+        parser.error('--db-connection-string is required for the database backend')
+    if args.backend == 'riak' and not args.riak_host:
+        args.riak_host = ['127.0.0.1']
+
+    def report(progress):
+        print(progress, file=sys.stderr)
+
+    with open(args.path, 'r') as fp:
+        progress = load_jsonl(
+            _get_backend(args), fp, batch_size=args.batch_size, on_conflict=args.on_conflict,
+            workers=args.workers, progress_callback=report)
+
+    print(progress)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
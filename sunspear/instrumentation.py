@@ -0,0 +1,235 @@
+"""
+Hooks for measuring where the time of a backend call goes.
+
+Every backend has an ``instrumentation``, which times the phases of its operations with ``span`` and
+counts events, like SQL statements or Riak MapReduce jobs, with ``incr``. The default does nothing, so
+a backend that is not instrumented pays only for a method call per phase.
+
+Spans emitted by the backends:
+
+* ``get_activity``: the whole of a ``get_activity`` call
+* ``fetch``: reading the activities from the backend, including audience targeting and filters
+* ``hydrate``: replacing the object ids of the activities with the objects
+* ``extract_object_keys``: collecting the ids of the objects to hydrate
+* ``get_obj``: reading objects
+* ``hydrate_sub_activity``: reading the replies and likes of the activities
+* ``aggregation``: running the aggregation pipeline
+
+Counters emitted by the backends:
+
+* ``db.statements``: SQL statements executed by ``DatabaseBackend``, tagged with the ``pool`` they ran on
+* ``riak.mapreduce``: MapReduce jobs run by ``RiakBackend``
+* ``riak.requests``: the other requests ``RiakBackend`` makes, tagged with the ``operation``: ``get``,
+  ``store``, ``delete``, ``get_index``, ``stream_keys`` or ``stream_index``. A multiget or multiput counts one
+  request per key.
+* ``riak.deletes``: keys deleted by ``RiakBackend`` when purging a bucket
+* ``riak.retries``: updates of activities ``RiakBackend`` retried after a failure or a concurrent write
+* ``riak.siblings``: updates of activities merged with a concurrent write by ``RiakBackend``
+* ``db.replica.errors``: reads ``DatabaseBackend`` retried on the primary because a replica failed
+* ``db.pool.saturated``: connections checked out of a pool that had none left to give
+* ``activity_cache.hits``: activities ``get_activity`` took from the ``activity_cache`` of the backend
+* ``activity_cache.misses``: activities ``get_activity`` hydrated because they were not cached
+* ``negative_cache.hits``: object ids ``get_obj`` did not read because the ``negative_cache`` of the backend
+  knows they are missing
+
+Gauges emitted by the backends:
+
+* ``db.pool.checked_out``: the connections checked out of a pool, tagged with the ``pool``
+
+Example::
+
+    import logging
+    from sunspear.instrumentation import LoggingInstrumentation
+
+    backend.set_instrumentation(LoggingInstrumentation(logging.getLogger('sunspear')))
+"""
+from __future__ import absolute_import, division
+
+import logging
+from timeit import default_timer
+
+__all__ = ('Instrumentation', 'NullInstrumentation', 'TimingInstrumentation', 'LoggingInstrumentation',
+           'StatsdInstrumentation', 'RecordingInstrumentation', )
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Instrumentation(object):
+    """
+    The interface backends report to. Subclass ``TimingInstrumentation`` to receive the duration of
+    every span, or this class to do something else when a span starts and ends.
+    """
+    def span(self, name, **tags):
+        """
+        :type name: string
+        :param name: the name of the phase
+        :param tags: extra information about the phase, e.g. the number of ids fetched
+
+        :return: a context manager around the phase
+        """
+        raise NotImplementedError()
+
+    def incr(self, name, value=1, **tags):
+        """
+        Increments the counter ``name`` by ``value``.
+        """
+        raise NotImplementedError()
+
+    def gauge(self, name, value, **tags):
+        """
+        Sets the gauge ``name`` to ``value``. Ignored unless overridden.
+        """
+        pass
+
+
+class NullInstrumentation(Instrumentation):
+    """
+    Does nothing. The default of every backend.
+    """
+    def span(self, name, **tags):
+        return _NULL_SPAN
+
+    def incr(self, name, value=1, **tags):
+        pass
+
+
+class _TimedSpan(object):
+    def __init__(self, instrumentation, name, tags):
+        self._instrumentation = instrumentation
+        self._name = name
+        self._tags = tags
+        self._start = None
+
+    def __enter__(self):
+        self._start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._instrumentation.timing(self._name, default_timer() - self._start, **self._tags)
+        return False
+
+
+class TimingInstrumentation(Instrumentation):
+    """
+    Times every span, and reports its duration to ``timing``.
+    """
+    def span(self, name, **tags):
+        return _TimedSpan(self, name, tags)
+
+    def timing(self, name, seconds, **tags):
+        """
+        Called when a span ends.
+
+        :type seconds: float
+        :param seconds: how long the span took
+        """
+        raise NotImplementedError()
+
+    def incr(self, name, value=1, **tags):
+        raise NotImplementedError()
+
+
+class LoggingInstrumentation(TimingInstrumentation):
+    """
+    Logs every span and counter.
+
+    :type logger: ``logging.Logger``
+    :param logger: the logger to log to. Defaults to the ``sunspear`` logger.
+    :type level: int
+    :param level: the level messages are logged at
+    """
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self._logger = logger if logger is not None else logging.getLogger('sunspear')
+        self._level = level
+
+    def timing(self, name, seconds, **tags):
+        if self._logger.isEnabledFor(self._level):
+            self._logger.log(self._level, "%s took %.3fms%s", name, seconds * 1000, self._format_tags(tags))
+
+    def incr(self, name, value=1, **tags):
+        if self._logger.isEnabledFor(self._level):
+            self._logger.log(self._level, "%s +%s%s", name, value, self._format_tags(tags))
+
+    def gauge(self, name, value, **tags):
+        if self._logger.isEnabledFor(self._level):
+            self._logger.log(self._level, "%s = %s%s", name, value, self._format_tags(tags))
+
+    def _format_tags(self, tags):
+        if not tags:
+            return ''
+        return ' ({})'.format(', '.join('{}={}'.format(key, value) for key, value in sorted(tags.items())))
+
+
+class StatsdInstrumentation(TimingInstrumentation):
+    """
+    Sends every span as a timer, every counter as a counter and every gauge as a gauge to a statsd
+    client, e.g. a ``statsd.StatsClient``. Statsd has no tags, so their values are appended to the name, in
+    the order of the tag names: ``riak.requests`` tagged with ``operation='get'`` is sent as
+    ``riak.requests.get``.
+
+    :param client: an object with ``timing(name, milliseconds)``, ``incr(name, count)`` and
+        ``gauge(name, value)`` methods
+    :type prefix: string
+    :param prefix: prepended to the name of every metric
+    """
+    def __init__(self, client, prefix='sunspear'):
+        self._client = client
+        self._prefix = prefix + '.' if prefix else ''
+
+    def timing(self, name, seconds, **tags):
+        self._client.timing(self._get_name(name, tags), seconds * 1000)
+
+    def incr(self, name, value=1, **tags):
+        self._client.incr(self._get_name(name, tags), value)
+
+    def gauge(self, name, value, **tags):
+        self._client.gauge(self._get_name(name, tags), value)
+
+    def _get_name(self, name, tags):
+        return self._prefix + '.'.join([name] + ['{}'.format(tags[key]) for key in sorted(tags)])
+
+
+class RecordingInstrumentation(TimingInstrumentation):
+    """
+    Keeps every span and counter in memory, for tests and benchmarks.
+
+    :ivar spans: a list of ``(name, seconds, tags)`` tuples, in the order the spans ended
+    :ivar counters: a dict of counter names to their values
+    :ivar gauges: a dict of tuples of a gauge name and its sorted tags to the last value of the gauge
+    """
+    def __init__(self):
+        self.spans = []
+        self.counters = {}
+        self.gauges = {}
+
+    def timing(self, name, seconds, **tags):
+        self.spans.append((name, seconds, tags,))
+
+    def incr(self, name, value=1, **tags):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value, **tags):
+        self.gauges[(name, tuple(sorted(tags.items())),)] = value
+
+    def span_names(self):
+        return [name for name, seconds, tags in self.spans]
+
+    def total(self, name):
+        """
+        :return: the total time spent in the spans called ``name``, in seconds
+        """
+        return sum(seconds for span_name, seconds, tags in self.spans if span_name == name)
+
+    def reset(self):
+        self.spans = []
+        self.counters = {}
+        self.gauges = {}
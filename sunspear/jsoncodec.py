@@ -0,0 +1,137 @@
+"""
+The JSON codec used for the JSON columns of ``DatabaseBackend``, like ``image``, ``icon`` and ``other_data``,
+and for the values ``RiakBackend`` stores.
+
+Codecs are registered by name. By default ``simplejson`` (with its C speedups) is used if it can be imported,
+else the standard library's ``json``, which is always available. Both give back exactly what they encoded.
+Another codec can be selected, or registered, for the whole process::
+
+    from sunspear import jsoncodec
+
+    jsoncodec.set_codec('ujson')
+
+``ujson`` is registered if it can be imported, but only used once selected: it is the fastest, but encodes
+floats with at most 15 significant digits, so it changes floats that have more.
+"""
+from __future__ import absolute_import
+
+import importlib
+import json
+from collections import OrderedDict
+
+from sunspear.exceptions import SunspearInvalidConfigurationError
+
+__all__ = ('JSONCodec', 'register_codec', 'get_codec', 'set_codec', 'dumps', 'loads', )
+
+
+class JSONCodec(object):
+    """
+    A named pair of JSON functions.
+
+    :type dumps: callable
+    :param dumps: encodes an object to a JSON string. Takes the ``ensure_ascii`` keyword argument of
+        ``json.dumps``.
+    :type loads: callable
+    :param loads: decodes a JSON string
+    """
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return 'JSONCodec({!r})'.format(self.name)
+
+
+_codecs = OrderedDict()
+_codec = None
+
+
+def register_codec(codec):
+    """
+    Makes ``codec`` available to ``set_codec``, replacing a codec of the same name.
+
+    :type codec: ``JSONCodec``
+    """
+    _codecs[codec.name] = codec
+
+
+def get_codec(name=None):
+    """
+    :type name: string
+    :param name: the name of a registered codec. If ``None``, the codec in use.
+
+    :raises: ``SunspearInvalidConfigurationError`` if no codec is registered as ``name``
+    :return: a ``JSONCodec``
+    """
+    if name is None:
+        return _codec
+    try:
+        return _codecs[name]
+    except KeyError:
+        raise SunspearInvalidConfigurationError('Unknown JSON codec: {}'.format(name))
+
+
+def set_codec(name):
+    """
+    Uses the codec registered as ``name`` from now on.
+
+    :raises: ``SunspearInvalidConfigurationError`` if no codec is registered as ``name``
+    :return: the codec that was in use
+    """
+    global _codec
+    previous, _codec = _codec, get_codec(name)
+    return previous
+
+
+def dumps(obj, ensure_ascii=True):
+    return _codec.dumps(obj, ensure_ascii=ensure_ascii)
+
+
+def loads(data):
+    return _codec.loads(data)
+
+
+def _load_ujson():
+    ujson = importlib.import_module('ujson')
+
+    def dumps(obj, ensure_ascii=True):
+        return ujson.dumps(obj, ensure_ascii=ensure_ascii, escape_forward_slashes=False, double_precision=15)
+    return JSONCodec('ujson', dumps, ujson.loads)
+
+
+def _load_simplejson():
+    simplejson = importlib.import_module('simplejson')
+    # the pure Python simplejson is slower than the standard library
+    importlib.import_module('simplejson._speedups')
+
+    def dumps(obj, ensure_ascii=True):
+        return simplejson.dumps(obj, ensure_ascii=ensure_ascii)
+    return JSONCodec('simplejson', dumps, simplejson.loads)
+
+
+def _load_json():
+    def dumps(obj, ensure_ascii=True):
+        return json.dumps(obj, ensure_ascii=ensure_ascii)
+    return JSONCodec('json', dumps, json.loads)
+
+
+def _register_builtin_codecs():
+    global _codec
+    # the lossless codecs, fastest first; the standard library is the fallback
+    for load in (_load_simplejson, _load_json):
+        try:
+            codec = load()
+        except ImportError:
+            continue
+        register_codec(codec)
+        if _codec is None:
+            _codec = codec
+
+    try:
+        register_codec(_load_ujson())
+    except ImportError:
+        pass
+
+
+_register_builtin_codecs()
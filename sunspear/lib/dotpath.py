@@ -0,0 +1,89 @@
+"""
+Accessors for dotted paths (``'object.author.id'``) into plain, nested dicts.
+
+Unlike ``dotdictify``, nothing is converted or copied: a path is split once, compiled into a
+``(getter, setter)`` tuple and cached, so repeated lookups of the same path only walk the dicts.
+"""
+
+__all__ = ('compile_path', 'get_path', 'set_path', 'has_path')
+
+_compiled_paths = {}
+
+
+def _make_getter(path, parts):
+    if len(parts) == 1:
+        key = parts[0]
+
+        def getter(obj):
+            return obj[key]
+        return getter
+
+    def getter(obj):
+        target = obj
+        for key in parts:
+            if not isinstance(target, dict):
+                raise KeyError('cannot get "%s" in "%s" (%s)' % (key, path, repr(target)))
+            target = target[key]
+        return target
+    return getter
+
+
+def _make_setter(path, parts):
+    parents, last_key = parts[:-1], parts[-1]
+
+    def setter(obj, value):
+        target = obj
+        for key in parents:
+            target = target.setdefault(key, {})
+            if not isinstance(target, dict):
+                raise KeyError('cannot set "%s" in "%s" (%s)' % (last_key, path, repr(target)))
+        target[last_key] = value
+    return setter
+
+
+def compile_path(path):
+    """
+    Compiles a dotted path into a ``(getter, setter)`` tuple. Compiled accessors are cached
+    per path.
+
+    ``getter(obj)`` returns the value at ``path`` and raises a ``KeyError`` if any part of the
+    path is missing or is not a dict. ``setter(obj, value)`` sets the value at ``path``, creating
+    any missing intermediate dicts.
+
+    :type path: string
+    :param path: a path like ``'object.author.id'``
+    """
+    accessors = _compiled_paths.get(path)
+    if accessors is None:
+        parts = path.split('.')
+        accessors = (_make_getter(path, parts), _make_setter(path, parts),)
+        _compiled_paths[path] = accessors
+    return accessors
+
+
+def get_path(obj, path, default=None):
+    """
+    Returns the value at ``path`` in ``obj``, or ``default`` if the path does not exist.
+    """
+    try:
+        return compile_path(path)[0](obj)
+    except KeyError:
+        return default
+
+
+def set_path(obj, path, value):
+    """
+    Sets ``value`` at ``path`` in ``obj``, creating any missing intermediate dicts.
+    """
+    compile_path(path)[1](obj, value)
+
+
+def has_path(obj, path):
+    """
+    Returns ``True`` if ``path`` exists in ``obj``.
+    """
+    try:
+        compile_path(path)[0](obj)
+    except KeyError:
+        return False
+    return True
@@ -0,0 +1,334 @@
+"""
+Moves everything stored in one backend into another, e.g. from ``RiakBackend`` to ``DatabaseBackend``.
+
+Records are streamed out of the source with ``iter_objects`` and ``iter_activities`` and written to the
+target in batches with its ``bulk_create_*`` methods, in three phases:
+
+1. objects
+2. activities, with their ``to``, ``bto``, ``cc`` and ``bcc`` audience targeting
+3. replies and likes. Riak embeds a summary of every reply and like in the ``replies`` and ``likes``
+   collections of the parent activity, and stores the reply or like itself as an activity whose object
+   points back at the parent through ``inReplyTo``. This phase links those activities to their parents,
+   which for ``DatabaseBackend`` means rows in the ``replies`` and ``likes`` tables.
+
+Activities that reference objects missing from the target (Riak happily stores those) cannot be written
+to a backend that enforces foreign keys. They are skipped, and their ids are kept in ``Migration.dangling``
+so they can be dealt with afterwards. With a checkpoint, they are also appended to the file
+``<checkpoint_path>.dangling``, one JSON string per line, as they are found.
+
+A migration can be resumed from its checkpoint file, which is saved after every batch. Finished phases are
+not repeated, and the phase that was interrupted is read again from the id of the last record it had
+written, which ``iter_objects`` and ``iter_activities`` of every backend can start after. Batches that
+were being written when it was interrupted are written again with the ``skip`` conflict strategy, so the
+records they already wrote cost one existence check per batch instead of a write.
+"""
+from __future__ import absolute_import
+
+import datetime
+import hashlib
+import json
+import os
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+from sunspear.activitystreams.models import Activity
+from sunspear.backends.base import CONFLICT_SKIP, SUB_ACTIVITY_MAP
+from sunspear.exceptions import SunspearInvalidConfigurationError
+from sunspear.export import ACTIVITY_KIND, OBJECT_KIND
+from sunspear.importer import SUB_ACTIVITY_KIND, ImportProgress, _BatchWriter
+
+__all__ = ('Migration', 'checksum', )
+
+PHASES = (OBJECT_KIND, ACTIVITY_KIND, SUB_ACTIVITY_KIND, )
+
+# The fields backends store differently, and so cannot be compared: riak embeds the replies and likes of an
+# activity in it, other backends link them to it
+_CHECKSUM_EXCLUDED_FIELDS = {
+    OBJECT_KIND: (),
+    ACTIVITY_KIND: tuple(Activity._response_fields),
+}
+_AUDIENCE_TARGETING_FIELDS = Activity._direct_audience_targeting_fields \
+    + Activity._indirect_audience_targeting_fields
+_EMPTY_VALUES = (None, [], {}, )
+
+
+def checksum(records, kind, exclude_ids=()):
+    """
+    Computes an order independent checksum of ``records``, so two backends that return the same records
+    in a different order have the same checksum. Every field of a record is compared, except the replies
+    and likes of activities, and empty fields. Objects an activity references are compared by id, and its
+    audience targeting regardless of order.
+
+    :type records: iterable
+    :param records: object or activity dicts, as returned by ``iter_objects`` or ``iter_activities``
+    :type kind: string
+    :param kind: ``object`` or ``activity``
+    :type exclude_ids: set
+    :param exclude_ids: ids of records to leave out of the checksum
+
+    :return: a tuple of the number of records and their checksum
+    """
+    excluded_fields = _CHECKSUM_EXCLUDED_FIELDS[kind]
+    count = 0
+    total = 0
+    for record in records:
+        if record['id'] in exclude_ids:
+            continue
+        # a field a backend stores as empty is compared as if it were missing
+        values = dict((key, value,) for key, value in record.items()
+                      if key not in excluded_fields and value not in _EMPTY_VALUES)
+        if kind == ACTIVITY_KIND:
+            values = _normalize_activity(values)
+        digest = hashlib.md5(json.dumps(values, sort_keys=True).encode('utf-8')).hexdigest()
+        total = (total + int(digest[:16], 16)) % (1 << 64)
+        count += 1
+    return count, '{:016x}'.format(total)
+
+
+def _normalize_activity(activity):
+    def get_id(value):
+        return value.get('id') if isinstance(value, dict) else value
+
+    for field in Activity._object_fields:
+        if field in activity:
+            activity[field] = get_id(activity[field])
+    for field in _AUDIENCE_TARGETING_FIELDS:
+        if activity.get(field):
+            activity[field] = sorted(get_id(value) for value in activity[field])
+    return activity
+
+
+class Migration(object):
+    """
+    Copies all objects and activities from ``source`` to ``target``.
+
+    :type source: ``sunspear.backends.base.BaseBackend``
+    :param source: the backend to read from
+    :type target: ``sunspear.backends.base.BaseBackend``
+    :param target: the backend to write to
+    :type batch_size: int
+    :param batch_size: the number of records read and written in one round trip
+    :type workers: int
+    :param workers: the number of batches written to the target concurrently
+    :type checkpoint_path: string
+    :param checkpoint_path: a file the progress of the migration is saved to after every batch. If it
+        exists, the migration resumes from it.
+    :type since: datetime
+    :param since: if provided, only records published on or after this time are migrated. Use the
+        ``started_at`` of a finished migration to copy what was published while it ran; records updated
+        meanwhile, or stored with an earlier ``published``, are not copied again.
+    """
+    def __init__(self, source, target, batch_size=1000, workers=4, checkpoint_path=None, since=None):
+        if batch_size < 1 or workers < 1:
+            raise SunspearInvalidConfigurationError("batch_size and workers must be at least 1")
+
+        self._source = source
+        self._target = target
+        self._batch_size = batch_size
+        self._workers = workers
+        self._checkpoint_path = checkpoint_path
+        self._since = since
+
+        self.completed_phases = []
+        # phase -> the id of the last record read by the phase whose batch, and every batch before it, is written
+        self.positions = {}
+        self.dangling = []
+        self.started_at = datetime.datetime.utcnow()
+        # the size of the file of dangling ids, up to the last batch read
+        self._dangling_size = 0
+        self._load_checkpoint()
+
+    def run(self, progress_callback=None):
+        """
+        Runs every phase of the migration that has not finished yet.
+
+        :type progress_callback: callable
+        :param progress_callback: called with an ``ImportProgress`` every time a batch has been written
+
+        :return: an ``ImportProgress`` with the counts of this run
+        """
+        progress = ImportProgress()
+        pool = ThreadPool(self._workers)
+        try:
+            writer = _BatchWriter(pool, max_pending=self._workers * 2, progress=progress, callback=progress_callback)
+            for phase in PHASES:
+                if phase in self.completed_phases:
+                    continue
+                for batch, last_id in self._iter_phase_batches(phase, progress):
+                    if batch:
+                        # the batches written when a phase was interrupted are written again
+                        writer.submit(phase, self._get_writer(phase), batch, CONFLICT_SKIP,
+                                      done=partial(self._save_position, phase, last_id, self._dangling_size))
+                writer.wait()
+
+                self.completed_phases.append(phase)
+                self.positions.pop(phase, None)
+                self._save_checkpoint()
+        finally:
+            pool.close()
+            pool.join()
+
+        return progress
+
+    def verify(self):
+        """
+        Compares the number of objects and activities in the source and the target, and their checksums.
+        Activities skipped because of dangling references are left out of the source side. Both backends
+        are scanned in full.
+
+        :return: a dict keyed by ``object`` and ``activity``, of dicts with the ``source`` and ``target``
+            counts and checksums and whether they ``match``
+        """
+        dangling = set(self.dangling)
+        results = {}
+        for kind, iter_name in ((OBJECT_KIND, 'iter_objects',), (ACTIVITY_KIND, 'iter_activities',)):
+            source_count, source_checksum = checksum(
+                getattr(self._source, iter_name)(batch_size=self._batch_size, since=self._since), kind,
+                exclude_ids=dangling)
+            target_count, target_checksum = checksum(
+                getattr(self._target, iter_name)(batch_size=self._batch_size, since=self._since), kind)
+            results[kind] = {
+                'source': {'count': source_count, 'checksum': source_checksum},
+                'target': {'count': target_count, 'checksum': target_checksum},
+                'match': (source_count, source_checksum,) == (target_count, target_checksum,),
+            }
+        return results
+
+    def _get_writer(self, phase):
+        if phase == OBJECT_KIND:
+            return self._target.bulk_create_objects
+        if phase == ACTIVITY_KIND:
+            return self._target.bulk_create_activities
+        return self._target.bulk_create_sub_activities
+
+    def _save_position(self, phase, last_id, dangling_size):
+        self.positions[phase] = last_id
+        self._save_checkpoint(dangling_size)
+
+    def _iter_phase_batches(self, phase, progress):
+        """
+        Reads the records of ``phase`` from the source, from the position of the phase on.
+
+        :return: an iterator of tuples of a batch of records to write, and the id of the last record read
+            for it, which may have been left out of the batch
+        """
+        iter_name = 'iter_objects' if phase == OBJECT_KIND else 'iter_activities'
+        records = getattr(self._source, iter_name)(
+            batch_size=self._batch_size, since=self._since, after=self.positions.get(phase))
+
+        dangling = set(self.dangling)
+        batch = []
+        last_id = None
+        for record in records:
+            last_id = record['id']
+            if phase != OBJECT_KIND and record['id'] in dangling:
+                continue
+            if phase == SUB_ACTIVITY_KIND and record.get('verb') not in SUB_ACTIVITY_MAP:
+                continue
+            if phase != SUB_ACTIVITY_KIND:
+                progress.records_read += 1
+
+            batch.append(record)
+            if len(batch) >= self._batch_size:
+                yield (self._drop_dangling(batch) if phase == ACTIVITY_KIND else batch), last_id
+                batch = []
+        if batch:
+            yield (self._drop_dangling(batch) if phase == ACTIVITY_KIND else batch), last_id
+
+    def _drop_dangling(self, activities):
+        """
+        Drops the activities in ``activities`` that reference objects the target does not have. The
+        referenced objects are looked up with one call to ``get_obj``.
+        """
+        audience_targeting_fields = Activity._direct_audience_targeting_fields + Activity._indirect_audience_targeting_fields
+
+        references = {}
+        for activity in activities:
+            activity_references = set()
+            for field in Activity._object_fields:
+                if activity.get(field):
+                    activity_references.add(self._target._extract_id(activity[field]))
+            for field in audience_targeting_fields:
+                for obj in activity.get(field) or []:
+                    activity_references.add(self._target._extract_id(obj))
+            references[activity['id']] = activity_references
+
+        all_references = set()
+        for activity_references in references.values():
+            all_references.update(activity_references)
+        stored_ids = set(obj['id'] for obj in self._target.get_obj(list(all_references)))
+
+        linked_activities = []
+        dangling = []
+        for activity in activities:
+            if references[activity['id']] <= stored_ids:
+                linked_activities.append(activity)
+            else:
+                dangling.append(activity['id'])
+        self._add_dangling(dangling)
+        return linked_activities
+
+    def _add_dangling(self, activity_ids):
+        if not activity_ids:
+            return
+        self.dangling.extend(activity_ids)
+        if not self._checkpoint_path:
+            return
+
+        data = ''.join(json.dumps(activity_id) + '\n' for activity_id in activity_ids).encode('utf-8')
+        with open(self._get_dangling_path(), 'ab') as fp:
+            fp.write(data)
+        self._dangling_size += len(data)
+
+    def _get_dangling_path(self):
+        return self._checkpoint_path + '.dangling'
+
+    def _load_checkpoint(self):
+        if not self._checkpoint_path:
+            return
+        if not os.path.exists(self._checkpoint_path):
+            # left by a migration that never saved a checkpoint
+            if os.path.exists(self._get_dangling_path()):
+                os.remove(self._get_dangling_path())
+            return
+
+        with open(self._checkpoint_path, 'r') as fp:
+            checkpoint = json.load(fp)
+        self.completed_phases = checkpoint['completed_phases']
+        self.positions = checkpoint.get('positions', {})
+        self.started_at = datetime.datetime.strptime(checkpoint['started_at'], '%Y-%m-%dT%H:%M:%SZ')
+
+        dangling_path = self._get_dangling_path()
+        if 'dangling' in checkpoint:
+            # a checkpoint of an older version, listing the dangling ids itself
+            if os.path.exists(dangling_path):
+                os.remove(dangling_path)
+            self._add_dangling(checkpoint['dangling'])
+            return
+        if not os.path.exists(dangling_path):
+            return
+        # the ids found after the last checkpoint are found again when their batches are read again
+        with open(dangling_path, 'r+b') as fp:
+            fp.truncate(checkpoint['dangling_size'])
+            self.dangling = [json.loads(line) for line in fp.read().decode('utf-8').splitlines()]
+        self._dangling_size = checkpoint['dangling_size']
+
+    def _save_checkpoint(self, dangling_size=None):
+        """
+        :type dangling_size: int
+        :param dangling_size: the size of the file of dangling ids to resume with, by default all of it
+        """
+        if not self._checkpoint_path:
+            return
+
+        checkpoint = {
+            'completed_phases': self.completed_phases,
+            'positions': self.positions,
+            'dangling_size': self._dangling_size if dangling_size is None else dangling_size,
+            'started_at': self.started_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        }
+        # write to a temporary file first so a crash never leaves a truncated checkpoint behind
+        tmp_path = self._checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(checkpoint, fp)
+        os.rename(tmp_path, self._checkpoint_path)
@@ -0,0 +1,122 @@
+"""
+A cache of the ids of objects that do not exist.
+
+Activities can reference objects that were never stored, or were deleted, like the actor of an activity whose
+user was removed. They are hydrated with ``{}`` for them, but each read asks the backend for the missing ids
+again. With a ``NegativeCache`` set on a backend, ``get_obj``, and so the hydration of activities, remembers the
+ids it did not find for ``ttl`` seconds and does not read them again::
+
+    from sunspear.negativecache import NegativeCache
+
+    backend.set_negative_cache(NegativeCache(ttl=300))
+
+The backend forgets an id when it writes the object, e.g. with ``create_obj``. An id that was written while it
+was being read is not remembered.
+"""
+from __future__ import absolute_import
+
+import threading
+import time
+from collections import OrderedDict
+
+__all__ = ('NegativeCache', )
+
+
+class NegativeCache(object):
+    """
+    :type ttl: float
+    :param ttl: the number of seconds an id is known to be missing for
+    :type max_size: int
+    :param max_size: the number of ids kept; the oldest are dropped first
+    :type max_invalidations: int
+    :param max_invalidations: the number of written ids remembered to check the ids being read against. Ids
+        whose read started before the oldest of them are not remembered.
+    """
+    def __init__(self, ttl=60, max_size=100000, max_invalidations=10000, clock=time.time):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_invalidations = max_invalidations
+
+        self.hits = 0
+
+        self._clock = clock
+        self._lock = threading.Lock()
+        # id -> the time it is no longer known to be missing
+        self._missing = OrderedDict()
+        # id -> the number of the last invalidation of the id
+        self._invalidations = OrderedDict()
+        self._generation = 0
+        self._forgotten_generation = 0
+
+    @property
+    def generation(self):
+        """
+        The number of the last invalidation. Read it before reading the ids, and pass it to ``add``.
+        """
+        return self._generation
+
+    def filter(self, ids):
+        """
+        :type ids: list
+        :return: the ids of ``ids`` that are not known to be missing
+        """
+        now = self._clock()
+        existing_ids = []
+        with self._lock:
+            for obj_id in ids:
+                expires = self._missing.get(obj_id)
+                if expires is not None and expires <= now:
+                    del self._missing[obj_id]
+                    expires = None
+                if expires is None:
+                    existing_ids.append(obj_id)
+            self.hits += len(ids) - len(existing_ids)
+        return existing_ids
+
+    def add(self, ids, generation):
+        """
+        Remembers that ``ids`` are missing, except the ones written after ``generation``.
+
+        :type generation: int
+        :param generation: the ``generation`` read before ``ids`` were read from the backend
+        """
+        expires = self._clock() + self.ttl
+        with self._lock:
+            if generation < self._forgotten_generation:
+                return
+            for obj_id in ids:
+                if self._invalidations.get(obj_id, 0) > generation:
+                    continue
+                self._missing.pop(obj_id, None)
+                self._missing[obj_id] = expires
+
+            while len(self._missing) > self.max_size:
+                self._missing.popitem(last=False)
+
+    def invalidate(self, ids):
+        """
+        Forgets that ``ids``, which were written, are missing.
+        """
+        with self._lock:
+            self._generation += 1
+            for obj_id in ids:
+                self._missing.pop(obj_id, None)
+                self._invalidations.pop(obj_id, None)
+                self._invalidations[obj_id] = self._generation
+
+            while len(self._invalidations) > self.max_invalidations:
+                self._forgotten_generation = self._invalidations.popitem(last=False)[1]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._forgotten_generation = self._generation
+            self._missing.clear()
+            self._invalidations.clear()
+
+    def stats(self):
+        """
+        :return: a dict of the number of ids known to be missing, and of the ``hits``: the ids not read
+            because they were
+        """
+        return {'size': len(self._missing), 'hits': self.hits}
@@ -0,0 +1,181 @@
+"""
+Sharing of concurrent reads of the same ids between threads.
+
+When many threads read the same activities or objects at the same moment, e.g. a popular activity, each of
+them would read it from the backend. With a ``SingleFlight`` set on a backend, ``get_obj`` and ``get_activity``
+read every id once at a time: a thread reading ids that are being read by another thread waits for that read
+and gets a copy of its results. Reads that start within ``window`` seconds of each other are also merged into
+one call to the backend::
+
+    from sunspear.singleflight import SingleFlight
+
+    backend.set_single_flight(SingleFlight(window=0.002))
+
+Reads are only shared between calls with the same arguments, and never for reads that depend on the state of
+the thread, like the reads of ``DatabaseBackend`` in a transaction. A read never shares a read that started
+before the last write of the backend.
+"""
+from __future__ import absolute_import
+
+import copy
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import six
+
+__all__ = ('SingleFlight', 'make_key', )
+
+
+class _Batch(object):
+    def __init__(self):
+        self.ids = []
+        # never handed out: every thread waiting for the batch gets copies
+        self.results = {}
+        self.exc_info = None
+        self.done = threading.Event()
+        # the number of threads other than the one running the batch waiting for it
+        self.followers = 0
+
+
+class SingleFlight(object):
+    """
+    :type window: float
+    :param window: the number of seconds a read waits for other reads to join it before it starts. With ``0``,
+        only reads that are already running are shared.
+    :type max_batch_size: int
+    :param max_batch_size: the number of ids a merged read is limited to
+    """
+    def __init__(self, window=0.0, max_batch_size=1000, sleep=time.sleep):
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self.reads = 0
+        self.ids_read = 0
+        self.ids_shared = 0
+
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        # key -> the batch new ids of reads with the key are added to, until it starts
+        self._open = {}
+        # (key, id) -> the batch reading the id
+        self._in_flight = {}
+
+    def fetch(self, key, ids, fetch_many):
+        """
+        Reads ``ids`` with ``fetch_many``, sharing the ids being read by other threads with the same ``key``.
+
+        :param key: a hashable value, e.g. from ``make_key``. Reads are only shared between the same keys.
+        :type ids: list
+        :param ids: the ids to read
+        :type fetch_many: callable
+        :param fetch_many: reads a list of ids, and returns a list of dicts with an ``id``
+
+        :return: the results for ``ids``, in the order of ``ids``. Ids that were not found are left out.
+        """
+        ids = list(OrderedDict.fromkeys(ids))
+        batches = []
+        led_batch = None
+        with self._lock:
+            missing_ids = []
+            for obj_id in ids:
+                batch = self._in_flight.get((key, obj_id))
+                if batch is None:
+                    missing_ids.append(obj_id)
+                elif batch not in batches:
+                    batch.followers += 1
+                    batches.append(batch)
+            self.ids_shared += len(ids) - len(missing_ids)
+
+            if missing_ids:
+                batch = self._open.get(key)
+                if batch is None or len(batch.ids) + len(missing_ids) > self.max_batch_size:
+                    batch = led_batch = self._open[key] = _Batch()
+                else:
+                    self.ids_shared += len(missing_ids)
+                batch.ids.extend(missing_ids)
+                self._in_flight.update((((key, obj_id,), batch,) for obj_id in missing_ids))
+                if batch not in batches:
+                    if batch is not led_batch:
+                        batch.followers += 1
+                    batches.append(batch)
+
+        if led_batch is not None:
+            self._run(key, led_batch, fetch_many)
+
+        results = {}
+        for batch in batches:
+            batch.done.wait()
+            if batch.exc_info is not None:
+                six.reraise(*batch.exc_info)
+            for obj_id in ids:
+                if obj_id in batch.results:
+                    # every thread gets its own copy, as the callers change the results. No thread can
+                    # follow a batch once it is done, so the one that ran it alone keeps the originals.
+                    result = batch.results[obj_id]
+                    results[obj_id] = result if batch is led_batch and not batch.followers else copy.deepcopy(result)
+        return [results[obj_id] for obj_id in ids if obj_id in results]
+
+    def invalidate(self):
+        """
+        Makes the reads that start from now on read their ids again, instead of sharing the reads that are
+        running. Called after writes, so a thread reads what it wrote.
+        """
+        with self._lock:
+            self._in_flight.clear()
+
+    def stats(self):
+        """
+        :return: a dict of the number of ``reads`` made, the ``ids_read`` by them, and the ``ids_shared``
+            with another read
+        """
+        return {'reads': self.reads, 'ids_read': self.ids_read, 'ids_shared': self.ids_shared}
+
+    def _run(self, key, batch, fetch_many):
+        if self.window:
+            self._sleep(self.window)
+
+        with self._lock:
+            # no more ids are added to the batch
+            if self._open.get(key) is batch:
+                del self._open[key]
+            self.reads += 1
+            self.ids_read += len(batch.ids)
+
+        try:
+            for result in fetch_many(list(batch.ids)):
+                batch.results[result['id']] = result
+        except Exception:
+            batch.exc_info = sys.exc_info()
+        finally:
+            with self._lock:
+                for obj_id in batch.ids:
+                    if self._in_flight.get((key, obj_id)) is batch:
+                        del self._in_flight[(key, obj_id)]
+            batch.done.set()
+
+
+def make_key(*parts):
+    """
+    Makes a key for ``SingleFlight.fetch`` out of ``parts``, e.g. the name and the arguments of a read. Dicts and
+    lists are compared by value, other values as they compare themselves.
+
+    :return: a hashable key, or ``None`` if ``parts`` has an unhashable value
+    """
+    try:
+        key = _freeze(parts)
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item),) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    return value
@@ -0,0 +1,575 @@
+"""
+An in-memory stand-in for a Riak cluster, so ``RiakBackend`` can be tested and benchmarked without a
+running Riak node.
+
+``FakeRiakClient`` is a real ``riak.RiakClient`` whose requests are answered by a ``FakeRiakServer`` held
+in memory instead of being sent over the network. Buckets, ``RiakObject``, multiget/multiput and the
+MapReduce builder are the ones from the riak library, so values go through the same encoding and
+decoding as they would against a live cluster.
+
+Riak runs MapReduce phases written in JavaScript. The server emulates them with Python functions
+registered by their source, and comes with emulations of all of the phases ``RiakBackend`` uses.
+
+The server can be made to behave like a remote cluster: every request can be delayed by a fixed or
+computed latency, requests that take longer than their ``timeout`` fail like they would against Riak,
+and failures can be injected for specific requests or at random. The number of requests of every kind
+is counted in ``FakeRiakServer.request_counts``.
+
+Buckets with the ``allow_mult`` property keep concurrent writes as siblings, like Riak does. The vector
+clock of a value is emulated by the version of the last write the value includes: a write supersedes
+the siblings written up to the vector clock it was read with, and becomes a sibling of the others. A
+write without a vector clock, e.g. of a ``bucket.new`` object, becomes a sibling of everything stored.
+Without ``allow_mult`` the last write wins.
+
+Example::
+
+    from sunspear.backends.riak import RiakBackend
+    from sunspear.testing.fakeriak import FakeRiakClient
+
+    backend = RiakBackend(client=FakeRiakClient())
+
+    # every request takes 2ms, and the next two puts fail
+    server = FakeRiakServer(latency=0.002)
+    server.inject_fault('put', times=2)
+    backend = RiakBackend(client=FakeRiakClient(server=server))
+"""
+from __future__ import absolute_import
+
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from riak import RiakClient, RiakError
+from riak.client.index_page import CONTINUATION
+from riak.content import RiakContent
+from riak.riak_object import VClock
+from six import string_types
+from sunspear.backends.riak import (JS_MAP, JS_MAP_OBJS, JS_REDUCE,
+                                    JS_REDUCE_FILTER_AUD_TARGETTING,
+                                    JS_REDUCE_FILTER_PROP, JS_REDUCE_OBJS)
+
+__all__ = ('FakeRiakClient', 'FakeRiakServer', 'OPERATIONS', )
+
+AUDIENCE_TARGETING_FIELDS = ['to', 'bto', 'cc', 'bcc']
+
+# the requests the server answers, as used for latencies, faults and ``request_counts``
+OPERATIONS = (
+    'get', 'put', 'delete', 'get_keys', 'stream_keys', 'get_index', 'stream_index', 'mapred', 'get_bucket_props',
+    'set_bucket_props',
+)
+
+
+class _StoredValue(object):
+    """
+    A sibling stored under a key. Every key holds a list of them, which has a single value unless the
+    bucket allows siblings.
+    """
+    def __init__(self, encoded_data, content_type, indexes, usermeta, version, last_modified):
+        self.encoded_data = encoded_data
+        self.content_type = content_type
+        self.indexes = frozenset(indexes)
+        self.usermeta = dict(usermeta)
+        self.version = version
+        self.last_modified = last_modified
+
+
+class _FakeStream(object):
+    """
+    Stands in for the key and index streams of the riak transports: an iterator over lists of keys
+    that gives its connection back when closed.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._resource = None
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            self.close()
+            raise
+
+    __next__ = next
+
+    def attach(self, resource):
+        self._resource = resource
+
+    def close(self):
+        if self._resource is not None:
+            self._resource.release()
+            self._resource = None
+
+
+class _FakeResource(object):
+    def __init__(self, transport):
+        self.object = transport
+
+    def release(self):
+        pass
+
+
+class FakeRiakServer(object):
+    """
+    The in-memory state of a Riak cluster, and the transport that answers the requests of
+    ``FakeRiakClient``. Several clients can share one server.
+
+    :type stream_chunk_size: int
+    :param stream_chunk_size: the number of keys in every chunk of a key or index stream
+    :type latency: float, dict or callable
+    :param latency: how long every request takes, in seconds. Either a number for all requests, a dict
+        keyed by the names in ``OPERATIONS`` (missing operations take no time), or a callable taking the
+        name of the operation and returning the latency, e.g. to add jitter.
+    :type failure_rate: float
+    :param failure_rate: the probability of any request failing with a ``RiakError``
+    :type seed: int
+    :param seed: the seed of the random number generator deciding which requests fail
+    :type allow_mult: bool
+    :param allow_mult: the default of the ``allow_mult`` property of the buckets
+    """
+    def __init__(self, stream_chunk_size=100, latency=0, failure_rate=0.0, seed=None, allow_mult=False):
+        self.stream_chunk_size = stream_chunk_size
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.allow_mult = allow_mult
+        self.request_counts = Counter()
+
+        self._random = random.Random(seed)
+        self._faults = []
+
+        self._buckets = {}
+        self._bucket_props = {}
+        self._lock = threading.RLock()
+        self._version = 0
+        self._mapreduce_functions = {
+            JS_MAP.strip(): _map_activities,
+            JS_MAP_OBJS.strip(): _map_objects,
+            JS_REDUCE.strip(): _reduce_sort_by_timestamp,
+            JS_REDUCE_FILTER_AUD_TARGETTING.strip(): _reduce_filter_audience_targeting,
+            JS_REDUCE_FILTER_PROP.strip(): self._reduce_filter_properties,
+            JS_REDUCE_OBJS.strip(): _reduce_filter_not_found,
+        }
+        self._raw_filters = {}
+
+    def register_mapreduce_function(self, source, function):
+        """
+        Registers a Python emulation of a JavaScript MapReduce phase.
+
+        :type source: string
+        :param source: the JavaScript source of the phase, exactly as it is sent to Riak
+        :type function: callable
+        :param function: for map phases, a function taking the Riak value, the key data and the
+            phase argument and returning a list. For reduce phases, a function taking the list of
+            values and the phase argument and returning a list.
+        """
+        self._mapreduce_functions[source.strip()] = function
+
+    def register_raw_filter(self, source, function):
+        """
+        Registers a Python emulation of a JavaScript ``raw_filter`` passed to ``get_activities``.
+
+        :type source: string
+        :param source: the JavaScript source of the filter
+        :type function: callable
+        :param function: a function taking an activity dict and returning ``True`` if it should be
+            included in the results
+        """
+        self._raw_filters[source] = function
+
+    def inject_fault(self, operation=None, error=None, times=1):
+        """
+        Makes the next ``times`` requests of an operation fail. Faults are used up in the order they
+        were injected.
+
+        :type operation: string
+        :param operation: one of ``OPERATIONS``, or ``None`` for any request
+        :type error: Exception
+        :param error: the exception raised. Defaults to a ``RiakError``.
+        :type times: int
+        :param times: the number of requests that fail
+        """
+        if operation is not None and operation not in OPERATIONS:
+            raise ValueError("Unknown operation {!r}".format(operation))
+        with self._lock:
+            self._faults.append([operation, error, times])
+
+    def clear_faults(self):
+        with self._lock:
+            del self._faults[:]
+
+    def keys(self, bucket_name, bucket_type='default'):
+        """
+        :return: a sorted list of the keys stored in a bucket
+        """
+        with self._lock:
+            return sorted(self._buckets.get((bucket_type, bucket_name), {}).keys())
+
+    def siblings(self, bucket_name, key, bucket_type='default'):
+        """
+        :return: the number of siblings stored under a key
+        """
+        with self._lock:
+            return len(self._buckets.get((bucket_type, bucket_name), {}).get(key, []))
+
+    def clear(self):
+        """
+        Removes all data, injected faults and request counts.
+        """
+        with self._lock:
+            self._buckets.clear()
+            del self._faults[:]
+            self.request_counts.clear()
+
+    # transport methods
+
+    def get(self, robj, r=None, pr=None, timeout=None, basic_quorum=None, notfound_ok=None, head_only=False):
+        self._request('get', timeout)
+        with self._lock:
+            siblings = self._get_bucket(robj.bucket).get(robj.key)
+        if not siblings:
+            robj.siblings = []
+            return None
+        return self._populate(robj, siblings)
+
+    def put(self, robj, w=None, dw=None, pw=None, return_body=None, if_none_match=None, timeout=None):
+        self._request('put', timeout)
+        if robj.key is None:
+            robj.key = uuid.uuid4().hex
+        content = robj.siblings[0]
+        encoded_data = content.encoded_data
+
+        with self._lock:
+            bucket = self._get_bucket(robj.bucket)
+            if if_none_match and robj.key in bucket:
+                raise RiakError('modified')
+            self._version += 1
+            stored = _StoredValue(
+                encoded_data, content.content_type, content.indexes, content.usermeta, self._version, time.time())
+
+            siblings = [stored]
+            if self._allows_mult(robj.bucket):
+                seen = int(robj.vclock.encode('binary')) if robj.vclock is not None else 0
+                siblings = [sibling for sibling in bucket.get(robj.key, []) if sibling.version > seen] + siblings
+            bucket[robj.key] = siblings
+
+        if return_body:
+            return self._populate(robj, siblings)
+        robj.vclock = self._get_vclock(siblings)
+        return None
+
+    def delete(self, robj, rw=None, r=None, w=None, dw=None, pr=None, pw=None, timeout=None):
+        self._request('delete', timeout)
+        with self._lock:
+            self._get_bucket(robj.bucket).pop(robj.key, None)
+        return self
+
+    def get_bucket_props(self, bucket):
+        self._request('get_bucket_props')
+        with self._lock:
+            props = {'allow_mult': self.allow_mult}
+            props.update(self._bucket_props.get((bucket.bucket_type.name, bucket.name), {}))
+            return props
+
+    def set_bucket_props(self, bucket, props):
+        self._request('set_bucket_props')
+        with self._lock:
+            self._bucket_props.setdefault((bucket.bucket_type.name, bucket.name), {}).update(props)
+        return True
+
+    def get_keys(self, bucket, timeout=None):
+        self._request('get_keys', timeout)
+        return self.keys(bucket.name, bucket.bucket_type.name)
+
+    def stream_keys(self, bucket, timeout=None):
+        self._request('stream_keys', timeout)
+        return _FakeStream(self._chunk(self.keys(bucket.name, bucket.bucket_type.name)))
+
+    def get_index(self, bucket, index, startkey, endkey=None, return_terms=None, max_results=None,
+                  continuation=None, timeout=None, term_regex=None):
+        self._request('get_index', timeout)
+        return self._get_index_page(bucket, index, startkey, endkey, return_terms, max_results, continuation)
+
+    def stream_index(self, bucket, index, startkey, endkey=None, return_terms=None, max_results=None,
+                     continuation=None, timeout=None, term_regex=None):
+        self._request('stream_index', timeout)
+        results, continuation = self._get_index_page(
+            bucket, index, startkey, endkey, return_terms, max_results, continuation)
+
+        chunks = list(self._chunk(results))
+        if continuation:
+            chunks.append(CONTINUATION(continuation))
+        return _FakeStream(chunks)
+
+    def mapred(self, inputs, query, timeout=None):
+        self._request('mapred', timeout)
+        if isinstance(inputs, string_types):
+            inputs = [[inputs, key, None] for key in self.keys(inputs)]
+
+        values = []
+        for mapred_input in inputs:
+            bucket_name, key, keydata = mapred_input[0], mapred_input[1], mapred_input[2]
+            bucket_type = mapred_input[3] if len(mapred_input) > 3 else 'default'
+            values.append((self._get_mapred_value(bucket_type, bucket_name, key, keydata), keydata,))
+
+        data = None
+        kept = []
+        for phase in query:
+            phase_type, stepdef = list(phase.items())[0]
+            function = self._get_mapreduce_function(stepdef)
+            if phase_type == 'map':
+                if data is not None:
+                    raise NotImplementedError("Map phases can only be the first phase of a query")
+                data = []
+                for value, keydata in values:
+                    data.extend(function(value, keydata, stepdef.get('arg')))
+            elif phase_type == 'reduce':
+                data = function(data if data is not None else [value for value, keydata in values], stepdef.get('arg'))
+            else:
+                raise NotImplementedError("{} phases are not supported".format(phase_type))
+
+            if stepdef.get('keep'):
+                kept.append(data)
+
+        return kept[0] if len(kept) == 1 else kept
+
+    # helpers
+
+    def _request(self, operation, timeout=None):
+        """
+        Counts a request, and delays or fails it as configured. ``timeout`` is in milliseconds, like
+        everywhere in the riak client.
+        """
+        with self._lock:
+            self.request_counts[operation] += 1
+            error = self._take_fault(operation)
+            if error is None and self.failure_rate and self._random.random() < self.failure_rate:
+                error = RiakError('Injected failure of {}'.format(operation))
+
+        # sleep outside of the lock so concurrent requests overlap like they would against a cluster
+        latency = self._get_latency(operation)
+        if timeout is not None and latency * 1000 > timeout:
+            time.sleep(timeout / 1000.0)
+            raise RiakError('timeout')
+        if latency > 0:
+            time.sleep(latency)
+
+        if error is not None:
+            raise error
+
+    def _take_fault(self, operation):
+        for fault in self._faults:
+            fault_operation, error, times = fault
+            if fault_operation is None or fault_operation == operation:
+                if times <= 1:
+                    self._faults.remove(fault)
+                else:
+                    fault[2] = times - 1
+                return error if error is not None else RiakError('Injected failure of {}'.format(operation))
+        return None
+
+    def _get_latency(self, operation):
+        if callable(self.latency):
+            return self.latency(operation)
+        if isinstance(self.latency, dict):
+            return self.latency.get(operation, 0)
+        return self.latency
+
+    def _get_index_page(self, bucket, index, startkey, endkey, return_terms, max_results, continuation):
+        results = self._query_index(bucket, index, startkey, endkey, return_terms)
+        offset = int(base64.b64decode(continuation)) if continuation else 0
+        results = results[offset:]
+        if max_results and len(results) > max_results:
+            return results[:max_results], base64.b64encode(str(offset + max_results))
+        return results, None
+
+    def _get_bucket(self, bucket):
+        return self._buckets.setdefault((bucket.bucket_type.name, bucket.name), {})
+
+    def _allows_mult(self, bucket):
+        return self._bucket_props.get((bucket.bucket_type.name, bucket.name), {}).get('allow_mult', self.allow_mult)
+
+    def _get_vclock(self, siblings):
+        return VClock(str(max(sibling.version for sibling in siblings)), 'binary')
+
+    def _populate(self, robj, siblings):
+        robj.vclock = self._get_vclock(siblings)
+        robj.siblings = [RiakContent(
+            robj, encoded_data=stored.encoded_data, content_type=stored.content_type,
+            last_modified=stored.last_modified, indexes=set(stored.indexes), usermeta=dict(stored.usermeta),
+            exists=True) for stored in siblings]
+        # like the codecs of the riak transports
+        if len(robj.siblings) > 1 and robj.resolver is not None:
+            robj.resolver(robj)
+        return robj
+
+    def _chunk(self, items):
+        for i in range(0, len(items), self.stream_chunk_size):
+            yield items[i:i + self.stream_chunk_size]
+
+    def _query_index(self, bucket, index, startkey, endkey, return_terms):
+        with self._lock:
+            items = list(self._get_bucket(bucket).items())
+
+        matches = []
+        for key, siblings in items:
+            if index == '$bucket':
+                terms = [bucket.name]
+            elif index == '$key':
+                terms = [key]
+            else:
+                terms = set(value for stored in siblings for name, value in stored.indexes if name == index)
+
+            for term in terms:
+                if (endkey is None and term == startkey) or (endkey is not None and startkey <= term <= endkey):
+                    matches.append((term, key,))
+        matches.sort()
+
+        if return_terms:
+            return matches
+        keys = []
+        seen = set()
+        for term, key in matches:
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+        return keys
+
+    def _get_mapred_value(self, bucket_type, bucket_name, key, keydata):
+        with self._lock:
+            siblings = self._buckets.get((bucket_type, bucket_name), {}).get(key)
+        if not siblings:
+            return {'not_found': {'bucket': bucket_name, 'key': key, 'keydata': keydata}}
+
+        values = []
+        for stored in siblings:
+            index_metadata = {}
+            for name, value in stored.indexes:
+                index_metadata[name] = value
+            values.append({
+                'data': stored.encoded_data,
+                'metadata': {'index': index_metadata, 'content-type': stored.content_type},
+            })
+        return {
+            'bucket': bucket_name,
+            'key': key,
+            'vclock': str(max(stored.version for stored in siblings)),
+            'values': values,
+        }
+
+    def _get_mapreduce_function(self, stepdef):
+        source = stepdef.get('source', '').strip()
+        if source not in self._mapreduce_functions:
+            raise NotImplementedError("No emulation registered for the MapReduce phase {!r}".format(
+                stepdef.get('source') or stepdef.get('name')))
+        return self._mapreduce_functions[source]
+
+    def _reduce_filter_properties(self, values, arg):
+        # JS_REDUCE_FILTER_PROP
+        raw_filter = lambda obj: True
+        if arg['raw_filter'] != '':
+            if arg['raw_filter'] not in self._raw_filters:
+                raise NotImplementedError("No emulation registered for the raw filter {!r}".format(arg['raw_filter']))
+            raw_filter = self._raw_filters[arg['raw_filter']]
+
+        matches_filters = lambda obj: True
+        if arg['filters'] is not None:
+            def matches_filters(obj):
+                for field, wanted_values in arg['filters'].items():
+                    if field in obj:
+                        for wanted_value in wanted_values:
+                            if obj[field] == wanted_value:
+                                return True
+                return False
+
+        return [obj for obj in values if raw_filter(obj) and matches_filters(obj)]
+
+
+def _map_values(value):
+    # Riak.mapValues: the JSON document of every sibling, parsed
+    parsed_values = []
+    for sibling in value['values']:
+        try:
+            parsed_values.append((json.loads(sibling['data']), sibling,))
+        except ValueError:
+            continue
+    return parsed_values
+
+
+def _map_activities(value, keydata, arg):
+    # JS_MAP
+    if 'not_found' in value:
+        return [value]
+
+    activities = []
+    for activity, sibling in _map_values(value):
+        if activity is None:
+            continue
+        timestamp = sibling['metadata']['index'].get('timestamp_int')
+        if timestamp is not None and isinstance(activity, dict):
+            activity['timestamp'] = timestamp
+        activities.append(activity)
+    return activities
+
+
+def _map_objects(value, keydata, arg):
+    # JS_MAP_OBJS
+    if 'not_found' in value:
+        return [value]
+    return [obj for obj, sibling in _map_values(value) if obj is not None]
+
+
+def _reduce_filter_not_found(values, arg):
+    # JS_REDUCE_OBJS, i.e. Riak.filterNotFound
+    return [value for value in values if not (isinstance(value, dict) and 'not_found' in value)]
+
+
+def _reduce_sort_by_timestamp(values, arg):
+    # JS_REDUCE
+    return sorted(_reduce_filter_not_found(values, arg), key=lambda value: value.get('timestamp', 0))
+
+
+def _reduce_filter_audience_targeting(values, arg):
+    # JS_REDUCE_FILTER_AUD_TARGETTING. Like the JavaScript, only the first targeted object of the first
+    # field present in both the activity and the filters decides whether the activity matches.
+    def matches(obj):
+        if arg['public'] and all(field not in obj for field in AUDIENCE_TARGETING_FIELDS):
+            return True
+        for field in AUDIENCE_TARGETING_FIELDS:
+            if field in obj and field in arg['filters']:
+                for target in arg['filters'][field]:
+                    return target in obj[field]
+        return False
+
+    return [obj for obj in values if matches(obj)]
+
+
+class FakeRiakClient(RiakClient):
+    """
+    A ``RiakClient`` whose requests are answered by a ``FakeRiakServer`` instead of a Riak cluster.
+
+    :type server: ``FakeRiakServer``
+    :param server: the server holding the data. A new, empty one is created if not provided.
+    """
+    def __init__(self, server=None, **kwargs):
+        super(FakeRiakClient, self).__init__(**kwargs)
+        self.server = server if server is not None else FakeRiakServer()
+
+    def _choose_pool(self, protocol=None):
+        return None
+
+    def _with_retries(self, pool, fn):
+        return fn(self.server)
+
+    @contextmanager
+    def _transport(self):
+        yield self.server
+
+    def _acquire(self):
+        return _FakeResource(self.server)
@@ -0,0 +1,162 @@
+from __future__ import absolute_import
+
+from sunspear.activitycache import ActivityCache
+from sunspear.backends.database.db import DatabaseBackend
+from sunspear.instrumentation import RecordingInstrumentation
+
+from mock import patch
+from nose.tools import eq_, ok_
+
+
+class TestActivityCache(object):
+    def setUp(self):
+        self._now = [0]
+        self._cache = ActivityCache(max_size=2, max_age=60, max_invalidations=2, clock=lambda: self._now[0])
+
+        self._activity = {
+            'id': '1', 'verb': 'post', 'actor': {'objectType': 'user', 'id': 'user:1'},
+            'object': {'objectType': 'activity', 'id': '2', 'actor': {'objectType': 'user', 'id': 'user:2'}},
+            'replies': {'totalItems': 1, 'items': [{'id': '3', 'verb': 'reply'}]},
+        }
+
+    def test_get_returns_copies(self):
+        ok_(self._cache.put(self._activity, self._cache.generation))
+
+        cached = self._cache.get('1')
+        eq_(self._activity, cached)
+        cached['actor']['displayName'] = 'changed'
+        eq_(self._activity, self._cache.get('1'))
+
+        eq_(None, self._cache.get('4'))
+        eq_({'size': 1, 'hits': 2, 'misses': 1, 'evictions': 0, 'hit_rate': 2 / 3.0}, self._cache.stats())
+
+    def test_embedded_ids_invalidate_the_activity(self):
+        for embedded_id in ['1', 'user:1', '2', 'user:2', '3', 'note:1']:
+            self._cache.put(self._activity, self._cache.generation, references=['note:1'])
+
+            self._cache.invalidate([embedded_id])
+
+            eq_(None, self._cache.get('1'))
+            eq_({}, self._cache._referenced_by)
+
+    def test_activities_read_before_an_invalidation_are_not_cached(self):
+        generation = self._cache.generation
+        self._cache.invalidate(['user:2'])
+
+        ok_(not self._cache.put(self._activity, generation))
+        ok_(self._cache.put(self._activity, self._cache.generation))
+
+    def test_forgotten_invalidations(self):
+        generation = self._cache.generation
+        self._cache.invalidate(['a', 'b', 'c'])
+
+        ok_(not self._cache.put(self._activity, generation))
+
+    def test_least_recently_used_activities_are_dropped(self):
+        for activity_id in ['4', '5']:
+            self._cache.put({'id': activity_id}, self._cache.generation)
+        self._cache.get('4')
+        self._cache.put(self._activity, self._cache.generation)
+
+        eq_(['1', '4'], sorted(self._cache._activities))
+        eq_(1, self._cache.stats()['evictions'])
+
+    def test_activities_expire(self):
+        self._cache.put(self._activity, self._cache.generation)
+
+        self._now[0] = 60
+
+        eq_(None, self._cache.get('1'))
+
+
+class TestGetActivityCached(object):
+    def setUp(self):
+        self._backend = DatabaseBackend(db_connection_string='sqlite://')
+        self._backend.create_tables()
+        self._cache = ActivityCache()
+        self._backend.set_activity_cache(self._cache)
+        self._instrumentation = RecordingInstrumentation()
+        self._backend.set_instrumentation(self._instrumentation)
+
+        self._published = '2016-01-01T00:00:00Z'
+        self._actor = {'objectType': 'user', 'id': 'user:1', 'displayName': 'User', 'published': self._published}
+        self._backend.create_activity({
+            'id': '1', 'verb': 'post', 'published': self._published, 'actor': self._actor,
+            'object': {'objectType': 'note', 'id': 'note:1', 'content': 'a note', 'published': self._published},
+        })
+        self._backend.create_activity({
+            'id': '2', 'verb': 'post', 'published': self._published, 'actor': 'user:1', 'object': 'note:1',
+            'to': [{'objectType': 'user', 'id': 'user:2', 'published': self._published}],
+        })
+
+    def tearDown(self):
+        self._backend.drop_tables()
+        self._backend.engine.dispose()
+
+    def _get_activity(self, activity_ids=['1'], **kwargs):
+        self._instrumentation.reset()
+        return self._backend.get_activity(activity_ids, include_public=True, **kwargs)
+
+    def test_hits_are_not_hydrated(self):
+        first = self._get_activity(['1', '2'], audience_targeting={'to': ['user:2']})
+        eq_(2, self._instrumentation.counters['activity_cache.misses'])
+
+        eq_(first, self._get_activity(['1', '2'], audience_targeting={'to': ['user:2']}))
+        eq_(2, self._instrumentation.counters['activity_cache.hits'])
+        ok_('get_obj' not in self._instrumentation.span_names())
+        eq_(1, self._instrumentation.counters['db.statements'])
+
+    def test_audience_targeting_still_applies(self):
+        self._get_activity(['1', '2'], audience_targeting={'to': ['user:2']})
+
+        eq_(['1'], [activity['id'] for activity in self._get_activity(['1', '2'])])
+
+    def test_updated_objects_are_hydrated_again(self):
+        self._get_activity()
+
+        self._backend.update_obj(dict(self._actor, displayName='Changed'))
+
+        eq_('Changed', self._get_activity()[0]['actor']['displayName'])
+
+    def test_sub_activities_are_hydrated_again(self):
+        self._get_activity()
+
+        reply, _ = self._backend.create_sub_activity('1', 'user:1', 'a reply', sub_activity_verb='reply')
+        eq_([reply['id']], [item['object']['id'] for item in self._get_activity()[0]['replies']['items']])
+
+        self._backend.delete_sub_activity(reply['id'], 'reply')
+        eq_([], self._get_activity()[0]['replies']['items'])
+
+    def test_updated_activities_are_hydrated_again(self):
+        self._get_activity()
+
+        self._backend.update_activity({'id': '1', 'verb': 'share', 'published': self._published,
+                                       'actor': 'user:1', 'object': 'note:1'})
+
+        eq_('share', self._get_activity()[0]['verb'])
+
+    def test_rolled_back_writes_are_not_cached(self):
+        try:
+            with self._backend.transaction():
+                self._backend.update_activity({'id': '1', 'verb': 'post', 'published': self._published,
+                                               'actor': 'user:1', 'object': 'note:1', 'title': 'UNCOMMITTED'})
+                eq_('UNCOMMITTED', self._get_activity()[0]['title'])
+                raise ValueError()
+        except ValueError:
+            pass
+
+        eq_(None, self._get_activity()[0].get('title'))
+
+    def test_update_activity_returns_the_updated_activity(self):
+        self._get_activity()
+
+        updated = self._backend.update_activity({'id': '1', 'verb': 'post', 'published': self._published,
+                                                 'actor': 'user:1', 'object': 'note:1', 'title': 'NEW'})
+
+        eq_('NEW', updated[0]['title'])
+
+    def test_replica_reads_are_not_cached(self):
+        with patch.object(self._backend, '_get_read_context', return_value=False):
+            self._get_activity()
+
+        eq_(0, self._cache.stats()['size'])
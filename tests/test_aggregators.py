@@ -2,10 +2,13 @@ from __future__ import absolute_import
 
 from nose.tools import ok_, eq_, raises, set_trace
 
+from sunspear.aggregators.base import BaseAggregator, process_stream
 from sunspear.aggregators.property import PropertyAggregator
 
 from itertools import groupby
 
+import copy
+
 
 class TestPropertyAggregator(object):
     def setUp(self):
@@ -83,6 +86,18 @@ class TestPropertyAggregator(object):
         actual = self._aggregator._aggregate_activities(group_by_attributes=group_by_attributes, grouped_activities=_raw_group_actvities)
         eq_(actual, expected)
 
+    def test__aggregate_activities_does_not_mutate_activities(self):
+        group_by_attributes = ['b', 'c.e']
+
+        data_dict = [{'a': 1, 'b': 2, 'c': {'d': 3, 'e': 4}
+        }, {'a': 3, 'b': 2,  'c': {'d': 5, 'e': 4}
+        }]
+        original = copy.deepcopy(data_dict)
+
+        _raw_group_actvities = groupby(data_dict, self._aggregator._group_by_aggregator(group_by_attributes))
+        self._aggregator._aggregate_activities(group_by_attributes=group_by_attributes, grouped_activities=_raw_group_actvities)
+        eq_(data_dict, original)
+
     def test__listify_attributes(self):
         data_dict = {
             'a': 1,
@@ -117,3 +132,43 @@ class TestPropertyAggregator(object):
         expected = [1, 2, 4]
         actual = self._aggregator._group_by_aggregator(group_by_attributes=['a', 'b', 'a.c.f', 'c.e'])(data_dict)
         eq_(expected, actual)
+
+    def test_process_stream(self):
+        group_by_attributes = ['b', 'c.e']
+        aggregator = PropertyAggregator(properties=group_by_attributes)
+
+        data_dict = [{'a': 1, 'b': 2, 'c': {'d': 3, 'e': 4}
+        }, {'a': 3, 'b': 2,  'c': {'d': 5, 'e': 4}
+        }, {'a': 4, 'b': 2, 'c': {'d': 6, 'e': 4}
+        }, {'a': 5, 'b': 3, 'c': {'d': 6, 'e': 4}
+        }]
+        expected = aggregator.process(copy.deepcopy(data_dict), data_dict, [aggregator])
+
+        actual = aggregator.process_stream(iter(data_dict), [aggregator])
+        ok_(not isinstance(actual, list))
+        eq_(list(actual), expected)
+
+    def test_process_stream_with_window_size(self):
+        aggregator = PropertyAggregator(properties=['b'], window_size=2)
+
+        data_dict = [{'a': 1, 'b': 2}, {'a': 3, 'b': 2}, {'a': 4, 'b': 2}, {'a': 5, 'b': 3}]
+        expected = [
+            {'a': [1, 3], 'b': 2, 'grouped_by_attributes': ['b'], 'grouped_by_values': [2]},
+            {'a': 4, 'b': 2},
+            {'a': 5, 'b': 3},
+        ]
+
+        actual = aggregator.process_stream(iter(data_dict), [aggregator])
+        eq_(list(actual), expected)
+
+    def test_process_stream_pipeline(self):
+        pipeline = [PropertyAggregator(properties=['b']), BaseAggregator()]
+
+        data_dict = [{'a': 1, 'b': 2}, {'a': 3, 'b': 2}, {'a': 5, 'b': 3}]
+        expected = [
+            {'a': [1, 3], 'b': 2, 'grouped_by_attributes': ['b'], 'grouped_by_values': [2]},
+            {'a': 5, 'b': 3},
+        ]
+
+        actual = process_stream((activity for activity in data_dict), pipeline)
+        eq_(list(actual), expected)
@@ -0,0 +1,45 @@
+from __future__ import absolute_import
+
+from benchmarks.compare import (ADDED, IMPROVEMENT, REGRESSION, REMOVED,
+                                UNCHANGED, compare)
+from benchmarks.generators import DataGenerator
+from benchmarks.run import summarize
+
+from nose.tools import eq_, ok_
+
+
+class TestBenchmarks(object):
+    def test_summarize(self):
+        result = summarize([0.4, 0.1, 0.2, 0.3])
+
+        eq_(result['iterations'], 4)
+        eq_(result['min'], 0.1)
+        eq_(result['max'], 0.4)
+        ok_(abs(result['median'] - 0.25) < 1e-9)
+        eq_(result['p95'], 0.4)
+        ok_(abs(result['ops_per_sec'] - 4) < 1e-9)
+
+    def test_compare(self):
+        baseline = {'results': {
+            'sqlite.a': {'median': 1.0}, 'sqlite.b': {'median': 1.0}, 'sqlite.c': {'median': 1.0},
+            'sqlite.d': {'median': 1.0},
+        }}
+        current = {'results': {
+            'sqlite.a': {'median': 1.2}, 'sqlite.b': {'median': 0.8}, 'sqlite.c': {'median': 1.05},
+            'sqlite.e': {'median': 1.0},
+        }}
+
+        rows = compare(baseline, current, threshold=0.1)
+
+        eq_([(row[0], row[4]) for row in rows], [
+            ('sqlite.a', REGRESSION), ('sqlite.b', IMPROVEMENT), ('sqlite.c', UNCHANGED), ('sqlite.d', REMOVED),
+            ('sqlite.e', ADDED),
+        ])
+
+    def test_generator_is_deterministic(self):
+        eq_(DataGenerator(seed=1).activity('actor', audience=['a', 'b', 'c']),
+            DataGenerator(seed=1).activity('actor', audience=['a', 'b', 'c']))
+
+        activity = DataGenerator(audience_size=3).activity('actor', audience=['a', 'b', 'c'])
+        eq_(activity['to'], ['a', 'b'])
+        eq_(activity['cc'], ['c'])
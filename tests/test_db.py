@@ -8,7 +8,9 @@ from sqlalchemy import create_engine, sql
 from sqlalchemy.exc import IntegrityError
 from sunspear.activitystreams.models import Model
 from sunspear.backends.database.db import *
-from sunspear.exceptions import SunspearOperationNotSupportedException
+from sunspear.exceptions import (SunspearInvalidConfigurationError,
+                                 SunspearOperationNotSupportedException)
+from sunspear.instrumentation import RecordingInstrumentation
 
 from nose.tools import assert_raises, eq_, ok_, raises
 
@@ -376,6 +378,21 @@ class TestDatabaseBackend(object):
         for key, value in db_schema_dict['other_data'].items():
             eq_(obj_dict[key], value)
 
+    def test_strings_that_look_like_json_are_not_decoded(self):
+        published = self._datetime_to_string(self.now)
+        self._backend.create_obj({'objectType': 'user', 'id': '[1]', 'published': published})
+        self._backend.create_activity({
+            'id': '1', 'verb': 'post', 'actor': '[1]', 'content': '{"not": "json"}', 'published': published,
+            'object': {'objectType': 'note', 'id': '{2}', 'content': '[a note]', 'published': published},
+        })
+
+        activity = self._backend.get_activity('1', include_public=True)[0]
+
+        eq_('[1]', activity['actor']['id'])
+        eq_('{"not": "json"}', activity['content'])
+        eq_('{2}', activity['object']['id'])
+        eq_('[a note]', activity['object']['content'])
+
     def test_obj_create(self):
         self._backend.obj_create(self.test_obj)
 
@@ -634,6 +651,189 @@ class TestDatabaseBackend(object):
         eq_(original_activity['likes']['items'][0]['verb'], 'like')
         eq_(original_activity['likes']['items'][0]['actor']['id'], actor_id)
 
+    def _create_sub_activities(self, activity_id, sub_activity_verb, count):
+        # an actor likes an activity once
+        actors = [{"objectType": "user", "id": str(1234 + i), "published": datetime.datetime.utcnow()}
+                  for i in range(count)]
+        return [self._backend.create_sub_activity(activity_id, actor, "A {}.".format(sub_activity_verb),
+                                                  sub_activity_verb=sub_activity_verb)[0] for actor in actors]
+
+    def _count_rows(self, table):
+        return self._engine.execute(table.count()).scalar()
+
+    def test_delete_activity_with_sub_activities(self):
+        self._backend.create_activity(self.hydrated_test_activity)
+        replies = self._create_sub_activities(self.hydrated_test_activity['id'], 'reply', 2)
+        likes = self._create_sub_activities(self.hydrated_test_activity['id'], 'like', 2)
+
+        with self._backend.capture_queries() as capture:
+            eq_(1, self._backend.delete_activity(self.hydrated_test_activity['id']))
+
+        ok_(not self._backend.activity_exists(self.hydrated_test_activity))
+        for sub_activity in replies + likes:
+            ok_(not self._backend.activity_exists(sub_activity))
+        eq_(0, self._count_rows(self._backend.replies_table))
+        eq_(0, self._count_rows(self._backend.likes_table))
+        # the replies and likes are deleted with a subquery, then the activity
+        eq_(['DELETE', 'DELETE'], [query.statement.split()[0] for query in capture.queries])
+
+    def test_delete_activities(self):
+        activity_ids = []
+        for i in range(3):
+            activity = copy.deepcopy(self.hydrated_test_activity)
+            activity['id'] = str(i)
+            self._backend.create_activity(activity)
+            self._create_sub_activities(activity['id'], 'reply', 1)
+            activity_ids.append(activity['id'])
+
+        eq_(2, self._backend.delete_activities(activity_ids[:2] + ['missing'], batch_size=1))
+
+        eq_([False, False, True], [self._backend.activity_exists(activity_id) for activity_id in activity_ids])
+        eq_(1, self._count_rows(self._backend.replies_table))
+
+    def test_delete_sub_activity(self):
+        self._backend.create_activity(self.hydrated_test_activity)
+        replies = self._create_sub_activities(self.hydrated_test_activity['id'], 'reply', 2)
+
+        activity = self._backend.delete_sub_activity(replies[0]['id'], 'reply')
+
+        eq_(1, activity['replies']['totalItems'])
+        eq_(replies[1]['id'], activity['replies']['items'][0]['object']['id'])
+        ok_(not self._backend.activity_exists(replies[0]))
+
+    @raises(SunspearValidationException)
+    def test_delete_sub_activity_with_the_wrong_verb(self):
+        self._backend.create_activity(self.hydrated_test_activity)
+        like = self._create_sub_activities(self.hydrated_test_activity['id'], 'like', 1)[0]
+
+        self._backend.delete_sub_activity(like['id'], 'reply')
+
+    def test_update_activity(self):
+        self.hydrated_test_activity['to'] = [self.test_objs[0]]
+        self._backend.create_activity(self.hydrated_test_activity)
+        self._create_sub_activities(self.hydrated_test_activity['id'], 'reply', 1)
+
+        activity = copy.deepcopy(self.hydrated_test_activity)
+        activity['content'] = 'Updated content'
+        activity.pop('to', None)
+        activity['cc'] = [self.test_objs[0]['id']]
+        self._backend.update_activity(activity)
+
+        activity = self._backend.get_activity(activity['id'], audience_targeting={'cc': [self.test_objs[0]['id']]})[0]
+        eq_('Updated content', activity['content'])
+        eq_(1, activity['replies']['totalItems'])
+        eq_(0, self._count_rows(self._backend.to_table))
+        ok_(self._backend.audience_targeting_exists('cc', activity['id'], self.test_objs[0]['id']))
+
+    def test_update_activity_creates_a_missing_activity(self):
+        self._backend.update_activity(self.hydrated_test_activity)
+        ok_(self._backend.activity_exists(self.hydrated_test_activity))
+
+    def test_iter_objects(self):
+        db_objs = map(self._backend._obj_dict_to_db_schema, self.test_objs)
+        self._engine.execute(self._backend.objects_table.insert(), db_objs)
+
+        objs = list(self._backend.iter_objects(batch_size=2))
+
+        eq_([obj['id'] for obj in objs], sorted([obj['id'] for obj in self.test_objs]))
+        eq_([obj for obj in objs if obj['id'] == self.test_obj['id']][0], self.test_obj)
+
+    def test_iter_objects_since(self):
+        db_objs = map(self._backend._obj_dict_to_db_schema, self.test_objs)
+        self._engine.execute(self._backend.objects_table.insert(), db_objs)
+
+        eq_(list(self._backend.iter_objects(since=self.now + datetime.timedelta(days=1))), [])
+        eq_(len(list(self._backend.iter_objects(since=self.now - datetime.timedelta(days=1)))), len(self.test_objs))
+
+    def test_iter_objects_after(self):
+        db_objs = map(self._backend._obj_dict_to_db_schema, self.test_objs)
+        self._engine.execute(self._backend.objects_table.insert(), db_objs)
+        obj_ids = sorted([obj['id'] for obj in self.test_objs])
+
+        eq_(obj_ids[2:], [obj['id'] for obj in self._backend.iter_objects(batch_size=1, after=obj_ids[1])])
+
+    def test_iter_activities(self):
+        self._backend.create_activity(self.hydrated_test_activity)
+        self._create_replies_for_activity(self.hydrated_test_activity, n=2)
+
+        activities = list(self._backend.iter_activities(batch_size=1))
+
+        eq_(len(activities), 3)
+        eq_(len(set(activity['id'] for activity in activities)), 3)
+        activity = [activity for activity in activities if activity['id'] == self.test_activity['id']][0]
+        eq_(activity['actor'], self.test_activity['actor'])
+        eq_(activity['object'], self.test_activity['object'])
+
+    def test_bulk_create_objects(self):
+        eq_(self._backend.bulk_create_objects(self.test_objs), len(self.test_objs))
+        ok_(self._backend.obj_exists(self.test_obj))
+
+        changed_obj = dict(self.test_obj, content='changed')
+        eq_(self._backend.bulk_create_objects([changed_obj]), 0)
+        eq_(self._backend.get_obj([self.test_obj['id']])[0]['content'], self.test_obj['content'])
+
+        eq_(self._backend.bulk_create_objects([changed_obj], on_conflict='overwrite'), 1)
+        eq_(self._backend.get_obj([self.test_obj['id']])[0]['content'], 'changed')
+
+    @raises(SunspearInvalidConfigurationError)
+    def test_bulk_create_objects_with_unknown_conflict_strategy(self):
+        self._backend.bulk_create_objects(self.test_objs, on_conflict='merge')
+
+    def test_bulk_create_activities_and_sub_activities(self):
+        self._backend.create_activity(self.hydrated_test_activity)
+        self._create_replies_for_activity(self.hydrated_test_activity, n=2)
+        expected = self._backend.get_activity([self.test_activity['id']])[0]
+
+        objs = list(self._backend.iter_objects())
+        activities = list(self._backend.iter_activities())
+        self._backend.drop_tables()
+        self._backend.create_tables()
+
+        eq_(self._backend.bulk_create_objects(objs), len(objs))
+        eq_(self._backend.bulk_create_activities(activities), 3)
+        eq_(self._backend.bulk_create_sub_activities(activities), 2)
+        self._assert_same_activity(self._backend.get_activity([self.test_activity['id']])[0], expected)
+
+        eq_(self._backend.bulk_create_activities(activities), 0)
+        eq_(self._backend.bulk_create_sub_activities(activities), 0)
+        eq_(self._backend.bulk_create_activities(activities, on_conflict='overwrite'), 3)
+        self._assert_same_activity(self._backend.get_activity([self.test_activity['id']])[0], expected)
+
+    def test_bulk_create_sub_activities_ignores_missing_parents(self):
+        self._backend.create_activity(self.hydrated_test_activity)
+        self._create_replies_for_activity(self.hydrated_test_activity, n=2)
+
+        objs = list(self._backend.iter_objects())
+        replies = [activity for activity in self._backend.iter_activities() if activity['verb'] == 'reply']
+        self._backend.drop_tables()
+        self._backend.create_tables()
+
+        self._backend.bulk_create_objects(objs)
+        self._backend.bulk_create_activities(replies)
+        eq_(self._backend.bulk_create_sub_activities(replies), 0)
+
+    def test_get_activity_reports_phases(self):
+        self._backend.create_activity(self.hydrated_test_activity)
+        instrumentation = RecordingInstrumentation()
+        self._backend.set_instrumentation(instrumentation)
+        try:
+            self._backend.get_activity([self.test_activity['id']])
+        finally:
+            self._backend.set_instrumentation(None)
+
+        for name in ['get_activity', 'fetch', 'hydrate', 'hydrate_sub_activity', 'extract_object_keys', 'get_obj']:
+            ok_(name in instrumentation.span_names(), name)
+        # the activities, their objects, and their replies and likes
+        eq_(instrumentation.counters['db.statements'], 4)
+
+    def _assert_same_activity(self, actual, expected):
+        # the reply actor was inserted without validation, so only compare what the import is responsible for
+        eq_(dict((k, v) for k, v in actual.items() if k != 'replies'),
+            dict((k, v) for k, v in expected.items() if k != 'replies'))
+        eq_(actual['replies']['totalItems'], expected['replies']['totalItems'])
+        eq_(sorted(reply['object']['id'] for reply in actual['replies']['items']),
+            sorted(reply['object']['id'] for reply in expected['replies']['items']))
+
     def _datetime_to_db_compatibal_str(self, datetime_instance):
         return datetime_instance.strftime('%Y-%m-%d %H:%M:%S')
 
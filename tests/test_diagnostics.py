@@ -0,0 +1,117 @@
+from __future__ import absolute_import
+
+import datetime
+
+from sunspear.backends.database import schema
+from sunspear.backends.database.db import DatabaseBackend
+from sunspear.backends.database.diagnostics import (_EXPLAIN_PREFIXES,
+                                                    QueryCapture,
+                                                    _check_mysql_plan,
+                                                    _check_postgresql_plan)
+
+from mock import Mock, patch
+from nose.tools import eq_, ok_
+
+
+class TestQueryCapture(object):
+    def setUp(self):
+        self._backend = DatabaseBackend(db_connection_string='sqlite://')
+        self._backend.create_tables()
+
+        published = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S') + 'Z'
+        self._backend.create_activity({
+            'id': '1', 'verb': 'post', 'published': published,
+            'to': [{'id': 'friend', 'objectType': 'user', 'published': published}],
+            'actor': {'id': 'actor', 'objectType': 'user', 'published': published},
+            'object': {'id': 'note', 'objectType': 'note', 'published': published},
+        })
+
+    def tearDown(self):
+        self._backend.drop_tables()
+        self._backend.engine.dispose()
+
+    def test_capture_queries(self):
+        with self._backend.capture_queries() as capture:
+            self._backend.get_activity(['1'], audience_targeting={'to': ['friend']})
+
+        eq_(4, len(capture.queries))
+        ok_(capture.queries[0].statement.startswith('SELECT activities.id'))
+        ok_(all(query.plan is None for query in capture.queries))
+        ok_(capture.total_duration > 0)
+
+    def test_capture_stops_on_exit(self):
+        with self._backend.capture_queries() as capture:
+            pass
+        self._backend.get_activity(['1'])
+
+        eq_([], capture.queries)
+
+    def test_capture_queries_with_explain(self):
+        with self._backend.capture_queries(explain=True) as capture:
+            self._backend.get_activity(['1'], audience_targeting={'to': ['friend']})
+
+        ok_(all(query.plan for query in capture.queries))
+        ok_('plan:' in capture.report())
+        eq_([], capture.warnings)
+
+    def test_explain_flags_missing_indexes(self):
+        for index in schema.to_table.indexes:
+            index.drop(self._backend.engine)
+
+        with self._backend.capture_queries(explain=True) as capture:
+            self._backend.get_activity(['1'], audience_targeting={'to': ['friend']})
+
+        ok_(capture.queries[0].warnings)
+        ok_('WARNING' in capture.report())
+
+    def test_failed_explain_is_a_warning(self):
+        with patch.dict(_EXPLAIN_PREFIXES, {'sqlite': 'EXPLAIN NOTHING '}):
+            with self._backend.capture_queries(explain=True) as capture:
+                eq_(1, len(self._backend.get_activity(['1'], audience_targeting={'to': ['friend']})))
+
+        ok_(capture.queries[0].plan is None)
+        ok_(capture.queries[0].warnings[0].startswith('EXPLAIN failed: '))
+
+    def test_failed_explain_is_rolled_back_to_a_savepoint(self):
+        cursor = Mock()
+        cursor.execute.side_effect = lambda statement, *args: statement.startswith('EXPLAIN') and 1 / 0
+        conn = Mock(info={})
+        conn.dialect.name = 'postgresql'
+        conn.connection.cursor.return_value = cursor
+
+        capture = QueryCapture([], explain=True)
+        capture._before_cursor_execute(conn, cursor, 'SELECT 1', (), None, False)
+        capture._after_cursor_execute(conn, cursor, 'SELECT 1', (), None, False)
+
+        eq_(['SAVEPOINT sunspear_explain', 'EXPLAIN SELECT 1', 'ROLLBACK TO SAVEPOINT sunspear_explain'],
+            [args[0] for args, kwargs in cursor.execute.call_args_list])
+        ok_(capture.queries[0].warnings[0].startswith('EXPLAIN failed: '))
+
+    def test_statements_started_before_capturing_are_skipped(self):
+        with self._backend.capture_queries() as capture:
+            capture._after_cursor_execute(Mock(info={}), Mock(), 'SELECT 1', (), None, False)
+
+        eq_([], capture.queries)
+
+    def test_explain_skips_writes(self):
+        with self._backend.capture_queries(explain=True) as capture:
+            self._backend.update_obj({'id': 'actor', 'objectType': 'user', 'published': '2012-07-05T12:00:00Z'})
+
+        ok_([query for query in capture.queries if not query.is_select])
+        ok_(all(query.plan is None for query in capture.queries if not query.is_select))
+
+    def test_check_mysql_plan(self):
+        plan = [
+            {'table': 'activities', 'type': 'range', 'key': 'PRIMARY', 'Extra': 'Using where'},
+            {'table': 'to', 'type': 'ALL', 'key': None, 'Extra': 'Using where; Using temporary; Using filesort'},
+        ]
+
+        eq_(['full scan of to', 'filesort for to', 'temporary table for to'], _check_mysql_plan(plan))
+
+    def test_check_postgresql_plan(self):
+        plan = [
+            {'QUERY PLAN': 'Hash Right Join  (cost=1.09..2.23 rows=1 width=8)'},
+            {'QUERY PLAN': '  ->  Seq Scan on replies  (cost=0.00..1.07 rows=7 width=8)'},
+        ]
+
+        eq_(['full scan of replies'], _check_postgresql_plan(plan))
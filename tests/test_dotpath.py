@@ -0,0 +1,77 @@
+from __future__ import absolute_import
+
+from sunspear.lib.dotpath import compile_path, get_path, has_path, set_path
+
+from nose.tools import ok_, eq_, raises
+
+
+class TestDotPath(object):
+    def setUp(self):
+        self._test_dict = {
+            'a': 1,
+            'b': 2,
+            'c': 3,
+            'd': {
+                'e': 4,
+                'f': {
+                    'g': 6
+                }
+            }
+        }
+
+    def test_compile_path_is_cached(self):
+        ok_(compile_path('d.f.g') is compile_path('d.f.g'))
+
+    def test_getter(self):
+        getter = compile_path('d.f.g')[0]
+        eq_(getter(self._test_dict), 6)
+        eq_(compile_path('a')[0](self._test_dict), 1)
+
+    @raises(KeyError)
+    def test_getter_key_error(self):
+        compile_path('z')[0](self._test_dict)
+
+    @raises(KeyError)
+    def test_getter_key_error_nested(self):
+        compile_path('a.z')[0](self._test_dict)
+
+    @raises(KeyError)
+    def test_getter_key_error_multi_nested(self):
+        compile_path('d.f.z')[0](self._test_dict)
+
+    def test_get_path(self):
+        eq_(get_path(self._test_dict, "a"), 1)
+        eq_(get_path(self._test_dict, "d.e"), 4)
+        eq_(get_path(self._test_dict, "d.f.g"), 6)
+
+    def test_get_path_default(self):
+        eq_(get_path(self._test_dict, "z"), None)
+        eq_(get_path(self._test_dict, "a.z"), None)
+        eq_(get_path(self._test_dict, "d.f.z", "zed"), "zed")
+
+    def test_set_path(self):
+        set_path(self._test_dict, "d.f.g", 7)
+        set_path(self._test_dict, "d.y.z", 8)
+        set_path(self._test_dict, "x", 9)
+
+        eq_(self._test_dict['d']['f']['g'], 7)
+        eq_(self._test_dict['d']['y'], {'z': 8})
+        eq_(self._test_dict['x'], 9)
+
+    @raises(KeyError)
+    def test_set_path_through_non_dict(self):
+        set_path(self._test_dict, "a.z", 1)
+
+    def test_has_path(self):
+        ok_(has_path(self._test_dict, "a"))
+        ok_(has_path(self._test_dict, "d.f.g"))
+
+        ok_(not has_path(self._test_dict, "z"))
+        ok_(not has_path(self._test_dict, "a.z"))
+        ok_(not has_path(self._test_dict, "d.f.g.z"))
+
+    def test_works_on_plain_dicts(self):
+        get_path(self._test_dict, "d.f.g")
+
+        eq_(type(self._test_dict['d']), dict)
+        eq_(type(self._test_dict['d']['f']), dict)
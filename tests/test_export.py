@@ -0,0 +1,37 @@
+from __future__ import absolute_import
+
+import json
+from StringIO import StringIO
+
+from mock import MagicMock
+from sunspear.export import dump_jsonl, iter_records
+
+from nose.tools import eq_
+
+
+class TestExport(object):
+    def setUp(self):
+        self._backend = MagicMock()
+        self._backend.iter_objects.return_value = iter([{'id': '1', 'objectType': 'user'}])
+        self._backend.iter_activities.return_value = iter([{'id': '2', 'verb': 'post', 'actor': '1'}])
+
+    def test_iter_records(self):
+        records = list(iter_records(self._backend, batch_size=10))
+
+        eq_(records, [
+            {'kind': 'object', 'data': {'id': '1', 'objectType': 'user'}},
+            {'kind': 'activity', 'data': {'id': '2', 'verb': 'post', 'actor': '1'}},
+        ])
+        self._backend.iter_objects.assert_called_once_with(batch_size=10, since=None)
+        self._backend.iter_activities.assert_called_once_with(batch_size=10, since=None)
+
+    def test_dump_jsonl(self):
+        fp = StringIO()
+
+        count = dump_jsonl(self._backend, fp)
+
+        eq_(count, 2)
+        lines = fp.getvalue().splitlines()
+        eq_(len(lines), 2)
+        eq_(json.loads(lines[0]), {'kind': 'object', 'data': {'id': '1', 'objectType': 'user'}})
+        eq_(json.loads(lines[1]), {'kind': 'activity', 'data': {'id': '2', 'verb': 'post', 'actor': '1'}})
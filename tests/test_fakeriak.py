@@ -0,0 +1,158 @@
+from __future__ import absolute_import
+
+import datetime
+
+from riak import RiakError
+from sunspear.backends.riak import RiakBackend
+from sunspear.testing.fakeriak import FakeRiakClient, FakeRiakServer
+
+from nose.tools import eq_, ok_, raises
+
+
+class TestFakeRiakServer(object):
+    def setUp(self):
+        self._server = FakeRiakServer(stream_chunk_size=2)
+        self._backend = RiakBackend(client=FakeRiakClient(server=self._server))
+
+        published = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S') + 'Z'
+        for obj_id in ['actor', 'friend', 'stranger']:
+            self._backend.create_obj({'id': obj_id, 'objectType': 'user', 'published': published})
+        self._backend.create_activity({
+            'id': '1', 'verb': 'post', 'actor': 'actor', 'object': {'id': 'note', 'objectType': 'note', 'published': published},
+            'to': ['friend'], 'published': published})
+        self._backend.create_activity({
+            'id': '2', 'verb': 'share', 'actor': 'actor', 'object': 'note', 'published': published})
+
+    def test_create_and_get_activities(self):
+        self._backend.create_sub_activity('1', 'friend', 'Nice!', sub_activity_verb='reply')
+        self._backend.create_sub_activity('1', 'friend', '', sub_activity_verb='like')
+
+        activities = self._backend.get_activity(['1', '2'], audience_targeting={'to': ['friend']}, include_public=True)
+
+        eq_(['1', '2'], [activity['id'] for activity in activities])
+        eq_('actor', activities[0]['actor']['id'])
+        eq_('note', activities[0]['object']['id'])
+        eq_(1, activities[0]['replies']['totalItems'])
+        eq_(1, activities[0]['likes']['totalItems'])
+
+    def test_get_activities_filters_by_audience_targeting(self):
+        activities = self._backend.get_activity(['1', '2'], audience_targeting={'to': ['stranger']})
+
+        eq_([], activities)
+
+    def test_get_activities_with_filters(self):
+        activities = self._backend.get_activity(['1', '2'], filters={'verb': ['share']})
+
+        eq_(['2'], [activity['id'] for activity in activities])
+
+    def test_get_activities_with_registered_raw_filter(self):
+        raw_filter = 'function(obj) { return obj.verb == "post"; }'
+        self._server.register_raw_filter(raw_filter, lambda obj: obj['verb'] == 'post')
+
+        activities = self._backend._get_many_activities(activity_ids=['1', '2'], raw_filter=raw_filter)
+
+        eq_(['1'], [activity['id'] for activity in activities])
+
+    @raises(NotImplementedError)
+    def test_get_activities_with_unknown_raw_filter(self):
+        self._backend._get_many_activities(activity_ids=['1', '2'], raw_filter='function(obj) { return true; }')
+
+    def test_get_obj_skips_missing_objects(self):
+        eq_(['actor'], [obj['id'] for obj in self._backend.get_obj(['actor', 'missing'])])
+
+    def test_iter_objects_streams_keys(self):
+        eq_(['actor', 'friend', 'note', 'stranger'], sorted(obj['id'] for obj in self._backend.iter_objects(batch_size=1)))
+        eq_(['actor', 'friend', 'note', 'stranger'], self._server.keys('objects'))
+
+    def test_get_index_pages(self):
+        results = self._backend._objects.get_index('$bucket', 'objects', max_results=3)
+
+        eq_(['actor', 'friend', 'note'], list(results))
+        ok_(results.has_next_page())
+        eq_(['stranger'], list(results.next_page()))
+
+    def test_delete(self):
+        self._backend.delete_obj({'id': 'stranger'})
+
+        eq_(['actor', 'friend', 'note'], self._server.keys('objects'))
+
+    def test_request_counts(self):
+        self._server.request_counts.clear()
+
+        self._backend.get_obj(['actor', 'friend'])
+
+        eq_(1, self._server.request_counts['mapred'])
+        eq_(0, self._server.request_counts['put'])
+
+    def test_inject_fault(self):
+        self._server.inject_fault('put', times=2)
+
+        for _ in range(2):
+            try:
+                self._backend.create_obj({'id': 'new', 'objectType': 'user', 'published': '2012-07-05T12:00:00Z'})
+            except RiakError:
+                pass
+            else:
+                ok_(False, "put did not fail")
+        self._backend.create_obj({'id': 'new', 'objectType': 'user', 'published': '2012-07-05T12:00:00Z'})
+
+        ok_('new' in self._server.keys('objects'))
+
+    @raises(ValueError)
+    def test_inject_fault_with_custom_error(self):
+        self._server.inject_fault(error=ValueError('boom'))
+
+        self._backend.get_obj(['actor'])
+
+    @raises(ValueError)
+    def test_inject_fault_for_unknown_operation(self):
+        self._server.inject_fault('update')
+
+    @raises(RiakError)
+    def test_failure_rate(self):
+        self._server.failure_rate = 1.0
+
+        self._backend.get_obj(['actor'])
+
+    def test_latency(self):
+        self._server.latency = {'get': 0.02}
+
+        start = datetime.datetime.utcnow()
+        ok_(self._backend._objects.get('actor').exists)
+
+        ok_(datetime.datetime.utcnow() - start >= datetime.timedelta(seconds=0.02))
+
+    @raises(RiakError)
+    def test_latency_above_timeout(self):
+        self._server.latency = lambda operation: 0.05
+
+        self._backend._objects.get('actor', timeout=10)
+
+    def test_allow_mult_keeps_concurrent_writes_as_siblings(self):
+        self._backend._objects.allow_mult = True
+        first, second = self._backend._objects.get('actor'), self._backend._objects.get('actor')
+
+        first.data = dict(first.data, displayName='first')
+        first.store()
+        second.data = dict(second.data, displayName='second')
+        second.store()
+
+        eq_(2, self._server.siblings('objects', 'actor'))
+        riak_obj = self._backend._objects.get('actor')
+        eq_(['first', 'second'], sorted(sibling.data['displayName'] for sibling in riak_obj.siblings))
+
+        # a write with the vector clock of both siblings replaces them
+        riak_obj.siblings = riak_obj.siblings[:1]
+        riak_obj.store()
+        eq_(1, self._server.siblings('objects', 'actor'))
+
+    def test_last_write_wins_without_allow_mult(self):
+        first, second = self._backend._objects.get('actor'), self._backend._objects.get('actor')
+
+        first.data = dict(first.data, displayName='first')
+        first.store()
+        second.data = dict(second.data, displayName='second')
+        second.store()
+
+        eq_(1, self._server.siblings('objects', 'actor'))
+        eq_('second', self._backend._objects.get('actor').data['displayName'])
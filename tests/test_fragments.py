@@ -0,0 +1,124 @@
+from __future__ import absolute_import
+
+import json
+
+from sunspear.backends.database.db import DatabaseBackend
+from sunspear.fragments import FragmentEncoder
+
+from nose.tools import eq_, ok_
+
+
+class TestFragmentEncoder(object):
+    def setUp(self):
+        self._now = [0]
+        self._encoder = FragmentEncoder(max_size=2, max_age=60, min_size=0, clock=lambda: self._now[0])
+
+        self._actor = {'objectType': 'user', 'id': 'user:1', 'displayName': u'User \u0268',
+                       'published': '2016-01-01T00:00:00Z'}
+        self._activity = {
+            'id': '1', 'verb': 'post', 'actor': self._actor, 'published': '2016-01-01T00:00:00Z',
+            'object': {'objectType': 'note', 'id': 'note:1', 'content': 'a note', 'published': '2016-01-01T00:00:00Z'},
+            'to': [self._actor],
+            'replies': {'totalItems': 1, 'items': [{
+                'verb': 'reply', 'actor': self._actor, 'object': {'id': '2', 'objectType': 'activity'},
+            }]},
+        }
+
+    def _encode(self, activities):
+        return json.loads(self._encoder.encode_activities(activities).decode('utf-8'))
+
+    def test_encode_activities(self):
+        eq_([self._activity, self._activity], self._encode([self._activity, self._activity]))
+        eq_([], self._encode([]))
+
+    def test_fragments_are_reused(self):
+        self._encoder.encode_activity(self._activity)
+
+        self._actor['displayName'] = 'changed'
+        eq_(u'User \u0268', self._encode([self._activity])[0]['actor']['displayName'])
+
+        self._actor['updated'] = '2016-01-02T00:00:00Z'
+        eq_('changed', self._encode([self._activity])[0]['actor']['displayName'])
+
+    def test_small_objects_are_encoded_with_the_page(self):
+        self._encoder.min_size = 1000
+        self._encoder.encode_activity(self._activity)
+
+        self._actor['displayName'] = 'changed'
+
+        eq_('changed', self._encode([self._activity])[0]['actor']['displayName'])
+        eq_((None, None,), (self._encoder._fragments['user:1'][1], self._encoder._fragments['note:1'][1],))
+
+    def test_values_like_placeholders_are_kept(self):
+        self._activity['content'] = '"__fragment_0'
+        self._actor['displayName'] = '__fragment_0'
+
+        eq_([self._activity], self._encode([self._activity]))
+
+    def test_invalidate(self):
+        self._encoder.encode_activity(self._activity)
+
+        self._actor['displayName'] = 'changed'
+        self._encoder.invalidate('user:1')
+
+        eq_('changed', self._encode([self._activity])[0]['actor']['displayName'])
+
+    def test_fragments_expire(self):
+        self._encoder.encode_activity(self._activity)
+
+        self._actor['displayName'] = 'changed'
+        self._now[0] = 60
+
+        eq_('changed', self._encode([self._activity])[0]['actor']['displayName'])
+
+    def test_oldest_fragments_are_dropped(self):
+        self._encoder.encode_activity(self._activity)
+        self._encoder.encode_activity({'id': '3', 'verb': 'post', 'actor': {
+            'objectType': 'user', 'id': 'user:2', 'published': '2016-01-01T00:00:00Z'}})
+
+        eq_(['note:1', 'user:2'], sorted(self._encoder._fragments))
+
+    def test_references_and_empty_activities(self):
+        eq_([{}], self._encode([{}]))
+
+        activity = {'verb': 'post', 'actor': 'user:1', 'to': [], 'likes': {'totalItems': 0, 'items': []}}
+        eq_([activity], self._encode([activity]))
+        eq_([], list(self._encoder._fragments))
+
+
+class TestGetActivityJSON(object):
+    def setUp(self):
+        self._backend = DatabaseBackend(db_connection_string='sqlite://')
+        self._backend.create_tables()
+        self._backend.set_fragment_encoder(FragmentEncoder(min_size=0))
+
+        self._published = '2016-01-01T00:00:00Z'
+        self._backend.create_activity({
+            'id': '1', 'verb': 'post', 'published': self._published,
+            'actor': {'objectType': 'user', 'id': 'user:1', 'displayName': 'User', 'published': self._published},
+            'object': {'objectType': 'note', 'id': 'note:1', 'content': 'a note', 'published': self._published},
+        })
+
+    def tearDown(self):
+        self._backend.drop_tables()
+        self._backend.engine.dispose()
+
+    def _get_activity_json(self):
+        return json.loads(self._backend.get_activity_json(['1'], include_public=True).decode('utf-8'))
+
+    def test_get_activity_json(self):
+        eq_(self._backend.get_activity(['1'], include_public=True), self._get_activity_json())
+
+    def test_updated_objects_are_encoded_again(self):
+        self._get_activity_json()
+
+        self._backend.update_obj({'objectType': 'user', 'id': 'user:1', 'displayName': 'Changed',
+                                  'published': self._published})
+
+        eq_('Changed', self._get_activity_json()[0]['actor']['displayName'])
+
+    def test_get_activity_json_without_an_encoder(self):
+        self._backend.set_fragment_encoder(None)
+
+        eq_(self._backend.get_activity(['1'], include_public=True), self._get_activity_json())
+        ok_(isinstance(self._backend.get_activity_json(['1'], include_public=True), bytes))
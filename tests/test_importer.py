@@ -0,0 +1,68 @@
+from __future__ import absolute_import
+
+import json
+from StringIO import StringIO
+
+from mock import MagicMock, call
+from sunspear.exceptions import SunspearInvalidConfigurationError
+from sunspear.importer import load_jsonl
+
+from nose.tools import eq_, raises
+
+
+class TestImporter(object):
+    def setUp(self):
+        self._objs = [{'id': str(i), 'objectType': 'user'} for i in range(5)]
+        self._activities = [
+            {'id': 'a1', 'verb': 'post', 'actor': '0', 'object': '1'},
+            {'id': 'a2', 'verb': 'reply', 'actor': '0', 'object': '2'},
+            {'id': 'a3', 'verb': 'like', 'actor': '0', 'object': '3'},
+        ]
+        records = [{'kind': 'object', 'data': obj} for obj in self._objs] + \
+            [{'kind': 'activity', 'data': activity} for activity in self._activities]
+        self._fp = StringIO('\n'.join(json.dumps(record) for record in records) + '\n')
+
+        self._calls = []
+        self._backend = MagicMock()
+        self._backend.bulk_create_objects.side_effect = self._record('object')
+        self._backend.bulk_create_activities.side_effect = self._record('activity')
+        self._backend.bulk_create_sub_activities.side_effect = self._record('sub_activity')
+
+    def _record(self, kind):
+        def bulk_create(batch, on_conflict=None):
+            self._calls.append(kind)
+            return len(batch)
+        return bulk_create
+
+    def test_load_jsonl(self):
+        progress = load_jsonl(self._backend, self._fp, batch_size=2, workers=2)
+
+        eq_(progress.records_read, 8)
+        eq_(progress.counts, {'object': 5, 'activity': 3, 'sub_activity': 2})
+        eq_(self._backend.bulk_create_objects.call_args_list, [
+            call(self._objs[0:2], on_conflict='skip'),
+            call(self._objs[2:4], on_conflict='skip'),
+            call(self._objs[4:], on_conflict='skip'),
+        ])
+        eq_(self._backend.bulk_create_activities.call_args_list, [
+            call(self._activities[0:2], on_conflict='skip'),
+            call(self._activities[2:], on_conflict='skip'),
+        ])
+        self._backend.bulk_create_sub_activities.assert_called_once_with(self._activities[1:], on_conflict='skip')
+
+    def test_load_jsonl_writes_each_kind_before_the_next(self):
+        load_jsonl(self._backend, self._fp, batch_size=1, workers=4)
+
+        eq_(self._calls, ['object'] * 5 + ['activity'] * 3 + ['sub_activity'] * 2)
+
+    def test_load_jsonl_reports_progress(self):
+        progress_callback = MagicMock()
+
+        load_jsonl(self._backend, self._fp, batch_size=2, on_conflict='overwrite', progress_callback=progress_callback)
+
+        eq_(progress_callback.call_count, 6)
+        eq_(self._backend.bulk_create_objects.call_args[1], {'on_conflict': 'overwrite'})
+
+    @raises(SunspearInvalidConfigurationError)
+    def test_load_jsonl_with_unknown_conflict_strategy(self):
+        load_jsonl(self._backend, self._fp, on_conflict='merge')
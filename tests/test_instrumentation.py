@@ -0,0 +1,133 @@
+from __future__ import absolute_import
+
+import logging
+
+from mock import MagicMock, call
+from sunspear.aggregators.property import PropertyAggregator
+from sunspear.backends.riak import RiakBackend
+from sunspear.instrumentation import (LoggingInstrumentation,
+                                      NullInstrumentation,
+                                      RecordingInstrumentation,
+                                      StatsdInstrumentation)
+from sunspear.testing.fakeriak import FakeRiakClient
+
+from nose.tools import eq_, ok_
+
+
+class TestInstrumentation(object):
+    def test_null_instrumentation(self):
+        instrumentation = NullInstrumentation()
+
+        with instrumentation.span('fetch', count=1):
+            instrumentation.incr('db.statements')
+            instrumentation.gauge('db.pool.checked_out', 1)
+
+    def test_recording_instrumentation(self):
+        instrumentation = RecordingInstrumentation()
+
+        with instrumentation.span('get_activity'):
+            with instrumentation.span('fetch', count=2):
+                instrumentation.incr('db.statements')
+                instrumentation.incr('db.statements', 2)
+
+        eq_(['fetch', 'get_activity'], instrumentation.span_names())
+        eq_({'count': 2}, instrumentation.spans[0][2])
+        eq_({'db.statements': 3}, instrumentation.counters)
+        ok_(instrumentation.total('get_activity') >= instrumentation.total('fetch'))
+
+    def test_span_is_recorded_when_it_raises(self):
+        instrumentation = RecordingInstrumentation()
+
+        try:
+            with instrumentation.span('fetch'):
+                raise ValueError()
+        except ValueError:
+            pass
+
+        eq_(['fetch'], instrumentation.span_names())
+
+    def test_statsd_instrumentation(self):
+        client = MagicMock()
+        instrumentation = StatsdInstrumentation(client, prefix='feeds')
+
+        with instrumentation.span('fetch'):
+            pass
+        instrumentation.incr('riak.mapreduce', 2)
+
+        eq_('feeds.fetch', client.timing.call_args[0][0])
+        client.incr.assert_called_once_with('feeds.riak.mapreduce', 2)
+
+    def test_statsd_instrumentation_gauge(self):
+        client = MagicMock()
+        instrumentation = StatsdInstrumentation(client)
+
+        instrumentation.gauge('db.pool.checked_out', 3, pool='replica0')
+
+        client.gauge.assert_called_once_with('sunspear.db.pool.checked_out.replica0', 3)
+
+    def test_statsd_instrumentation_tags(self):
+        client = MagicMock()
+        instrumentation = StatsdInstrumentation(client)
+
+        instrumentation.incr('riak.requests', 3, operation='get')
+        instrumentation.incr('db.statements', pool='replica0')
+        instrumentation.timing('fetch', 0.002, pool='primary', operation='get')
+
+        eq_([call('sunspear.riak.requests.get', 3), call('sunspear.db.statements.replica0', 1)],
+            client.incr.call_args_list)
+        client.timing.assert_called_once_with('sunspear.fetch.get.primary', 2.0)
+
+    def test_recording_instrumentation_gauge(self):
+        instrumentation = RecordingInstrumentation()
+
+        instrumentation.gauge('db.pool.checked_out', 3, pool='primary')
+        instrumentation.gauge('db.pool.checked_out', 2, pool='primary')
+
+        eq_({('db.pool.checked_out', (('pool', 'primary',),),): 2}, instrumentation.gauges)
+
+    def test_logging_instrumentation(self):
+        logger = MagicMock()
+        logger.isEnabledFor.return_value = True
+        instrumentation = LoggingInstrumentation(logger, level=logging.INFO)
+
+        with instrumentation.span('fetch', count=2):
+            pass
+        instrumentation.incr('db.statements')
+
+        eq_(logging.INFO, logger.log.call_args_list[0][0][0])
+        eq_('fetch', logger.log.call_args_list[0][0][2])
+        eq_(' (count=2)', logger.log.call_args_list[0][0][4])
+        eq_('db.statements', logger.log.call_args_list[1][0][2])
+
+    def test_logging_instrumentation_skips_disabled_level(self):
+        logger = MagicMock()
+        logger.isEnabledFor.return_value = False
+
+        LoggingInstrumentation(logger).incr('db.statements')
+
+        ok_(not logger.log.called)
+
+    def test_backend_reports_phases(self):
+        instrumentation = RecordingInstrumentation()
+        backend = RiakBackend(client=FakeRiakClient(), instrumentation=instrumentation)
+        published = '2012-07-05T12:00:00Z'
+        backend.create_activity({
+            'id': '1', 'verb': 'post', 'published': published,
+            'actor': {'id': 'actor', 'objectType': 'user', 'published': published},
+            'object': {'id': 'note', 'objectType': 'note', 'published': published},
+        })
+        instrumentation.reset()
+
+        backend.get_activity(['1'], aggregation_pipeline=[PropertyAggregator(properties=['verb'])])
+
+        for name in ['get_activity', 'fetch', 'hydrate', 'hydrate_sub_activity', 'extract_object_keys', 'get_obj',
+                     'aggregation']:
+            ok_(name in instrumentation.span_names(), name)
+        eq_(2, instrumentation.counters['riak.mapreduce'])
+
+    def test_set_instrumentation_to_none(self):
+        backend = RiakBackend(client=FakeRiakClient(), instrumentation=RecordingInstrumentation())
+
+        backend.set_instrumentation(None)
+
+        ok_(isinstance(backend.instrumentation, NullInstrumentation))
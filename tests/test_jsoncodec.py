@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+
+import json
+from collections import OrderedDict
+
+from sunspear import jsoncodec
+from sunspear.backends.database.db import DatabaseBackend
+from sunspear.backends.riak import RiakBackend, decode_json, encode_json
+from sunspear.exceptions import SunspearInvalidConfigurationError
+from sunspear.testing.fakeriak import FakeRiakClient, FakeRiakServer
+
+from mock import patch
+from nose.tools import eq_, ok_, raises
+
+
+class RecordingCodec(jsoncodec.JSONCodec):
+    def __init__(self):
+        super(RecordingCodec, self).__init__('recording', self._dumps, self._loads)
+        self.calls = []
+
+    def _dumps(self, obj, ensure_ascii=True):
+        self.calls.append('dumps')
+        return json.dumps(obj, ensure_ascii=ensure_ascii)
+
+    def _loads(self, data):
+        self.calls.append('loads')
+        return json.loads(data)
+
+
+class TestJSONCodec(object):
+    def setUp(self):
+        self._codec = RecordingCodec()
+        jsoncodec.register_codec(self._codec)
+        self._previous = jsoncodec.set_codec('recording')
+
+        self._published = '2016-01-01T00:00:00Z'
+
+    def tearDown(self):
+        jsoncodec.set_codec(self._previous.name)
+
+    def test_stdlib_codec_is_always_registered(self):
+        codec = jsoncodec.get_codec('json')
+
+        eq_({'a': [1, u'\u0268']}, codec.loads(codec.dumps({'a': [1, u'\u0268']})))
+
+    @raises(SunspearInvalidConfigurationError)
+    def test_set_unknown_codec(self):
+        jsoncodec.set_codec('unknown')
+
+    def test_stdlib_is_the_fallback(self):
+        with patch.object(jsoncodec, '_codecs', OrderedDict()), patch.object(jsoncodec, '_codec', None), \
+                patch('importlib.import_module', side_effect=ImportError()):
+            jsoncodec._register_builtin_codecs()
+
+            eq_(['json'], list(jsoncodec._codecs))
+            eq_('json', jsoncodec.get_codec().name)
+
+    def test_ujson_is_not_the_default(self):
+        ujson = RecordingCodec()
+        ujson.name = 'ujson'
+        with patch.object(jsoncodec, '_codecs', OrderedDict()), patch.object(jsoncodec, '_codec', None), \
+                patch.object(jsoncodec, '_load_ujson', return_value=ujson):
+            jsoncodec._register_builtin_codecs()
+
+            ok_(jsoncodec.get_codec('ujson') is ujson)
+            ok_(jsoncodec.get_codec().name in ('simplejson', 'json'))
+            eq_(1.0000000000000002, jsoncodec.loads(jsoncodec.dumps(1.0000000000000002)))
+
+    def test_database_columns_use_the_codec(self):
+        backend = DatabaseBackend(db_connection_string='sqlite://')
+        backend.create_tables()
+
+        backend.create_obj({'objectType': 'user', 'id': 'user:1', 'published': self._published,
+                            'image': {'url': 'https://example.com/user.png'}})
+        ok_('dumps' in self._codec.calls)
+
+        del self._codec.calls[:]
+        eq_('https://example.com/user.png', backend.get_obj(['user:1'])[0]['image']['url'])
+        ok_('loads' in self._codec.calls)
+
+    def test_riak_values_use_the_codec(self):
+        server = FakeRiakServer()
+        backend = RiakBackend(client=FakeRiakClient(server=server))
+
+        backend.create_obj({'objectType': 'user', 'id': 'user:1', 'displayName': u'\u0268',
+                            'published': self._published})
+        ok_('dumps' in self._codec.calls)
+
+        del self._codec.calls[:]
+        eq_(u'\u0268', backend._objects.get('user:1').data['displayName'])
+        ok_('loads' in self._codec.calls)
+
+    def test_riak_values_are_utf8(self):
+        eq_(u'{"a": "\u0268"}'.encode('utf-8'), encode_json({'a': u'\u0268'}))
+        eq_({'a': u'\u0268'}, decode_json(u'{"a": "\u0268"}'.encode('utf-8')))
@@ -0,0 +1,157 @@
+from __future__ import absolute_import
+
+import json
+import os
+import shutil
+import tempfile
+
+from mock import MagicMock, call
+from sunspear.exceptions import SunspearInvalidConfigurationError
+from sunspear.migration import Migration, checksum
+
+from nose.tools import eq_, ok_, raises
+
+
+class TestMigration(object):
+    def setUp(self):
+        self._objs = [{'id': str(i), 'objectType': 'user'} for i in range(3)]
+        self._activities = [
+            {'id': 'a1', 'verb': 'post', 'actor': '0', 'object': '1', 'to': ['2']},
+            {'id': 'a2', 'verb': 'reply', 'actor': '0', 'object': '2'},
+            {'id': 'a3', 'verb': 'post', 'actor': '0', 'object': 'missing'},
+            {'id': 'a4', 'verb': 'like', 'actor': '1', 'object': '1', 'cc': ['gone']},
+        ]
+
+        self._source = MagicMock()
+        self._source.iter_objects.side_effect = lambda after=None, **kwargs: iter(
+            [obj for obj in self._objs if after is None or obj['id'] > after])
+        self._source.iter_activities.side_effect = lambda after=None, **kwargs: iter(
+            [activity for activity in self._activities if after is None or activity['id'] > after])
+
+        stored_ids = set(obj['id'] for obj in self._objs)
+        self._target = MagicMock()
+        self._target._extract_id.side_effect = lambda value: value['id'] if isinstance(value, dict) else value
+        self._target.get_obj.side_effect = lambda ids: [{'id': obj_id} for obj_id in ids if obj_id in stored_ids]
+        self._target.bulk_create_objects.side_effect = lambda batch, on_conflict=None: len(batch)
+        self._target.bulk_create_activities.side_effect = lambda batch, on_conflict=None: len(batch)
+        self._target.bulk_create_sub_activities.side_effect = lambda batch, on_conflict=None: len(batch)
+
+        self._tmp_dir = tempfile.mkdtemp()
+        self._checkpoint_path = os.path.join(self._tmp_dir, 'checkpoint.json')
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def test_run(self):
+        migration = Migration(self._source, self._target, batch_size=2, workers=2)
+
+        progress = migration.run()
+
+        eq_(progress.counts, {'object': 3, 'activity': 2, 'sub_activity': 1})
+        eq_(self._target.bulk_create_objects.call_args_list, [
+            call(self._objs[:2], on_conflict='skip'),
+            call(self._objs[2:], on_conflict='skip'),
+        ])
+        eq_(self._target.bulk_create_activities.call_args_list, [call(self._activities[:2], on_conflict='skip')])
+        self._target.bulk_create_sub_activities.assert_called_once_with([self._activities[1]], on_conflict='skip')
+        eq_(migration.dangling, ['a3', 'a4'])
+
+    def test_run_saves_and_resumes_from_checkpoint(self):
+        migration = Migration(self._source, self._target, checkpoint_path=self._checkpoint_path)
+        migration.run()
+
+        with open(self._checkpoint_path) as fp:
+            checkpoint = json.load(fp)
+        eq_(checkpoint['completed_phases'], ['object', 'activity', 'sub_activity'])
+        with open(self._checkpoint_path + '.dangling') as fp:
+            eq_('"a3"\n"a4"\n', fp.read())
+
+        self._target.reset_mock()
+        resumed = Migration(self._source, self._target, checkpoint_path=self._checkpoint_path)
+        eq_(resumed.dangling, ['a3', 'a4'])
+        eq_(resumed.started_at.replace(microsecond=0), migration.started_at.replace(microsecond=0))
+        resumed.run()
+
+        ok_(not self._target.bulk_create_objects.called)
+        ok_(not self._target.bulk_create_activities.called)
+
+    def test_run_resumes_interrupted_phase(self):
+        with open(self._checkpoint_path, 'w') as fp:
+            json.dump({'completed_phases': ['object'], 'dangling': [], 'started_at': '2012-07-05T12:00:00Z'}, fp)
+
+        Migration(self._source, self._target, checkpoint_path=self._checkpoint_path).run()
+
+        ok_(not self._target.bulk_create_objects.called)
+        ok_(self._target.bulk_create_activities.called)
+
+    def test_dangling_ids_found_after_the_checkpoint_are_dropped(self):
+        with open(self._checkpoint_path, 'w') as fp:
+            json.dump({'completed_phases': ['object'], 'dangling_size': 5, 'started_at': '2012-07-05T12:00:00Z'}, fp)
+        with open(self._checkpoint_path + '.dangling', 'w') as fp:
+            fp.write('"a3"\n"a4"\n')
+
+        migration = Migration(self._source, self._target, checkpoint_path=self._checkpoint_path)
+        eq_(['a3'], migration.dangling)
+
+        migration.run()
+        eq_(['a3', 'a4'], migration.dangling)
+        with open(self._checkpoint_path + '.dangling') as fp:
+            eq_('"a3"\n"a4"\n', fp.read())
+
+    def test_run_resumes_from_the_last_written_batch(self):
+        self._target.bulk_create_objects.side_effect = [2, ValueError('failed')]
+        migration = Migration(self._source, self._target, batch_size=2, workers=1, checkpoint_path=self._checkpoint_path)
+        try:
+            migration.run()
+        except ValueError:
+            pass
+
+        with open(self._checkpoint_path) as fp:
+            eq_({'object': '1'}, json.load(fp)['positions'])
+
+        self._target.bulk_create_objects.side_effect = lambda batch, on_conflict=None: len(batch)
+        self._target.bulk_create_objects.reset_mock()
+        resumed = Migration(self._source, self._target, batch_size=2, checkpoint_path=self._checkpoint_path)
+        resumed.run()
+
+        self._target.bulk_create_objects.assert_called_once_with(self._objs[2:], on_conflict='skip')
+        eq_({}, resumed.positions)
+
+    def test_verify(self):
+        migration = Migration(self._source, self._target)
+        migration.dangling = ['a3', 'a4']
+        self._target.iter_objects.side_effect = lambda **kwargs: iter(reversed(self._objs))
+        self._target.iter_activities.side_effect = lambda **kwargs: iter(self._activities[:1])
+
+        results = migration.verify()
+
+        ok_(results['object']['match'])
+        eq_(results['object']['target']['count'], 3)
+        ok_(not results['activity']['match'])
+        eq_(results['activity']['source']['count'], 2)
+        eq_(results['activity']['target']['count'], 1)
+
+    def test_checksum_compares_references_by_id(self):
+        eq_(checksum([{'id': 'a1', 'verb': 'post', 'actor': {'id': '0'}}], 'activity'),
+            checksum([{'id': 'a1', 'verb': 'post', 'actor': '0'}], 'activity'))
+        ok_(checksum([{'id': 'a1', 'verb': 'post', 'actor': '1'}], 'activity') !=
+            checksum([{'id': 'a1', 'verb': 'post', 'actor': '0'}], 'activity'))
+
+    def test_checksum_compares_every_field(self):
+        activity = {'id': 'a1', 'verb': 'post', 'actor': '0', 'content': 'a', 'to': ['1', '2'],
+                    'published': '2012-07-05T12:00:00Z'}
+
+        for changes in [{'content': 'b'}, {'published': '2012-07-05T12:00:01Z'}, {'to': ['1']}, {'extra': 1}]:
+            ok_(checksum([activity], 'activity') != checksum([dict(activity, **changes)], 'activity'))
+        ok_(checksum([{'id': '0', 'objectType': 'user'}], 'object') !=
+            checksum([{'id': '0', 'objectType': 'user', 'displayName': 'User'}], 'object'))
+
+    def test_checksum_ignores_replies_and_audience_order(self):
+        activity = {'id': 'a1', 'verb': 'post', 'actor': '0', 'to': ['1', {'id': '2'}]}
+
+        eq_(checksum([activity], 'activity'), checksum([dict(
+            activity, to=['2', '1'], replies={'totalItems': 1, 'items': [{'id': 'a2'}]})], 'activity'))
+
+    @raises(SunspearInvalidConfigurationError)
+    def test_invalid_batch_size(self):
+        Migration(self._source, self._target, batch_size=0)
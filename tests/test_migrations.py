@@ -0,0 +1,77 @@
+from __future__ import absolute_import
+
+from mock import MagicMock
+from sqlalchemy import Index, inspect
+from sqlalchemy.dialects import mysql, postgresql
+from sunspear.backends.database import schema
+from sunspear.backends.database.db import DatabaseBackend
+from sunspear.backends.database.migrations import (_create_index,
+                                                   create_indexes,
+                                                   get_missing_indexes)
+
+from nose.tools import eq_, ok_
+
+
+class TestCreateIndexes(object):
+    def setUp(self):
+        self._backend = DatabaseBackend(db_connection_string='sqlite://')
+        self._backend.create_tables()
+        self._engine = self._backend.engine
+
+        self._declared = sorted(index.name for table in schema.metadata.tables.values() for index in table.indexes)
+        for table in schema.metadata.tables.values():
+            for index in table.indexes:
+                index.drop(self._engine)
+
+    def tearDown(self):
+        self._backend.drop_tables()
+        self._engine.dispose()
+
+    def _get_index_names(self):
+        inspector = inspect(self._engine)
+        return sorted(index['name'] for table_name in inspector.get_table_names()
+                      for index in inspector.get_indexes(table_name))
+
+    def test_create_indexes(self):
+        eq_(self._declared, sorted(index.name for index in get_missing_indexes(self._engine)))
+
+        eq_(self._declared, sorted(self._backend.create_indexes()))
+
+        eq_(self._declared, self._get_index_names())
+        eq_([], get_missing_indexes(self._engine))
+
+    def test_create_indexes_is_idempotent(self):
+        create_indexes(self._engine)
+
+        eq_([], create_indexes(self._engine))
+
+    def test_index_with_same_columns_counts_as_present(self):
+        index = Index('to_activity_object', schema.to_table.c.activity, schema.to_table.c.object)
+        # creating the index attaches it to the table of the schema
+        schema.to_table.indexes.remove(index)
+        index.create(self._engine)
+
+        created = create_indexes(self._engine)
+
+        ok_('ix_to_activity_object' not in created)
+        ok_('ix_to_object_activity' in created)
+
+    def test_create_index_online_on_mysql(self):
+        engine = MagicMock()
+        engine.dialect = mysql.dialect()
+
+        _create_index(engine, [index for index in schema.to_table.indexes if index.name == 'ix_to_object_activity'][0])
+
+        engine.execute.assert_called_once_with(
+            'ALTER TABLE `to` ADD INDEX ix_to_object_activity (object, activity), ALGORITHM=INPLACE, LOCK=NONE')
+
+    def test_create_index_online_on_postgresql(self):
+        engine = MagicMock()
+        engine.dialect = postgresql.dialect()
+        connection = engine.connect.return_value.__enter__.return_value
+
+        _create_index(engine, [index for index in schema.replies_table.indexes if index.name == 'ix_replies_actor'][0])
+
+        connection.execution_options.assert_called_once_with(isolation_level='AUTOCOMMIT')
+        connection.execution_options.return_value.execute.assert_called_once_with(
+            'CREATE INDEX CONCURRENTLY ix_replies_actor ON replies (actor)')
@@ -0,0 +1,143 @@
+from __future__ import absolute_import
+
+from sunspear.backends.database.db import DatabaseBackend
+from sunspear.backends.riak import RiakBackend
+from sunspear.instrumentation import RecordingInstrumentation
+from sunspear.negativecache import NegativeCache
+from sunspear.testing.fakeriak import FakeRiakClient, FakeRiakServer
+
+from mock import patch
+from nose.tools import eq_
+
+
+class TestNegativeCache(object):
+    def setUp(self):
+        self._now = [0]
+        self._cache = NegativeCache(ttl=60, max_size=2, max_invalidations=2, clock=lambda: self._now[0])
+
+    def test_missing_ids_are_filtered(self):
+        self._cache.add(['a', 'b'], self._cache.generation)
+
+        eq_(['c'], self._cache.filter(['a', 'b', 'c']))
+        eq_({'size': 2, 'hits': 2}, self._cache.stats())
+
+    def test_missing_ids_expire(self):
+        self._cache.add(['a'], self._cache.generation)
+
+        self._now[0] = 60
+
+        eq_(['a'], self._cache.filter(['a']))
+        eq_(0, self._cache.stats()['size'])
+
+    def test_written_ids_are_forgotten(self):
+        self._cache.add(['a', 'b'], self._cache.generation)
+
+        self._cache.invalidate(['a'])
+
+        eq_(['a'], self._cache.filter(['a', 'b']))
+
+    def test_ids_written_while_they_were_read_are_not_remembered(self):
+        generation = self._cache.generation
+        self._cache.invalidate(['a'])
+
+        self._cache.add(['a', 'b'], generation)
+        eq_(['a'], self._cache.filter(['a', 'b']))
+
+        self._cache.invalidate(['c', 'd'])
+        self._cache.add(['a', 'b'], generation)
+        eq_(['a'], self._cache.filter(['a']))
+
+    def test_oldest_ids_are_dropped(self):
+        self._cache.add(['a', 'b', 'c'], self._cache.generation)
+
+        eq_(['a'], self._cache.filter(['a', 'b', 'c']))
+
+
+class TestDatabaseGetObj(object):
+    def setUp(self):
+        self._backend = DatabaseBackend(db_connection_string='sqlite://')
+        self._backend.create_tables()
+        self._backend.set_negative_cache(NegativeCache())
+        self._instrumentation = RecordingInstrumentation()
+        self._backend.set_instrumentation(self._instrumentation)
+
+        self._published = '2016-01-01T00:00:00Z'
+        self._backend.create_obj({'objectType': 'user', 'id': 'user:1', 'published': self._published})
+
+    def tearDown(self):
+        self._backend.drop_tables()
+        self._backend.engine.dispose()
+
+    def test_missing_ids_are_read_once(self):
+        self._backend.get_obj(['user:1', 'user:2'])
+
+        with patch.object(self._backend, 'obj_get', wraps=self._backend.obj_get) as obj_get:
+            eq_(['user:1'], [obj['id'] for obj in self._backend.get_obj(['user:1', 'user:2'])])
+            eq_([], self._backend.get_obj(['user:2']))
+
+        eq_([(['user:1'],)], [args for args, kwargs in obj_get.call_args_list])
+        eq_(2, self._instrumentation.counters['negative_cache.hits'])
+
+    def test_created_objects_are_read(self):
+        self._backend.get_obj(['user:2'])
+
+        self._backend.create_obj({'objectType': 'user', 'id': 'user:2', 'published': self._published})
+
+        eq_(['user:2'], [obj['id'] for obj in self._backend.get_obj(['user:2'])])
+
+    def test_reads_in_a_transaction_are_not_cached(self):
+        with self._backend.transaction():
+            self._backend.get_obj(['user:2'])
+
+        eq_(0, self._backend.negative_cache.stats()['size'])
+
+    def test_replica_reads_are_not_cached(self):
+        self._backend.get_obj(['user:3'])
+
+        with patch.object(self._backend, '_get_read_context', return_value=False):
+            eq_([], self._backend.get_obj(['user:2', 'user:3']))
+
+        eq_(1, self._backend.negative_cache.stats()['size'])
+        eq_(1, self._instrumentation.counters['negative_cache.hits'])
+
+
+class TestRiakHydration(object):
+    def setUp(self):
+        self._backend = RiakBackend(client=FakeRiakClient(server=FakeRiakServer()))
+        self._backend.set_negative_cache(NegativeCache())
+
+        self._published = '2016-01-01T00:00:00Z'
+        self._backend.create_activity({
+            'id': '1', 'verb': 'post', 'published': self._published, 'target': 'note:2',
+            'actor': {'objectType': 'user', 'id': 'user:1', 'published': self._published},
+            'object': {'objectType': 'note', 'id': 'note:1', 'published': self._published},
+        })
+
+    def test_dangling_references_are_not_read_again(self):
+        eq_({}, self._backend.get_activity(['1'])[0]['target'])
+
+        with patch.object(self._backend, 'obj_get', wraps=self._backend.obj_get) as obj_get:
+            eq_({}, self._backend.get_activity(['1'])[0]['target'])
+
+        eq_(['note:1', 'user:1'], sorted(obj_get.call_args[0][0]))
+
+    def test_created_objects_are_hydrated(self):
+        self._backend.get_activity(['1'])
+
+        self._backend.create_obj({'objectType': 'note', 'id': 'note:2', 'published': self._published})
+
+        eq_('note:2', self._backend.get_activity(['1'])[0]['target']['id'])
+
+    def test_bulk_created_objects_are_read(self):
+        eq_([], self._backend.get_obj(['note:3']))
+
+        self._backend.bulk_create_objects([{'objectType': 'note', 'id': 'note:3', 'published': self._published}])
+
+        eq_(['note:3'], [obj['id'] for obj in self._backend.get_obj(['note:3'])])
+
+    def test_clearing_the_backend_clears_the_cache(self):
+        self._backend.get_obj(['note:3'])
+
+        self._backend.clear_all_objects()
+
+        eq_(0, self._backend.negative_cache.stats()['size'])
@@ -0,0 +1,213 @@
+from __future__ import absolute_import
+
+import datetime
+
+from sqlalchemy import inspect
+from sunspear.backends.database.db import DatabaseBackend
+from sunspear.backends.database.partitioning import MonthlyPartitioning
+from sunspear.exceptions import SunspearOperationNotSupportedException
+
+from nose.tools import eq_, ok_, raises
+
+
+class TestMonthlyPartitioning(object):
+    def setUp(self):
+        self._partitioning = MonthlyPartitioning()
+
+    def test_get_name(self):
+        eq_('p201601', self._partitioning.get_name(datetime.datetime(2016, 1, 31, 23, 59)))
+        eq_('p201612', self._partitioning.get_name(datetime.datetime(2016, 12, 1)))
+
+    def test_get_bounds(self):
+        eq_((datetime.datetime(2016, 1, 1), datetime.datetime(2016, 2, 1)), self._partitioning.get_bounds('p201601'))
+        eq_((datetime.datetime(2016, 12, 1), datetime.datetime(2017, 1, 1)), self._partitioning.get_bounds('p201612'))
+
+    def test_prune(self):
+        names = ['p201601', 'p201602', 'p201603']
+
+        eq_(names, self._partitioning.prune(names))
+        eq_(['p201602', 'p201603'], self._partitioning.prune(names, since=datetime.datetime(2016, 2, 1)))
+        eq_(['p201601', 'p201602'], self._partitioning.prune(names, until=datetime.datetime(2016, 3, 1)))
+        eq_(['p201602'], self._partitioning.prune(
+            names, since=datetime.datetime(2016, 2, 10), until=datetime.datetime(2016, 2, 20)))
+
+    def test_get_partition_name_from_table_name(self):
+        eq_('p201601', self._partitioning.get_partition_name_from_table_name('activities_p201601'))
+        eq_(None, self._partitioning.get_partition_name_from_table_name('replies_p201601'))
+        eq_(None, self._partitioning.get_partition_name_from_table_name('activities'))
+
+    def test_get_tables_reference_the_same_partition(self):
+        tables = self._partitioning.get_tables('p201601')
+
+        eq_('activities_p201601', tables['activities'].name)
+        eq_(set(['activities_p201601.id']), set(fk.target_fullname for fk in tables['to'].c.activity.foreign_keys))
+        eq_(set(['objects.id']), set(fk.target_fullname for fk in tables['replies'].c.actor.foreign_keys))
+        ok_('ix_activities_p201601_actor_published' in set(index.name for index in tables['activities'].indexes))
+
+
+class TestPartitionedDatabaseBackend(object):
+    def setUp(self):
+        self._backend = DatabaseBackend(db_connection_string='sqlite://', partitioning=MonthlyPartitioning())
+        self._backend.create_tables()
+
+        self._actor = {'objectType': 'user', 'id': 'user:1', 'displayName': 'User 1', 'published': '2016-01-01T00:00:00Z'}
+        self._other = {'objectType': 'user', 'id': 'user:2', 'displayName': 'User 2', 'published': '2016-01-01T00:00:00Z'}
+        self._backend.create_obj(self._actor)
+        self._backend.create_obj(self._other)
+
+    def tearDown(self):
+        self._backend.drop_tables()
+        self._backend.engine.dispose()
+
+    def _create_activity(self, activity_id, published, **extra):
+        activity = {
+            'id': activity_id,
+            'verb': 'post',
+            'actor': self._actor['id'],
+            'object': {'objectType': 'note', 'id': 'note:' + activity_id, 'content': 'a note', 'published': published},
+            'published': published,
+        }
+        activity.update(extra)
+        return self._backend.create_activity(activity)
+
+    def test_activities_are_stored_in_the_partition_of_their_month(self):
+        self._create_activity('1', '2016-01-15T00:00:00Z')
+        self._create_activity('2', '2016-02-15T00:00:00Z')
+
+        eq_(['p201601', 'p201602'], self._backend.get_partitions())
+        table_names = inspect(self._backend.engine).get_table_names()
+        ok_('activities_p201601' in table_names)
+        ok_('to_p201602' in table_names)
+
+        eq_(['1', '2'], sorted(activity['id'] for activity in self._backend.get_activity(['1', '2'])))
+
+    def test_get_activity_prunes_partitions(self):
+        self._create_activity('1', '2016-01-15T00:00:00Z')
+        self._create_activity('2', '2016-02-15T00:00:00Z')
+
+        with self._backend.capture_queries() as capture:
+            activities = self._backend.get_activity(['1', '2'], since=datetime.datetime(2016, 2, 1))
+
+        eq_(['2'], [activity['id'] for activity in activities])
+        ok_(not any('activities_p201601' in query.statement for query in capture.queries))
+
+    def test_get_activity_with_audience_targeting(self):
+        self._create_activity('1', '2016-01-15T00:00:00Z', to=[self._other['id']])
+        self._create_activity('2', '2016-02-15T00:00:00Z')
+
+        eq_(['2'], [activity['id'] for activity in self._backend.get_activity(['1', '2'])])
+        eq_(['1'], [activity['id'] for activity in self._backend.get_activity(
+            ['1', '2'], audience_targeting={'to': [self._other['id']]})])
+        ok_(self._backend.audience_targeting_exists('to', '1', self._other['id']))
+
+    def test_create_duplicate_activity_in_another_month(self):
+        self._create_activity('1', '2016-01-15T00:00:00Z')
+
+        ok_(self._backend.activity_exists('1'))
+        ok_(not self._backend.activity_exists('2'))
+
+    def test_reply_is_linked_in_the_partition_of_its_parent(self):
+        self._create_activity('1', '2016-01-15T00:00:00Z')
+
+        reply, activity = self._backend.create_sub_activity(
+            '1', self._other['id'], 'a reply', sub_activity_verb='reply')
+
+        eq_(1, activity['replies']['totalItems'])
+        eq_(reply['id'], activity['replies']['items'][0]['object']['id'])
+
+        replies_table = self._backend._partitioning.get_tables('p201601')['replies']
+        eq_(1, self._backend.engine.execute(replies_table.count()).scalar())
+
+        eq_(1, self._backend.get_activity('1')[0]['replies']['totalItems'])
+
+    def test_delete_activity_with_a_reply_in_a_later_partition(self):
+        self._create_activity('1', '2016-01-15T00:00:00Z')
+        self._create_activity('2', '2016-02-15T00:00:00Z')
+        reply, _ = self._backend.create_sub_activity(
+            '1', self._other['id'], 'a reply', sub_activity_verb='reply', published='2016-02-20T00:00:00Z')
+
+        eq_(1, self._backend.delete_activities(['1']))
+
+        ok_(not self._backend.activity_exists('1'))
+        ok_(not self._backend.activity_exists(reply['id']))
+        ok_(self._backend.activity_exists('2'))
+
+    def test_drop_partitions(self):
+        self._create_activity('1', '2016-01-15T00:00:00Z')
+        self._create_activity('2', '2016-02-15T00:00:00Z')
+        self._backend.create_sub_activity('1', self._other['id'], 'a reply', sub_activity_verb='reply')
+
+        eq_(['p201601'], self._backend.drop_partitions(before=datetime.datetime(2016, 2, 1)))
+
+        ok_('activities_p201601' not in inspect(self._backend.engine).get_table_names())
+        eq_([], self._backend.get_activity('1'))
+        eq_(['2'], [activity['id'] for activity in self._backend.get_activity('2')])
+
+    def test_partitions_created_by_another_backend_are_found(self):
+        other_backend = DatabaseBackend(db_connection_string='sqlite://', partitioning=MonthlyPartitioning())
+        other_backend._engine = self._backend.engine
+
+        eq_([], self._backend.get_partitions())
+        other_backend.create_activity({
+            'id': '1', 'verb': 'post', 'actor': self._actor['id'], 'object': self._other['id'],
+            'published': '2016-03-01T00:00:00Z'})
+
+        eq_(['1'], [activity['id'] for activity in self._backend.get_activity('1')])
+        eq_(['p201603'], self._backend.get_partitions())
+
+    def test_iter_activities(self):
+        self._create_activity('2', '2016-01-15T00:00:00Z')
+        self._create_activity('1', '2016-02-15T00:00:00Z')
+
+        eq_(['2', '1'], [activity['id'] for activity in self._backend.iter_activities()])
+        eq_(['1'], [activity['id'] for activity in self._backend.iter_activities(since=datetime.datetime(2016, 2, 1))])
+
+    def test_iter_activities_after(self):
+        self._create_activity('2', '2016-01-15T00:00:00Z')
+        self._create_activity('3', '2016-01-15T00:00:00Z')
+        self._create_activity('1', '2016-02-15T00:00:00Z')
+
+        eq_(['3', '1'], [activity['id'] for activity in self._backend.iter_activities(after='2')])
+        eq_([], [activity['id'] for activity in self._backend.iter_activities(after='1')])
+        # deleted meanwhile
+        eq_(['2', '3', '1'], [activity['id'] for activity in self._backend.iter_activities(after='4')])
+
+    def test_bulk_create_activities_spanning_partitions(self):
+        activities = [
+            {'id': '1', 'verb': 'post', 'actor': self._actor['id'], 'object': self._other['id'],
+             'published': '2016-01-15T00:00:00Z', 'to': [self._other['id']]},
+            {'id': '2', 'verb': 'post', 'actor': self._actor['id'], 'object': self._other['id'],
+             'published': '2016-02-15T00:00:00Z'},
+        ]
+
+        eq_(2, self._backend.bulk_create_activities(activities))
+
+        eq_(['p201601', 'p201602'], self._backend.get_partitions())
+        eq_(['1'], [activity['id'] for activity in self._backend.get_activity(
+            ['1', '2'], audience_targeting={'to': [self._other['id']]})])
+
+    @raises(SunspearOperationNotSupportedException)
+    def test_partitions_are_not_created_in_a_transaction(self):
+        with self._backend.transaction():
+            self._create_activity('1', '2016-01-15T00:00:00Z')
+
+    def test_partitions_created_before_a_transaction_are_written_to(self):
+        eq_('p201601', self._backend.create_partition(datetime.datetime(2016, 1, 1)))
+
+        with self._backend.transaction():
+            self._create_activity('1', '2016-01-15T00:00:00Z')
+
+        ok_(self._backend.activity_exists('1'))
+
+    def test_activity_without_published_is_not_changed(self):
+        activity = {'verb': 'post', 'actor': self._actor['id'], 'object': self._other['id']}
+
+        stored = self._backend.create_activity(activity)
+
+        ok_('published' not in activity)
+        eq_([self._backend._partitioning.get_name(datetime.datetime.utcnow())], self._backend.get_partitions())
+        ok_(self._backend.activity_exists(stored[0]['id']))
+
+    @raises(SunspearOperationNotSupportedException)
+    def test_drop_partitions_without_partitioning(self):
+        DatabaseBackend(db_connection_string='sqlite://').drop_partitions()
@@ -0,0 +1,175 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from sunspear.backends.database.db import DatabaseBackend
+from sunspear.backends.database.replicas import (_REPLICATION_LAG_QUERIES,
+                                                 ReadSession, ReplicaSet,
+                                                 get_pool_status)
+from sunspear.instrumentation import RecordingInstrumentation
+
+from mock import patch
+from nose.tools import eq_, ok_
+
+
+class TestReplicaRouting(object):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        primary = 'sqlite:///' + os.path.join(self._tmp_dir, 'primary.db')
+        replica = 'sqlite:///' + os.path.join(self._tmp_dir, 'replica.db')
+
+        self._instrumentation = RecordingInstrumentation()
+        self._backend = DatabaseBackend(db_connection_string=primary, read_replicas=[replica], sticky_seconds=60,
+                                        instrumentation=self._instrumentation)
+        self._backend.create_tables()
+
+        # the replica has a stale copy of the object, so reads show where they went
+        self._replica = DatabaseBackend(db_connection_string=replica)
+        self._replica.create_tables()
+        self._replica.create_obj({'objectType': 'user', 'id': 'user:1', 'displayName': 'replica',
+                                  'published': '2016-01-01T00:00:00Z'})
+
+    def tearDown(self):
+        self._backend.engine.dispose()
+        self._replica.engine.dispose()
+        shutil.rmtree(self._tmp_dir)
+
+    def _create_obj(self):
+        self._backend.create_obj({'objectType': 'user', 'id': 'user:1', 'displayName': 'primary',
+                                  'published': '2016-01-01T00:00:00Z'})
+
+    def _get_display_name(self):
+        return self._backend.get_obj(['user:1'])[0]['displayName']
+
+    def test_reads_go_to_the_replica(self):
+        with self._backend.session():
+            eq_('replica', self._get_display_name())
+
+    def test_session_reads_its_own_writes(self):
+        with self._backend.session() as session:
+            self._create_obj()
+            ok_(session.last_write is not None)
+
+            eq_('primary', self._get_display_name())
+
+        with self._backend.session():
+            eq_('replica', self._get_display_name())
+
+        with self._backend.session(session):
+            eq_('primary', self._get_display_name())
+
+    def test_session_is_no_longer_sticky_after_sticky_seconds(self):
+        with self._backend.session() as session:
+            self._create_obj()
+            session.last_write -= 60
+
+            eq_('replica', self._get_display_name())
+
+    def test_failed_replica_falls_back_to_the_primary(self):
+        with self._backend.session():
+            self._create_obj()
+        self._replica.drop_tables()
+
+        with self._backend.session():
+            eq_('primary', self._get_display_name())
+
+        eq_(1, self._instrumentation.counters['db.replica.errors'])
+        ok_(not self._backend.get_pool_status()['replica0']['healthy'])
+
+    def test_replica_statements_are_counted_and_captured(self):
+        self._instrumentation.reset()
+        with self._backend.session():
+            with self._backend.capture_queries() as capture:
+                eq_('replica', self._get_display_name())
+
+        eq_(1, len(capture.queries))
+        eq_(1, self._instrumentation.counters['db.statements'])
+
+    def test_create_activity_reads_from_the_primary(self):
+        with self._backend.session() as session:
+            self._create_obj()
+            session.last_write = None
+
+            activity = self._backend.create_activity({
+                'id': '1', 'verb': 'post', 'actor': 'user:1', 'published': '2016-01-01T00:00:00Z',
+                'object': {'objectType': 'note', 'id': 'note:1', 'published': '2016-01-01T00:00:00Z'}})
+
+        eq_('1', activity[0]['id'])
+
+
+class TestReplicaSet(object):
+    def setUp(self):
+        self._now = [0]
+        self._engines = [('replica0', create_engine('sqlite://'),), ('replica1', create_engine('sqlite://'),)]
+        self._replicas = ReplicaSet(self._engines, health_check_interval=10, clock=lambda: self._now[0])
+
+    def test_get_engine_round_robin(self):
+        eq_(set([self._engines[0][1], self._engines[1][1]]),
+            set([self._replicas.get_engine(), self._replicas.get_engine()]))
+
+    def test_unhealthy_replica_is_not_used(self):
+        self._replicas.mark_unhealthy(self._engines[0][1])
+
+        eq_([self._engines[1][1]] * 3, [self._replicas.get_engine() for _ in range(3)])
+
+        self._replicas.mark_unhealthy(self._engines[1][1])
+        eq_(None, self._replicas.get_engine())
+
+    def test_health_check_restores_replica(self):
+        self._replicas.mark_unhealthy(self._engines[0][1])
+
+        self._now[0] = 10
+        self._replicas.get_engine()
+
+        ok_(self._replicas.is_healthy('replica0'))
+
+    def test_replicas_behind_or_not_replicating_are_unhealthy(self):
+        self._replicas.max_lag = 10
+
+        with patch.dict(_REPLICATION_LAG_QUERIES, {'sqlite': 'SELECT 5'}):
+            self._replicas.check_health()
+            ok_(self._replicas.is_healthy('replica0'))
+
+        for query in ['SELECT 11', 'SELECT NULL']:
+            with patch.dict(_REPLICATION_LAG_QUERIES, {'sqlite': query}):
+                self._replicas.check_health()
+                ok_(not self._replicas.is_healthy('replica0'))
+
+    def test_lag_is_not_checked_without_a_lag_query(self):
+        self._replicas.max_lag = 10
+        self._replicas.check_health()
+
+        ok_(self._replicas.is_healthy('replica0'))
+
+    def test_read_session(self):
+        session = ReadSession()
+        ok_(not session.is_sticky(10, 5))
+
+        session.last_write = 8
+        ok_(session.is_sticky(10, 5))
+        ok_(not session.is_sticky(13, 5))
+
+
+class TestPoolStatus(object):
+    def test_get_pool_status(self):
+        engine = create_engine('sqlite://', poolclass=QueuePool, pool_size=2, max_overflow=2)
+        connection = engine.connect()
+
+        eq_({'size': 2, 'checked_out': 1, 'capacity': 4, 'saturation': 0.25}, get_pool_status(engine))
+        connection.close()
+
+    def test_pool_checkout_is_reported(self):
+        instrumentation = RecordingInstrumentation()
+        backend = DatabaseBackend(db_connection_string='sqlite://', instrumentation=instrumentation)
+        engine = create_engine('sqlite://', poolclass=QueuePool, pool_size=1, max_overflow=0)
+        backend._listen_to_pool('replica0', engine)
+
+        connection = engine.connect()
+
+        eq_(1, instrumentation.gauges[('db.pool.checked_out', (('pool', 'replica0',),),)])
+        eq_(1, instrumentation.counters['db.pool.saturated'])
+        connection.close()
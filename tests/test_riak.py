@@ -1,12 +1,17 @@
 from __future__ import absolute_import
 
 import datetime
+import json
 import os
+import threading
 
-from mock import ANY, MagicMock, call
+from mock import ANY, MagicMock, call, patch
+from riak import RiakError
 from sunspear.aggregators.property import PropertyAggregator
 from sunspear.backends.riak import RiakBackend
-from sunspear.exceptions import SunspearValidationException
+from sunspear.exceptions import SunspearRiakException, SunspearValidationException
+from sunspear.instrumentation import RecordingInstrumentation
+from sunspear.testing.fakeriak import FakeRiakClient, FakeRiakServer
 
 from nose.tools import eq_, ok_, raises
 
@@ -1720,3 +1725,340 @@ class TestIndexes(object):
         eq_(filter(lambda x: x[0] == 'actor_bin', riak_obj.indexes)[0][1], actor2_id)
         eq_(filter(lambda x: x[0] == 'object_bin', riak_obj.indexes)[0][1], like_activity_dict['object']['id'])
         eq_(filter(lambda x: x[0] == 'inreplyto_bin', riak_obj.indexes)[0][1], '5')
+
+
+class TestStreamActivities(object):
+    def setUp(self):
+        backend = RiakBackend(**riak_connection_options)
+        self._backend = backend
+
+    def test_stream_activities_fetches_in_batches(self):
+        self._backend.activity_get = MagicMock(side_effect=lambda ids, **kwargs: [{'id': id, 'verb': 'post'} for id in ids])
+
+        activity_ids = (str(i) for i in range(5))
+        activities = self._backend.stream_activities(activity_ids, batch_size=2, filters={'verb': ['post']})
+
+        eq_([activity['id'] for activity in activities], ['0', '1', '2', '3', '4'])
+        eq_(self._backend.activity_get.call_args_list, [
+            call(['0', '1'], filters={'verb': ['post']}),
+            call(['2', '3'], filters={'verb': ['post']}),
+            call(['4'], filters={'verb': ['post']}),
+        ])
+
+    def test_stream_activities_with_aggregation_pipeline(self):
+        self._backend.activity_get = MagicMock(side_effect=lambda ids, **kwargs: [{'id': id, 'verb': 'post'} for id in ids])
+
+        activities = self._backend.stream_activities(
+            ['1', '2', '3'], batch_size=2, aggregation_pipeline=[PropertyAggregator(properties=['verb'])])
+
+        eq_(list(activities), [{'id': ['1', '2', '3'], 'verb': 'post', 'grouped_by_attributes': ['verb'], 'grouped_by_values': ['post']}])
+
+
+class TestIterBucket(object):
+    def setUp(self):
+        backend = RiakBackend(**riak_connection_options)
+        self._backend = backend
+
+    def _riak_obj(self, key, exists=True, published=None):
+        riak_obj = MagicMock()
+        riak_obj.key = key
+        riak_obj.exists = exists
+        riak_obj.data = {'id': key}
+        if published is not None:
+            riak_obj.data['published'] = published
+        return riak_obj
+
+    def _bucket(self, keys, **kwargs):
+        bucket = MagicMock()
+        bucket.get_index.side_effect = lambda index, startkey, endkey, max_results: [
+            key for key in sorted(keys) if startkey <= key <= endkey][:max_results]
+        # in no particular order, like a multiget
+        bucket.multiget.side_effect = lambda keys: [self._riak_obj(key, **kwargs) for key in reversed(keys)]
+        return bucket
+
+    def test_iter_objects_lists_keys_in_batches(self):
+        bucket = self._bucket(['5', '3', '1', '4', '2'])
+        bucket.multiget.side_effect = lambda keys: [self._riak_obj(key, exists=key != '3') for key in keys]
+        self._backend._objects = bucket
+
+        objs = list(self._backend.iter_objects(batch_size=2))
+
+        eq_(objs, [{'id': '1'}, {'id': '2'}, {'id': '4'}, {'id': '5'}])
+        eq_(bucket.multiget.call_args_list, [call(['1', '2']), call(['3', '4']), call(['5'])])
+        ok_(not bucket.get_keys.called)
+        ok_(not bucket.stream_keys.called)
+
+    def test_iter_activities_after(self):
+        self._backend._activities = self._bucket(['1', '2', '3', '4'])
+
+        eq_(['3', '4'], [activity['id'] for activity in self._backend.iter_activities(batch_size=1, after='2')])
+        eq_(['1', '2', '3', '4'], [activity['id'] for activity in self._backend.iter_activities(batch_size=3)])
+
+    def test_iter_activities_since_filters_on_published(self):
+        published = {'1': '2012-07-05T11:59:59Z', '2': '2012-07-05T12:00:00Z', '3': '2012-07-06T00:00:00+02:00'}
+        bucket = self._bucket(['1', '2', '3'])
+        bucket.multiget.side_effect = lambda keys: [self._riak_obj(key, published=published[key]) for key in keys]
+        self._backend._activities = bucket
+
+        activities = list(self._backend.iter_activities(since=datetime.datetime(2012, 7, 5, 12)))
+
+        eq_(['2', '3'], [activity['id'] for activity in activities])
+
+    @raises(SunspearRiakException)
+    def test_iter_activities_raises_on_failed_fetch(self):
+        bucket = self._bucket(['1'])
+        bucket.multiget.side_effect = lambda keys: [('default', 'activities', '1', Exception('timeout'))]
+        self._backend._activities = bucket
+
+        list(self._backend.iter_activities())
+
+
+class TestBulkStore(object):
+    def setUp(self):
+        backend = RiakBackend(**riak_connection_options)
+        self._backend = backend
+        self._backend._riak_backend = MagicMock()
+        self._backend._riak_backend.multiput.side_effect = lambda riak_objs: riak_objs
+
+    def _riak_obj(self, key, exists=True):
+        riak_obj = MagicMock()
+        riak_obj.key = key
+        riak_obj.exists = exists
+        return riak_obj
+
+    def test_bulk_store_skips_existing_keys(self):
+        bucket = MagicMock()
+        bucket.multiget.return_value = [self._riak_obj('1'), self._riak_obj('2', exists=False)]
+        riak_objs = [self._riak_obj('1'), self._riak_obj('2')]
+
+        eq_(self._backend._bulk_store(bucket, riak_objs, 'skip'), 1)
+        bucket.multiget.assert_called_once_with(['1', '2'])
+        self._backend._riak_backend.multiput.assert_called_once_with([riak_objs[1]])
+
+    def test_bulk_store_overwrite_does_not_fetch(self):
+        bucket = MagicMock()
+        riak_objs = [self._riak_obj('1'), self._riak_obj('2')]
+
+        eq_(self._backend._bulk_store(bucket, riak_objs, 'overwrite'), 2)
+        ok_(not bucket.multiget.called)
+        self._backend._riak_backend.multiput.assert_called_once_with(riak_objs)
+
+    @raises(SunspearRiakException)
+    def test_bulk_store_raises_on_failed_put(self):
+        riak_obj = self._riak_obj('1')
+        self._backend._riak_backend.multiput.side_effect = lambda riak_objs: [(riak_obj, Exception('timeout'))]
+
+        self._backend._bulk_store(MagicMock(), [riak_obj], 'overwrite')
+
+
+class TestConcurrentUpdates(object):
+    def setUp(self):
+        self._server = FakeRiakServer(latency={'get': 0.001, 'put': 0.001})
+        self._instrumentation = RecordingInstrumentation()
+        self._backend = RiakBackend(client=FakeRiakClient(server=self._server), retry_backoff=0,
+                                    instrumentation=self._instrumentation)
+
+        self._published = '2016-01-01T00:00:00Z'
+        self._actors = ['actor{}'.format(i) for i in range(8)]
+        for obj_id in self._actors:
+            self._backend.create_obj({'id': obj_id, 'objectType': 'user', 'published': self._published})
+        self._backend.create_activity({
+            'id': '1', 'verb': 'post', 'actor': 'actor0', 'object': 'actor1', 'published': self._published})
+
+    def _get_like_actors(self):
+        activity = self._backend._activities.get('1').data
+        return sorted(item['actor'] for item in activity.get('likes', {'items': []})['items'])
+
+    def test_concurrent_likes_are_not_lost(self):
+        threads = [threading.Thread(target=self._backend.create_sub_activity, args=('1', actor, ''),
+                                    kwargs={'sub_activity_verb': 'like'}) for actor in self._actors]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        eq_(self._actors, self._get_like_actors())
+        eq_(8, self._backend.get_activity('1')[0]['likes']['totalItems'])
+
+    def test_siblings_are_merged(self):
+        self._backend.create_sub_activity('1', 'actor1', '', sub_activity_verb='like')
+        first, second = self._backend._activities.get('1'), self._backend._activities.get('1')
+
+        for riak_obj, actor in [(first, 'actor2',), (second, 'actor3',)]:
+            riak_obj.data['likes']['items'].insert(0, {'id': actor, 'actor': actor, 'published': self._published})
+            riak_obj.store(return_body=False)
+
+        eq_(2, self._server.siblings('activities', '1'))
+        eq_(['actor1', 'actor2', 'actor3'], self._get_like_actors())
+
+    def test_removed_like_is_not_brought_back_by_a_sibling(self):
+        like, _ = self._backend.create_sub_activity('1', 'actor1', '', sub_activity_verb='like')
+        stale = self._backend._activities.get('1')
+
+        self._backend.delete_sub_activity(like['id'], 'like')
+        stale.data['likes']['items'].insert(0, {'id': 'like2', 'actor': 'actor2', 'published': self._published})
+        stale.store(return_body=False)
+
+        eq_(['actor2'], self._get_like_actors())
+
+    def test_only_the_last_removed_likes_are_remembered(self):
+        likes = [self._backend.create_sub_activity('1', actor, '', sub_activity_verb='like')[0]
+                 for actor in self._actors[:3]]
+
+        with patch('sunspear.backends.riak.MAX_REMOVED', 2):
+            for like in likes:
+                self._backend.delete_sub_activity(like['id'], 'like')
+
+        usermeta = self._backend._activities.get('1').usermeta
+        eq_([likes[1]['id'], likes[2]['id']], json.loads(usermeta['removed_likes']))
+
+    def test_update_is_retried(self):
+        activity = self._backend._activities.get('1').data
+        activity['title'] = 'Updated'
+        self._server.inject_fault('put')
+
+        self._backend.update_activity(activity)
+
+        eq_('Updated', self._backend._activities.get('1').data['title'])
+        eq_(1, self._instrumentation.counters['riak.retries'])
+
+    def test_requests_are_counted(self):
+        activity = self._backend._activities.get('1').data
+        self._server.request_counts.clear()
+        self._instrumentation.reset()
+
+        self._backend.activity_update(activity)
+        self._backend.obj_exists('actor0')
+
+        eq_({'get_bucket_props': 1, 'set_bucket_props': 1, 'get': 2, 'put': 1, 'mapred': 1},
+            dict(self._server.request_counts))
+        eq_(5, self._instrumentation.counters['riak.requests'])
+        eq_(1, self._instrumentation.counters['riak.mapreduce'])
+
+    def test_merged_activity_of_the_last_attempt_is_written_back(self):
+        self._backend._max_retries = 0
+        stale = self._backend._activities.get('1')
+
+        def update(riak_obj):
+            riak_obj.data['title'] = 'Updated'
+            stale.data['likes'] = {'totalItems': 1, 'items': [
+                {'id': 'like2', 'actor': 'actor2', 'published': self._published}]}
+            stale.store(return_body=False)
+
+        eq_('Updated', self._backend._update_activity('1', update)['title'])
+        eq_(1, self._server.siblings('activities', '1'))
+        eq_(['actor2'], self._get_like_actors())
+
+    def test_siblings_are_enabled_before_the_first_update(self):
+        server = FakeRiakServer()
+        backend = RiakBackend(client=FakeRiakClient(server=server))
+        activity = {'id': '1', 'verb': 'post', 'actor': 'actor0', 'object': 'actor1', 'published': self._published}
+        backend.create_activity(activity)
+        eq_(0, server.request_counts['get_bucket_props'])
+
+        backend.update_activity(activity)
+        backend.update_activity(activity)
+        eq_(1, server.request_counts['get_bucket_props'])
+        eq_(1, server.request_counts['set_bucket_props'])
+        ok_(FakeRiakClient(server=server).bucket('activities').allow_mult)
+
+        RiakBackend(client=FakeRiakClient(server=server)).update_activity(activity)
+        eq_(1, server.request_counts['set_bucket_props'])
+
+    @raises(RiakError)
+    def test_update_gives_up_after_max_retries(self):
+        activity = self._backend._activities.get('1').data
+        self._server.inject_fault('put', times=4)
+
+        self._backend.update_activity(activity)
+
+
+class TestPurge(object):
+    def setUp(self):
+        self._server = FakeRiakServer(stream_chunk_size=30)
+        self._backend = RiakBackend(client=FakeRiakClient(server=self._server))
+
+        for i in range(250):
+            self._backend.create_obj({'id': str(i), 'objectType': 'user', 'published': '2016-01-01T00:00:00Z'})
+        self._server.request_counts.clear()
+
+    def test_clear_all_objects(self):
+        progress = []
+        deleted = self._backend.clear_all_objects(concurrency=4, batch_size=100, sample_size=10, progress=progress.append)
+
+        eq_(250, deleted)
+
+        eq_([], self._server.keys('objects'))
+        eq_([100, 200, 250], progress)
+        eq_(250, self._server.request_counts['delete'])
+        eq_(10, self._server.request_counts['get'])
+        eq_(0, self._server.request_counts['get_keys'])
+
+    def test_requests_are_counted(self):
+        instrumentation = RecordingInstrumentation()
+        self._backend.set_instrumentation(instrumentation)
+
+        self._backend.clear_all_objects(concurrency=4, batch_size=100, sample_size=10)
+
+        eq_(sum(self._server.request_counts.values()), instrumentation.counters['riak.requests'])
+
+    @raises(SunspearRiakException)
+    def test_failed_delete_raises(self):
+        self._server.inject_fault('delete')
+
+        self._backend.clear_all_objects()
+
+    @raises(SunspearRiakException)
+    def test_sampled_key_that_still_exists_raises(self):
+        self._server.delete = lambda robj, **kwargs: self._server
+
+        self._backend.clear_all_objects()
+
+
+class TestActivityDelete(object):
+    def setUp(self):
+        self._server = FakeRiakServer(stream_chunk_size=2)
+        self._backend = RiakBackend(client=FakeRiakClient(server=self._server))
+
+        published = '2016-01-01T00:00:00Z'
+        for obj_id in ['actor', 'note']:
+            self._backend.create_obj({'id': obj_id, 'objectType': 'user', 'published': published})
+        for activity_id in ['1', '2']:
+            self._backend.create_activity({
+                'id': activity_id, 'verb': 'post', 'actor': 'actor', 'object': 'note', 'published': published})
+
+        self._sub_activity_ids = []
+        for i in range(3):
+            reply, _ = self._backend.create_sub_activity('1', 'actor', 'reply', sub_activity_verb='reply')
+            self._sub_activity_ids.append(reply['id'])
+        like, _ = self._backend.create_sub_activity('1', 'actor', '', sub_activity_verb='like')
+        self._sub_activity_ids.append(like['id'])
+        self._other_reply, _ = self._backend.create_sub_activity('2', 'actor', 'reply', sub_activity_verb='reply')
+        self._server.request_counts.clear()
+
+    def test_delete_activity_deletes_its_sub_activities(self):
+        self._backend.delete_activity('1', concurrency=2, batch_size=3)
+
+        eq_(sorted(['2', self._other_reply['id']]), self._server.keys('activities'))
+
+    def test_delete_activity_does_not_fetch_the_activity(self):
+        eq_(None, self._backend.delete_activity('1'))
+
+        eq_(0, self._server.request_counts['mapred'])
+        eq_(0, self._server.request_counts['get'])
+        eq_(1, self._server.request_counts['stream_index'])
+        eq_(len(self._sub_activity_ids) + 1, self._server.request_counts['delete'])
+
+    def test_delete_activity_counts_the_deleted_activity_on_request(self):
+        eq_(1, self._backend.delete_activity('1', count_deleted=True))
+        eq_(0, self._backend.delete_activity('1', count_deleted=True))
+
+        eq_(2, self._server.request_counts['get'])
+
+    def test_delete_activity_without_sub_activities_starts_no_threads(self):
+        with patch.object(self._backend, '_delete_keys') as delete_keys:
+            self._backend.delete_activity(self._other_reply['id'])
+            self._backend.delete_activity('missing')
+
+        ok_(not delete_keys.called)
+        eq_(sorted(['1', '2'] + self._sub_activity_ids), self._server.keys('activities'))
@@ -0,0 +1,194 @@
+from __future__ import absolute_import
+
+import threading
+import time
+
+from sunspear.backends.database.db import DatabaseBackend
+from sunspear.singleflight import SingleFlight, make_key
+
+from mock import patch
+from nose.tools import eq_, ok_, raises
+
+
+def wait_until(condition):
+    for _ in range(1000):
+        if condition():
+            return
+        time.sleep(0.001)
+    raise AssertionError('timed out')
+
+
+class BlockingFetch(object):
+    """
+    Reads ids as ``{'id': id}`` once ``release`` is set.
+    """
+    def __init__(self, error=None):
+        self.calls = []
+        self.results = []
+        self.release = threading.Event()
+        self._error = error
+
+    def __call__(self, ids):
+        self.calls.append(ids)
+        self.release.wait()
+        if self._error is not None:
+            raise self._error
+        results = [{'id': obj_id} for obj_id in ids if obj_id != 'missing']
+        self.results.extend(results)
+        return results
+
+
+class TestSingleFlight(object):
+    def setUp(self):
+        self._single_flight = SingleFlight()
+        self._fetch = BlockingFetch()
+        self._results = {}
+
+    def _start(self, name, ids, key='key'):
+        def fetch():
+            try:
+                self._results[name] = self._single_flight.fetch(key, ids, self._fetch)
+            except Exception as e:
+                self._results[name] = e
+        thread = threading.Thread(target=fetch)
+        thread.start()
+        return thread
+
+    def test_reads_in_flight_are_shared(self):
+        first = self._start('first', ['a', 'b'])
+        wait_until(lambda: len(self._fetch.calls) == 1)
+        second = self._start('second', ['b', 'c', 'missing'])
+        wait_until(lambda: len(self._fetch.calls) == 2)
+
+        self._fetch.release.set()
+        first.join()
+        second.join()
+
+        eq_([['a', 'b'], ['c', 'missing']], self._fetch.calls)
+        eq_([{'id': 'a'}, {'id': 'b'}], self._results['first'])
+        eq_([{'id': 'b'}, {'id': 'c'}], self._results['second'])
+        ok_(self._results['first'][1] is not self._results['second'][0])
+        eq_({'reads': 2, 'ids_read': 4, 'ids_shared': 1}, self._single_flight.stats())
+
+    def test_shared_results_are_copied_for_every_thread(self):
+        first = self._start('first', ['a'])
+        wait_until(lambda: len(self._fetch.calls) == 1)
+        second = self._start('second', ['a'])
+        wait_until(lambda: self._single_flight.ids_shared == 1)
+
+        self._fetch.release.set()
+        first.join()
+        second.join()
+
+        ok_(self._results['first'][0] is not self._fetch.results[0])
+        ok_(self._results['second'][0] is not self._fetch.results[0])
+
+    def test_results_read_by_one_thread_are_not_copied(self):
+        self._fetch.release.set()
+
+        ok_(self._single_flight.fetch('key', ['a'], self._fetch)[0] is self._fetch.results[0])
+
+    def test_reads_are_only_shared_under_the_same_key(self):
+        first = self._start('first', ['a'])
+        wait_until(lambda: len(self._fetch.calls) == 1)
+        second = self._start('second', ['a'], key='other')
+        wait_until(lambda: len(self._fetch.calls) == 2)
+
+        self._fetch.release.set()
+        first.join()
+        second.join()
+
+    def test_reads_within_the_window_are_merged(self):
+        joined = threading.Event()
+        self._single_flight = SingleFlight(window=1, sleep=lambda seconds: joined.wait())
+        self._fetch.release.set()
+
+        first = self._start('first', ['a'])
+        wait_until(lambda: self._single_flight._open)
+        second = self._start('second', ['b'])
+        wait_until(lambda: len(self._single_flight._open['key'].ids) == 2)
+        joined.set()
+        first.join()
+        second.join()
+
+        eq_([['a', 'b']], self._fetch.calls)
+        eq_([{'id': 'a'}], self._results['first'])
+        eq_([{'id': 'b'}], self._results['second'])
+
+    def test_errors_are_raised_in_every_thread(self):
+        self._fetch = BlockingFetch(error=ValueError('failed'))
+        first = self._start('first', ['a'])
+        wait_until(lambda: len(self._fetch.calls) == 1)
+        second = self._start('second', ['a'])
+        wait_until(lambda: self._single_flight.ids_shared == 1)
+
+        self._fetch.release.set()
+        first.join()
+        second.join()
+
+        ok_(isinstance(self._results['first'], ValueError))
+        ok_(isinstance(self._results['second'], ValueError))
+        eq_({}, self._single_flight._in_flight)
+
+    def test_reads_after_a_write_are_not_shared(self):
+        first = self._start('first', ['a'])
+        wait_until(lambda: len(self._fetch.calls) == 1)
+        self._single_flight.invalidate()
+        second = self._start('second', ['a'])
+        wait_until(lambda: len(self._fetch.calls) == 2)
+
+        self._fetch.release.set()
+        first.join()
+        second.join()
+
+    def test_make_key(self):
+        eq_(make_key('get_activity', {'a': [1], 'b': {'c': 2}}), make_key('get_activity', {'b': {'c': 2}, 'a': [1]}))
+        ok_(make_key('get_activity', {'a': [1]}) != make_key('get_activity', {'a': [2]}))
+        eq_(None, make_key('get_activity', {'a': bytearray()}))
+
+
+class TestBackendSingleFlight(object):
+    def setUp(self):
+        self._backend = DatabaseBackend(db_connection_string='sqlite://')
+        self._backend.create_tables()
+        self._single_flight = SingleFlight()
+        self._backend.set_single_flight(self._single_flight)
+
+        published = '2016-01-01T00:00:00Z'
+        for activity_id in ['1', '2']:
+            self._backend.create_activity({
+                'id': activity_id, 'verb': 'post', 'published': published,
+                'actor': {'objectType': 'user', 'id': 'user:1', 'published': published},
+                'object': {'objectType': 'note', 'id': 'note:' + activity_id, 'published': published},
+            })
+
+    def tearDown(self):
+        self._backend.drop_tables()
+        self._backend.engine.dispose()
+
+    def test_reads_go_through_the_single_flight(self):
+        with patch.object(self._single_flight, 'fetch', wraps=self._single_flight.fetch) as fetch:
+            activities = self._backend.get_activity(['2', '1', '2'], include_public=True)
+
+        eq_(['2', '1'], [activity['id'] for activity in activities])
+        eq_('user:1', activities[0]['actor']['id'])
+        eq_(2, fetch.call_count)
+
+    def test_reads_in_a_transaction_are_not_shared(self):
+        with patch.object(self._single_flight, 'fetch') as fetch:
+            with self._backend.transaction():
+                eq_(2, len(self._backend.get_activity(['1', '2'], include_public=True)))
+            ok_(not fetch.called)
+
+    def test_aggregated_reads_are_not_shared(self):
+        aggregator = type('Aggregator', (object, ), {'process': lambda self, activities, *args: activities})()
+        with patch.object(self._single_flight, 'fetch', wraps=self._single_flight.fetch) as fetch:
+            eq_(2, len(self._backend.get_activity(['1', '2'], include_public=True,
+                                                  aggregation_pipeline=[aggregator])))
+        # only the objects are
+        eq_(['get_obj'], [args[0][0] for args, kwargs in fetch.call_args_list])
+
+    @raises(ValueError)
+    def test_errors_are_raised(self):
+        with patch.object(self._backend, 'activity_get', side_effect=ValueError()):
+            self._backend.get_activity(['1'])
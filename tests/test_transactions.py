@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sunspear.backends.database.db import DatabaseBackend
+
+from nose.tools import eq_, ok_
+
+
+class TestTransaction(object):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._backend = DatabaseBackend(db_connection_string='sqlite:///' + os.path.join(self._tmp_dir, 'sunspear.db'))
+        self._backend.create_tables()
+
+        self._published = '2016-01-01T00:00:00Z'
+        self._backend.create_obj({'objectType': 'user', 'id': 'user:1', 'published': self._published})
+
+    def tearDown(self):
+        self._backend.engine.dispose()
+        shutil.rmtree(self._tmp_dir)
+
+    def _activity(self, activity_id, **extra):
+        activity = {
+            'id': activity_id, 'verb': 'post', 'actor': 'user:1', 'published': self._published,
+            'object': {'objectType': 'note', 'id': 'note:' + activity_id, 'published': self._published},
+        }
+        activity.update(extra)
+        return activity
+
+    def test_create_activity_uses_one_connection(self):
+        checkouts = []
+        event.listen(self._backend.engine, 'checkout', lambda *args: checkouts.append(args))
+
+        self._backend.create_activity(self._activity('1', to=['user:1']))
+
+        eq_(1, len(checkouts))
+        ok_(self._backend.audience_targeting_exists('to', '1', 'user:1'))
+
+    def test_create_activity_is_atomic(self):
+        try:
+            self._backend.create_activity(self._activity('1', to=['missing']))
+        except IntegrityError:
+            pass
+        else:
+            ok_(False, 'the audience targeting of a missing object was stored')
+
+        ok_(not self._backend.activity_exists('1'))
+        ok_(not self._backend.obj_exists('note:1'))
+
+    def test_calls_are_batched_in_a_transaction(self):
+        try:
+            with self._backend.transaction():
+                self._backend.create_activity(self._activity('1'))
+                self._backend.create_activity(self._activity('2'))
+                ok_(self._backend.activity_exists('2'))
+                raise ValueError()
+        except ValueError:
+            pass
+
+        ok_(not self._backend.activity_exists('1'))
+        ok_(not self._backend.activity_exists('2'))
+
+    def test_transaction_is_committed(self):
+        with self._backend.transaction():
+            self._backend.create_activity(self._activity('1'))
+            self._backend.create_sub_activity('1', 'user:1', 'a reply', sub_activity_verb='reply')
+
+        eq_(1, self._backend.get_activity('1')[0]['replies']['totalItems'])
+
+    def test_nested_transactions_share_the_connection(self):
+        with self._backend.transaction() as connection:
+            with self._backend.transaction() as nested_connection:
+                ok_(connection is nested_connection)
+
+    def test_nested_transaction_rolls_back_the_outer_one(self):
+        try:
+            with self._backend.transaction():
+                self._backend.create_obj({'objectType': 'user', 'id': 'user:2', 'published': self._published})
+                with self._backend.transaction():
+                    raise ValueError()
+        except ValueError:
+            pass
+
+        ok_(not self._backend.obj_exists('user:2'))
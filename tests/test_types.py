@@ -0,0 +1,80 @@
+from __future__ import absolute_import
+
+import base64
+import os
+
+from sunspear.backends.database import types
+from sunspear.backends.database.db import DatabaseBackend
+
+from nose.tools import eq_, ok_
+
+
+class TestCompression(object):
+    def setUp(self):
+        self._previous = types.set_compression(100)
+
+        self._backend = DatabaseBackend(db_connection_string='sqlite://')
+        self._backend.create_tables()
+        self._published = '2016-01-01T00:00:00Z'
+        self._backend.create_obj({'objectType': 'user', 'id': 'user:1', 'published': self._published})
+
+    def tearDown(self):
+        types.set_compression(self._previous)
+        self._backend.drop_tables()
+        self._backend.engine.dispose()
+
+    def _create_activity(self, activity_id, content):
+        self._backend.create_activity({
+            'id': activity_id, 'verb': 'post', 'actor': 'user:1', 'published': self._published,
+            'content': content, 'extension': {'text': content},
+            'object': {'objectType': 'note', 'id': 'note:' + activity_id, 'published': self._published},
+        })
+
+    def _get_stored_row(self, activity_id):
+        return self._backend.engine.execute(
+            'SELECT content, other_data FROM activities WHERE id = ?', activity_id).first()
+
+    def test_compress_text(self):
+        value = u'Lorem ipsum dolor sit amet \u0268 ' * 10
+
+        compressed = types.compress_text(value)
+
+        ok_(compressed.startswith(types.ZLIB_HEADER))
+        ok_(len(compressed) < len(value))
+        eq_(value, types.decompress_text(compressed))
+
+    def test_short_and_incompressible_values_are_not_compressed(self):
+        eq_(u'short', types.compress_text(u'short'))
+
+        value = base64.b64encode(os.urandom(300)).decode('ascii')
+        eq_(value, types.compress_text(value))
+
+    def test_values_starting_with_a_header_are_escaped(self):
+        value = types.ZLIB_HEADER + u'not compressed'
+
+        eq_(types.RAW_HEADER + value, types.compress_text(value))
+        eq_(value, types.decompress_text(types.compress_text(value)))
+
+    def test_compressed_columns(self):
+        content = u'Lorem ipsum dolor sit amet ' * 20
+        self._create_activity('1', content)
+
+        content_column, other_data_column = self._get_stored_row('1')
+        ok_(content_column.startswith(types.ZLIB_HEADER))
+        ok_(other_data_column.startswith(types.ZLIB_HEADER))
+
+        activity = self._backend.get_activity('1', include_public=True)[0]
+        eq_(content, activity['content'])
+        eq_({'text': content}, activity['extension'])
+
+    def test_uncompressed_rows_are_read_whatever_the_setting(self):
+        content = u'Lorem ipsum dolor sit amet ' * 20
+        types.set_compression(None)
+        self._create_activity('1', content)
+        types.set_compression(100)
+        self._create_activity('2', content)
+        types.set_compression(None)
+
+        eq_(content, self._get_stored_row('1')[0])
+        eq_([content, content], [activity['content'] for activity in
+                                 self._backend.get_activity(['1', '2'], include_public=True)])
@@ -0,0 +1,103 @@
+from __future__ import absolute_import
+
+import datetime
+
+from sqlalchemy.dialects import mysql, postgresql
+from sunspear.backends.database import schema
+from sunspear.backends.database.db import DatabaseBackend
+from sunspear.backends.database.upsert import Upsert, supports_upsert
+
+from mock import MagicMock, patch
+from nose.tools import eq_, ok_
+
+
+class TestUpsert(object):
+    def setUp(self):
+        self._backend = DatabaseBackend(db_connection_string='sqlite://')
+        self._backend.create_tables()
+
+        self._published = '2016-01-01T00:00:00Z'
+        self._now = datetime.datetime(2016, 1, 1)
+
+    def tearDown(self):
+        self._backend.drop_tables()
+        self._backend.engine.dispose()
+
+    def _get_object_types(self):
+        return dict(self._backend.engine.execute(
+            self._backend.objects_table.select().with_only_columns(
+                [schema.objects_table.c.id, schema.objects_table.c.object_type])).fetchall())
+
+    def test_upsert_inserts_and_updates(self):
+        self._backend.create_obj({'objectType': 'user', 'id': 'user:1', 'published': self._published})
+
+        self._backend.engine.execute(Upsert(self._backend.objects_table, [
+            {'id': 'user:1', 'object_type': 'admin', 'published': self._now},
+            {'id': 'user:2', 'object_type': 'user', 'published': self._now},
+        ]))
+
+        eq_({'user:1': 'admin', 'user:2': 'user'}, self._get_object_types())
+
+    def test_compiled_mysql_upsert(self):
+        statement = str(Upsert(schema.objects_table, [{'id': 'user:1', 'object_type': 'user'}]).compile(
+            dialect=mysql.dialect()))
+
+        ok_(statement.startswith('INSERT INTO objects (id, object_type) VALUES'))
+        ok_(statement.endswith('ON DUPLICATE KEY UPDATE object_type = VALUES(object_type)'))
+
+    def test_compiled_postgresql_upsert(self):
+        statement = str(Upsert(schema.objects_table, [{'id': 'user:1', 'object_type': 'user'}]).compile(
+            dialect=postgresql.dialect()))
+
+        ok_(statement.endswith('ON CONFLICT (id) DO UPDATE SET object_type = excluded.object_type'))
+
+        statement = str(Upsert(schema.objects_table, [{'id': 'user:1'}]).compile(dialect=postgresql.dialect()))
+        ok_(statement.endswith('ON CONFLICT (id) DO NOTHING'))
+
+    def test_supports_upsert(self):
+        ok_(supports_upsert(mysql.dialect()))
+        ok_(supports_upsert(postgresql.dialect()))
+
+        dialect = MagicMock()
+        dialect.name = 'sqlite'
+        dialect.dbapi.sqlite_version_info = (3, 23, 1)
+        ok_(not supports_upsert(dialect))
+
+    def test_create_activity_does_not_read_objects(self):
+        self._backend.create_obj({'objectType': 'user', 'id': 'user:1', 'published': self._published})
+
+        with self._backend.capture_queries() as capture:
+            self._backend.create_activity({
+                'id': '1', 'verb': 'post', 'published': self._published,
+                'actor': {'objectType': 'admin', 'id': 'user:1', 'published': self._published},
+                'object': {'objectType': 'note', 'id': 'note:1', 'content': 'a note', 'published': self._published},
+            })
+
+        # the activity is read back after it is stored
+        statements = [query.statement for query in capture.queries]
+        statements = statements[:[i for i, statement in enumerate(statements)
+                                  if statement.startswith('INSERT INTO activities')][0]]
+        eq_(['INSERT INTO objects'] * 2,
+            [statement[:len('INSERT INTO objects')] for statement in statements if 'objects' in statement])
+        eq_({'user:1': 'admin', 'note:1': 'note'}, self._get_object_types())
+
+    def test_create_activity_with_objects_of_different_fields(self):
+        self._backend.create_activity({
+            'id': '1', 'verb': 'post', 'published': self._published,
+            'actor': {'objectType': 'user', 'id': 'user:1', 'published': self._published},
+            'object': {'objectType': 'note', 'id': 'note:1', 'content': 'a note', 'published': self._published},
+            'target': {'objectType': 'group', 'id': 'group:1', 'published': self._published},
+        })
+
+        eq_('a note', self._backend.get_obj(['note:1'])[0]['content'])
+
+    def test_upsert_without_native_upsert(self):
+        self._backend.create_obj({'objectType': 'user', 'id': 'user:1', 'published': self._published})
+
+        with patch('sunspear.backends.database.db.supports_upsert', return_value=False):
+            self._backend._upsert(self._backend.objects_table, [
+                {'id': 'user:1', 'object_type': 'admin'},
+                {'id': 'user:2', 'object_type': 'user', 'content': 'a user', 'published': self._now},
+            ])
+
+        eq_({'user:1': 'admin', 'user:2': 'user'}, self._get_object_types())